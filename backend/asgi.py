@@ -2,6 +2,9 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Async views such as the streaming answer endpoint (/api/documents/answer/stream/)
+run natively here, e.g. ``uvicorn backend.asgi:application``, so long-lived
+streams don't hold a sync worker thread.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -14,3 +17,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# Build the shared text processor and its pooled API clients once per worker
+from documents.text_processing import warm_text_processor  # noqa: E402
+warm_text_processor()
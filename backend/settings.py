@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'documents',
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'documents.metrics.ServerTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -80,6 +82,27 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Vector index search parameters (session defaults, can be overridden per request)
+# hnsw.ef_search: size of the HNSW candidate list, higher = better recall, slower
+# ivfflat.probes: number of IVFFlat lists scanned, only used with an IVFFlat index
+VECTOR_SEARCH_EF_SEARCH = int(os.environ.get('VECTOR_SEARCH_EF_SEARCH', '40'))
+VECTOR_SEARCH_PROBES = int(os.environ.get('VECTOR_SEARCH_PROBES', '1'))
+
+# Storage of chunk embeddings: "vector" (float4), "halfvec" (float2) or "binary"
+# (float4 rescoring RESCORE_CANDIDATES candidates found with a binary quantized
+# HNSW index). halfvec/binary need pgvector >= 0.7; switch existing data with
+# python manage.py convert_embedding_storage <mode>
+EMBEDDING_STORAGE = os.environ.get('EMBEDDING_STORAGE', 'vector')
+EMBEDDING_RESCORE_CANDIDATES = int(os.environ.get('EMBEDDING_RESCORE_CANDIDATES', '200'))
+
+# Searches scoped to a set of documents. Scopes that are small, or too selective
+# for the ANN index to find enough matches among SCOPED_SEARCH_MAX_CANDIDATES
+# nearest neighbours (expecting OVERFETCH times the limit), are searched exactly
+# through the document index; broader scopes use the ANN index with over-fetch.
+SCOPED_SEARCH_EXACT_THRESHOLD = int(os.environ.get('SCOPED_SEARCH_EXACT_THRESHOLD', '20000'))
+SCOPED_SEARCH_MAX_CANDIDATES = int(os.environ.get('SCOPED_SEARCH_MAX_CANDIDATES', '1000'))  # hnsw.ef_search max
+SCOPED_SEARCH_OVERFETCH = int(os.environ.get('SCOPED_SEARCH_OVERFETCH', '2'))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -89,7 +112,11 @@ DATABASES = {
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': '5432',
         'OPTIONS': {
-            'options': '-c search_path=public'
+            'options': (
+                '-c search_path=public '
+                f'-c hnsw.ef_search={VECTOR_SEARCH_EF_SEARCH} '
+                f'-c ivfflat.probes={VECTOR_SEARCH_PROBES}'
+            )
         }
     }
 }
@@ -98,6 +125,141 @@ DATABASES = {
 # Configuration for text processing
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 
+# Embedding model and output dimensions used for chunks and queries. DIMENSIONS
+# shortens the vectors of models that support it (e.g. text-embedding-3-*);
+# empty means the model's native size. TextChunk.embedding holds vectors of
+# EMBEDDING_COLUMN_MODEL at its native size; any other model/dimensions pair
+# lives in ChunkEmbedding and is backfilled with "python manage.py reembed_chunks".
+EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'text-embedding-ada-002')
+EMBEDDING_DIMENSIONS = int(os.environ['EMBEDDING_DIMENSIONS']) if os.environ.get('EMBEDDING_DIMENSIONS') else None
+EMBEDDING_COLUMN_MODEL = os.environ.get('EMBEDDING_COLUMN_MODEL', 'text-embedding-ada-002')
+EMBEDDING_BACKFILL_BATCH_SIZE = int(os.environ.get('EMBEDDING_BACKFILL_BATCH_SIZE', '256'))
+
+# Embedding backend: 'openai', 'local' to run EMBEDDING_MODEL (a sentence-transformers
+# model such as BAAI/bge-small-en-v1.5, needs "pip install sentence-transformers") on
+# the CPU in batches of LOCAL_EMBEDDING_BATCH_SIZE across LOCAL_EMBEDDING_WORKERS
+# threads, or 'fake' for deterministic vectors returned after FAKE_EMBEDDING_LATENCY
+# seconds per call (benchmarks/tests)
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'openai')
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.environ.get('LOCAL_EMBEDDING_BATCH_SIZE', '32'))
+LOCAL_EMBEDDING_WORKERS = int(os.environ.get('LOCAL_EMBEDDING_WORKERS', '2'))
+FAKE_EMBEDDING_LATENCY = float(os.environ.get('FAKE_EMBEDDING_LATENCY', '0'))
+
+# Document embedding requests: texts are packed into requests of at most
+# EMBEDDING_BATCH_MAX_TOKENS tokens and EMBEDDING_BATCH_MAX_TEXTS texts, of which
+# EMBEDDING_BATCH_CONCURRENCY run at once. Rate limited (429), timed out and 5xx
+# requests are retried up to EMBEDDING_MAX_RETRIES times with full-jitter
+# exponential backoff from EMBEDDING_RETRY_BASE_DELAY up to EMBEDDING_RETRY_MAX_DELAY
+# seconds, honoring Retry-After
+EMBEDDING_BATCH_MAX_TOKENS = int(os.environ.get('EMBEDDING_BATCH_MAX_TOKENS', '50000'))
+EMBEDDING_BATCH_MAX_TEXTS = int(os.environ.get('EMBEDDING_BATCH_MAX_TEXTS', '256'))
+EMBEDDING_BATCH_CONCURRENCY = int(os.environ.get('EMBEDDING_BATCH_CONCURRENCY', '4'))
+EMBEDDING_MAX_RETRIES = int(os.environ.get('EMBEDDING_MAX_RETRIES', '6'))
+EMBEDDING_RETRY_BASE_DELAY = float(os.environ.get('EMBEDDING_RETRY_BASE_DELAY', '0.5'))
+EMBEDDING_RETRY_MAX_DELAY = float(os.environ.get('EMBEDDING_RETRY_MAX_DELAY', '30'))
+
+# Size and overlap of chunks in tokens of the embedding model's tokenizer
+CHUNK_SIZE_TOKENS = int(os.environ.get('CHUNK_SIZE_TOKENS', '250'))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get('CHUNK_OVERLAP_TOKENS', '50'))
+
+# Per-stage timings are always recorded and served on /metrics; this also sends
+# them to clients in a Server-Timing header (visible in browser dev tools)
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', 'false').lower() == 'true'
+
+# Hybrid search: candidates fetched from each of the vector and full-text
+# queries, and the k constant of reciprocal rank fusion
+HYBRID_SEARCH_CANDIDATES = int(os.environ.get('HYBRID_SEARCH_CANDIDATES', '50'))
+HYBRID_SEARCH_RRF_K = int(os.environ.get('HYBRID_SEARCH_RRF_K', '60'))
+
+# Batch search: most queries accepted per request; each one adds a query vector
+# to the single SQL statement
+BATCH_SEARCH_MAX_QUERIES = int(os.environ.get('BATCH_SEARCH_MAX_QUERIES', '500'))
+
+# Maximum concurrent calls per worker event loop from the async endpoints
+ASYNC_EMBEDDING_CONCURRENCY = int(os.environ.get('ASYNC_EMBEDDING_CONCURRENCY', '16'))
+ASYNC_DB_CONCURRENCY = int(os.environ.get('ASYNC_DB_CONCURRENCY', '10'))
+ASYNC_LLM_CONCURRENCY = int(os.environ.get('ASYNC_LLM_CONCURRENCY', '8'))
+
+# Chat model used for answers: 'openai', or 'fake' for a local model that emits a
+# canned answer with FAKE_LLM_TOKEN_DELAY seconds between tokens (benchmarks/tests)
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'openai')
+FAKE_LLM_TOKEN_DELAY = float(os.environ.get('FAKE_LLM_TOKEN_DELAY', '0.05'))
+
+# Base URL of an OpenAI compatible API, e.g. the local stub started with
+# "python manage.py run_stub_openai" for load tests (empty = api.openai.com)
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', '')
+
+# Pooled HTTP connections shared by the OpenAI clients of a worker process
+OPENAI_HTTP_MAX_CONNECTIONS = int(os.environ.get('OPENAI_HTTP_MAX_CONNECTIONS', '20'))
+OPENAI_HTTP_TIMEOUT = float(os.environ.get('OPENAI_HTTP_TIMEOUT', '60'))
+
+# PDF extraction: PDFs with at least PARALLEL_MIN_PAGES pages are split into
+# ranges of PAGES_PER_TASK pages and extracted on a pool of WORKERS processes
+PDF_EXTRACTION_WORKERS = int(os.environ.get('PDF_EXTRACTION_WORKERS', str(min(4, os.cpu_count() or 1))))
+PDF_EXTRACTION_PAGES_PER_TASK = int(os.environ.get('PDF_EXTRACTION_PAGES_PER_TASK', '16'))
+PDF_EXTRACTION_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_EXTRACTION_PARALLEL_MIN_PAGES', '32'))
+
+# Chunk storage: rows per multi-row INSERT, and the chunk count from which
+# documents are written with binary COPY instead (0 disables COPY)
+CHUNK_INSERT_BATCH_SIZE = int(os.environ.get('CHUNK_INSERT_BATCH_SIZE', '500'))
+CHUNK_COPY_THRESHOLD = int(os.environ.get('CHUNK_COPY_THRESHOLD', '2000'))
+
+# Persistent embedding cache keyed by (model, SHA-256 of chunk text); least
+# recently used entries are evicted beyond MAX_ENTRIES (0 = unbounded)
+EMBEDDING_CACHE_ENABLED = os.environ.get('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES', '200000'))
+
+# Query embedding cache: per-process LRU with a TTL in seconds, optionally backed
+# by a shared Django cache alias (e.g. a Redis cache) so workers share hits
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE', '1024'))
+QUERY_EMBEDDING_CACHE_TTL = int(os.environ.get('QUERY_EMBEDDING_CACHE_TTL', '3600'))
+QUERY_EMBEDDING_CACHE_ALIAS = os.environ.get('QUERY_EMBEDDING_CACHE_ALIAS', '')
+
+# Answer context: 'mmr' over-fetches CANDIDATES chunks, picks up to MAX_CHUNKS
+# diverse ones by maximal marginal relevance (LAMBDA weighs relevance against
+# redundancy, chunks at least DUPLICATE_SIMILARITY similar to a pick are
+# dropped), packs them into TOKENS prompt tokens and merges neighbouring chunks
+# without their overlap; 'top_k' sends the 3 most similar chunks as they are
+ANSWER_CONTEXT_STRATEGY = os.environ.get('ANSWER_CONTEXT_STRATEGY', 'mmr')
+ANSWER_CONTEXT_CANDIDATES = int(os.environ.get('ANSWER_CONTEXT_CANDIDATES', '20'))
+ANSWER_CONTEXT_MAX_CHUNKS = int(os.environ.get('ANSWER_CONTEXT_MAX_CHUNKS', '3'))
+ANSWER_CONTEXT_TOKENS = int(os.environ.get('ANSWER_CONTEXT_TOKENS', '750'))
+ANSWER_CONTEXT_MMR_LAMBDA = float(os.environ.get('ANSWER_CONTEXT_MMR_LAMBDA', '0.7'))
+ANSWER_CONTEXT_DUPLICATE_SIMILARITY = float(os.environ.get('ANSWER_CONTEXT_DUPLICATE_SIMILARITY', '0.98'))
+
+# Answer cache: LLM answers reused when a query retrieves the same chunks and
+# normalizes to the same text, or, with SIMILARITY > 0, has a query embedding
+# at least that cosine-similar. Entries expire after TTL seconds and the least
+# recently used are evicted beyond MAX_ENTRIES (0 = unbounded)
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+ANSWER_CACHE_TTL = int(os.environ.get('ANSWER_CACHE_TTL', '86400'))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', '10000'))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get('ANSWER_CACHE_SIMILARITY', '0.95'))
+
+# Background ingestion worker (python manage.py run_ingestion_worker)
+INGESTION_WORKER_PROCESSES = int(os.environ.get('INGESTION_WORKER_PROCESSES', '2'))
+# Jobs of bulk uploads run by one worker process at a time, their new chunks embedded together
+INGESTION_WORKER_BULK_BATCH = int(os.environ.get('INGESTION_WORKER_BULK_BATCH', '32'))
+# Port of the worker's /metrics endpoint with the ingestion stage timings (0 = off)
+INGESTION_WORKER_METRICS_PORT = int(os.environ.get('INGESTION_WORKER_METRICS_PORT', '9100'))
+# Seconds without a heartbeat before a running job is considered crashed and requeued
+INGESTION_JOB_TIMEOUT = int(os.environ.get('INGESTION_JOB_TIMEOUT', '600'))
+INGESTION_MAX_ATTEMPTS = int(os.environ.get('INGESTION_MAX_ATTEMPTS', '3'))
+
+# Bulk ingestion (POST /api/documents/bulk/, python manage.py bulk_ingest): whole
+# documents are extracted on BULK_INGEST_PROCESSES processes and the new chunks
+# of finished ones are embedded together once BULK_INGEST_FLUSH_CHUNKS are
+# pending, filling embedding requests across documents
+BULK_INGEST_PROCESSES = int(os.environ.get('BULK_INGEST_PROCESSES', str(min(4, os.cpu_count() or 1))))
+BULK_INGEST_FLUSH_CHUNKS = int(os.environ.get('BULK_INGEST_FLUSH_CHUNKS', '1024'))
+# Files per bulk upload request, counting the members of archives
+BULK_UPLOAD_MAX_FILES = int(os.environ.get('BULK_UPLOAD_MAX_FILES', '1000'))
+
+# Document purges delete chunks with SQL DELETEs of at most PURGE_BATCH_SIZE rows,
+# working through PURGE_DOCUMENT_BATCH_SIZE documents at a time
+PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', '5000'))
+PURGE_DOCUMENT_BATCH_SIZE = int(os.environ.get('PURGE_DOCUMENT_BATCH_SIZE', '100'))
+
 # Database connection parameters for PGVector
 DB_DRIVER = 'psycopg2'
 DB_HOST = os.environ.get('DB_HOST', 'localhost')
@@ -153,3 +315,12 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Uploads are hashed while they stream in (documents.uploads). Files over
+# FILE_UPLOAD_MAX_MEMORY_SIZE bytes are spooled to disk chunk by chunk and
+# moved into MEDIA_ROOT, never held in memory
+FILE_UPLOAD_HANDLERS = [
+    'documents.uploads.HashingMemoryFileUploadHandler',
+    'documents.uploads.HashingTemporaryFileUploadHandler',
+]
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.environ.get('FILE_UPLOAD_MAX_MEMORY_SIZE', str(2621440)))
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Build the shared text processor and its pooled API clients once per worker
+from documents.text_processing import warm_text_processor  # noqa: E402
+warm_text_processor()
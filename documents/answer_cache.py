@@ -0,0 +1,166 @@
+"""
+Cache of LLM answers. An answer is reused when a query retrieves exactly the
+same chunks as an earlier one and either normalizes to the same text or, with
+ANSWER_CACHE_SIMILARITY set, has a query embedding at least that similar.
+
+Entries list the documents their chunks came from and are deleted whenever one
+of those documents or its chunks change (see invalidate_documents), besides
+expiring after ANSWER_CACHE_TTL seconds and being evicted least recently used
+beyond ANSWER_CACHE_MAX_ENTRIES.
+"""
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from datetime import timedelta
+from pgvector.django import CosineDistance
+import hashlib
+import logging
+import numpy as np
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from . import metrics
+from .models import AnswerCacheEntry
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+
+# Process-wide lookup counters, shared by every AnswerCache instance
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "similar_hits": 0, "misses": 0, "saved_seconds": 0.0}
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return _WHITESPACE.sub(' ', query.lower()).strip().rstrip('?!. ')
+
+
+def answer_cache_stats() -> Dict[str, float]:
+    """Return the answer cache hit/miss counters and LLM seconds saved by this process"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _count(key: str, saved_seconds: float = 0.0):
+    with _stats_lock:
+        _stats[key] += 1
+        _stats["saved_seconds"] += saved_seconds
+
+
+def _export_stats():
+    stats = answer_cache_stats()
+    return [
+        ("answer_cache_lookups_total", "Answer cache lookups", {"result": "hit"}, stats["hits"]),
+        ("answer_cache_lookups_total", "Answer cache lookups", {"result": "similar_hit"}, stats["similar_hits"]),
+        ("answer_cache_lookups_total", "Answer cache lookups", {"result": "miss"}, stats["misses"]),
+        ("answer_cache_saved_seconds_total", "LLM generation time saved by answer cache hits", {},
+         stats["saved_seconds"]),
+    ]
+
+
+metrics.register_collector(_export_stats)
+
+
+def invalidate_documents(document_ids: Iterable[int]) -> int:
+    """Delete the cached answers generated from chunks of any of these documents"""
+    document_ids = list(document_ids)
+    if not document_ids:
+        return 0
+    deleted, _ = AnswerCacheEntry.objects.filter(document_ids__overlap=document_ids).delete()
+    if deleted:
+        logger.info(f"Invalidated {deleted} cached answers of documents {document_ids}")
+    return deleted
+
+
+class AnswerCache:
+    """
+    Answers keyed by namespace (LLM and embedding space), the sorted ids of
+    the retrieved chunks and the normalized query.
+    """
+
+    def __init__(self, namespace: str, ttl: Optional[int] = None,
+                 max_entries: Optional[int] = None, similarity: Optional[float] = None):
+        self.namespace = namespace
+        self.ttl = settings.ANSWER_CACHE_TTL if ttl is None else ttl
+        self.max_entries = settings.ANSWER_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.similarity = settings.ANSWER_CACHE_SIMILARITY if similarity is None else similarity
+
+    def keys(self, query: str, chunks: List[Dict[str, Any]]) -> Tuple[str, str]:
+        """(key, chunk_key) of a query and the chunks retrieved for it"""
+        chunk_ids = ",".join(str(chunk_id) for chunk_id in sorted(chunk["chunk_id"] for chunk in chunks))
+        chunk_key = hashlib.sha256(f"{self.namespace}\0{chunk_ids}".encode('utf-8')).hexdigest()
+        key = hashlib.sha256(f"{chunk_key}\0{normalize_query(query)}".encode('utf-8')).hexdigest()
+        return key, chunk_key
+
+    def _live(self):
+        entries = AnswerCacheEntry.objects.all()
+        if self.ttl:
+            entries = entries.filter(created_at__gte=timezone.now() - timedelta(seconds=self.ttl))
+        return entries
+
+    def get(self, query: str, query_embedding: Sequence[float],
+            chunks: List[Dict[str, Any]]) -> Optional[str]:
+        """The cached answer for query over chunks, or None"""
+        key, chunk_key = self.keys(query, chunks)
+        with metrics.span('answer.cache_lookup'):
+            entry = self._live().filter(key=key).values('id', 'answer', 'generation_seconds').first()
+            result = "hits"
+            if entry is None and self.similarity:
+                entry = (
+                    self._live().filter(chunk_key=chunk_key)
+                    .annotate(distance=CosineDistance('query_embedding', np.asarray(query_embedding)))
+                    .filter(distance__lte=1 - self.similarity)
+                    .order_by('distance')
+                    .values('id', 'answer', 'generation_seconds')
+                    .first()
+                )
+                result = "similar_hits"
+
+        if entry is None:
+            _count("misses")
+            return None
+        AnswerCacheEntry.objects.filter(id=entry['id']).update(
+            hits=F('hits') + 1, last_used_at=timezone.now()
+        )
+        _count(result, entry['generation_seconds'])
+        return entry['answer']
+
+    def set(self, query: str, query_embedding: Sequence[float], chunks: List[Dict[str, Any]],
+            answer: str, generation_seconds: float = 0.0):
+        """Store the answer generated for query over chunks, then evict expired and excess entries"""
+        key, chunk_key = self.keys(query, chunks)
+        AnswerCacheEntry.objects.bulk_create(
+            [
+                AnswerCacheEntry(
+                    key=key,
+                    chunk_key=chunk_key,
+                    query=normalize_query(query),
+                    query_embedding=np.asarray(query_embedding, dtype=np.float32),
+                    document_ids=sorted({chunk["document_id"] for chunk in chunks}),
+                    answer=answer,
+                    generation_seconds=generation_seconds,
+                )
+            ],
+            # Another worker may have answered the same query in the meantime
+            ignore_conflicts=True,
+        )
+        self.evict()
+
+    def evict(self) -> int:
+        """Delete expired entries and the least recently used ones beyond max_entries"""
+        deleted = 0
+        if self.ttl:
+            deleted += AnswerCacheEntry.objects.filter(
+                created_at__lt=timezone.now() - timedelta(seconds=self.ttl)
+            ).delete()[0]
+        if self.max_entries:
+            excess = AnswerCacheEntry.objects.count() - self.max_entries
+            if excess > 0:
+                stale_ids = list(
+                    AnswerCacheEntry.objects.order_by('last_used_at', 'id').values_list('id', flat=True)[:excess]
+                )
+                deleted += AnswerCacheEntry.objects.filter(id__in=stale_ids).delete()[0]
+        if deleted:
+            logger.info(f"Evicted {deleted} cached answers")
+        return deleted
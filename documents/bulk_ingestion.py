@@ -0,0 +1,376 @@
+"""
+Bulk ingestion of many PDFs, uploaded one by one or in zip/tar archives.
+
+Documents and their jobs are created with bulk inserts. Extraction, cleaning
+and chunking of whole documents fan out across a process pool, and the new
+chunks of finished documents are pooled until BULK_INGEST_FLUSH_CHUNKS are
+pending, so embedding requests are filled across documents instead of each
+document sending a few small ones. A document that fails is reported in its
+FileResult and never stops the others. Jobs queued by a bulk upload are
+flagged bulk, and the ingestion worker runs them here in batches too.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+import logging
+import multiprocessing
+import os
+import tarfile
+import time
+import zipfile
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from . import metrics, workers
+from .embedding_batching import PartialEmbeddingError
+from .embedding_cache import text_hash
+from .extraction import clean_text, iter_pdf_pages
+from .ingestion import Heartbeat, complete_job, fail_job, sync_document_chunks
+from .models import Document, IngestionJob, TextChunk
+from .purge import delete_file
+from .uploads import save_upload
+
+logger = logging.getLogger(__name__)
+
+ZIP_SUFFIXES = ('.zip',)
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# FileResult statuses of files that get no ingestion job
+STATUS_SKIPPED = 'skipped'
+STATUS_DUPLICATE = 'duplicate'
+
+
+@dataclass
+class FileResult:
+    """Outcome of one uploaded file, or one member of an uploaded archive"""
+    file: str
+    status: str
+    document_id: Optional[int] = None
+    job_id: Optional[int] = None
+    pages: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+    error: str = ''
+
+
+@dataclass
+class _Extracted:
+    job: IngestionJob
+    pages: int
+    text: str
+    chunks: List[str]
+    seconds: float
+
+
+def is_archive(name: str) -> bool:
+    return name.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES)
+
+
+def iter_upload_files(name: str, fileobj: BinaryIO) -> Iterator[Tuple[str, BinaryIO]]:
+    """
+    Yield (name, file object) for an uploaded file, or for every regular file
+    of a zip or tar archive. Members are streamed, never read into memory whole.
+    """
+    lower = name.lower()
+    if lower.endswith(ZIP_SUFFIXES):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_wanted(info.filename):
+                    with archive.open(info) as member:
+                        yield os.path.basename(info.filename), member
+    elif lower.endswith(TAR_SUFFIXES):
+        with tarfile.open(fileobj=fileobj, mode='r:*') as archive:
+            for info in archive:
+                if info.isfile() and _is_wanted(info.name):
+                    member = archive.extractfile(info)
+                    with member:
+                        yield os.path.basename(info.name), member
+    else:
+        yield os.path.basename(name), fileobj
+
+
+def _is_wanted(path: str) -> bool:
+    # Skip macOS resource forks and hidden files that archivers add
+    parts = path.replace('\\', '/').split('/')
+    return '__MACOSX' not in parts and not parts[-1].startswith('.')
+
+
+def create_documents(uploads: Iterable[Tuple[str, BinaryIO]], metadata: Optional[Dict[str, Any]] = None,
+                     claim: bool = False,
+                     max_files: Optional[int] = None) -> Tuple[List[FileResult], List[IngestionJob]]:
+    """
+    Save every PDF of uploads (expanding archives) and create their documents
+    and ingestion jobs with one bulk insert each. Jobs are queued for the
+    ingestion workers, or created running when claim is set, for a caller
+    that ingests them itself. Returns (a result per file, the jobs).
+
+    Files with the bytes of an existing document, or of an earlier file of the
+    same call, are not kept: their result is a duplicate of that document.
+    Raises ValueError, keeping nothing, when there are more than max_files PDFs,
+    duplicates included.
+    """
+    # content hash -> (new document, results of the files with these bytes)
+    pending: Dict[str, Tuple[Document, List[FileResult]]] = {}
+    results, upload_count, file_count = [], 0, 0
+    with metrics.span('upload.save'):
+        for upload_name, upload in uploads:
+            upload_count += 1
+            try:
+                for name, content in iter_upload_files(upload_name, upload):
+                    if not name.lower().endswith('.pdf'):
+                        results.append(FileResult(file=name, status=STATUS_SKIPPED, error="Not a PDF file"))
+                        continue
+                    file_count += 1
+                    if max_files is not None and file_count > max_files:
+                        for document, _ in pending.values():
+                            delete_file(document.file.name)
+                        raise ValueError(f"At most {max_files} files per bulk upload")
+                    stored, content_hash = save_upload(content, name)
+                    result = FileResult(file=name, status=IngestionJob.STATUS_QUEUED)
+                    results.append(result)
+                    if content_hash in pending:
+                        delete_file(stored)
+                        result.status = STATUS_DUPLICATE
+                        pending[content_hash][1].append(result)
+                    else:
+                        document = Document(file=stored, metadata=metadata or {}, content_hash=content_hash)
+                        pending[content_hash] = (document, [result])
+            except (zipfile.BadZipFile, tarfile.TarError) as e:
+                results.append(FileResult(file=upload_name, status=IngestionJob.STATUS_FAILED,
+                                          error=f"Unreadable archive: {str(e)}"))
+
+    with metrics.span('upload.enqueue'):
+        _drop_existing(pending)
+        try:
+            jobs = _insert_documents(pending, claim)
+        except IntegrityError:
+            # A concurrent upload stored some of the same bytes in the meantime
+            _drop_existing(pending)
+            jobs = _insert_documents(pending, claim)
+
+    for (document, group), job in zip(pending.values(), jobs):
+        for result in group:
+            result.document_id = document.id
+        group[0].job_id = job.id
+        if claim:
+            group[0].status = IngestionJob.STATUS_RUNNING
+    duplicates = sum(result.status == STATUS_DUPLICATE for result in results)
+    logger.info(f"Created {len(jobs)} documents from {upload_count} uploads, {duplicates} duplicate files")
+    return results, jobs
+
+
+def _drop_existing(pending: Dict[str, Tuple[Document, List[FileResult]]]):
+    """Turn pending documents whose bytes are already stored into duplicates of the stored document"""
+    existing = Document.objects.filter(content_hash__in=list(pending)).values_list('content_hash', 'id')
+    for content_hash, document_id in existing:
+        document, group = pending.pop(content_hash)
+        delete_file(document.file.name)
+        for result in group:
+            result.status, result.document_id = STATUS_DUPLICATE, document_id
+        metrics.increment('upload_duplicates_total', len(group), help="Uploads answered with an existing document")
+
+
+def _insert_documents(pending: Dict[str, Tuple[Document, List[FileResult]]], claim: bool) -> List[IngestionJob]:
+    with transaction.atomic():
+        documents = Document.objects.bulk_create([document for document, _ in pending.values()])
+        now = timezone.now()
+        return IngestionJob.objects.bulk_create([
+            IngestionJob(document=document, bulk=True, status=IngestionJob.STATUS_RUNNING,
+                         stage=IngestionJob.STAGE_EXTRACTING, attempts=1, started_at=now)
+            if claim else IngestionJob(document=document, bulk=True)
+            for document in documents
+        ])
+
+
+def extract_document(path: str, text_processor=None) -> Tuple[int, List[str], List[str], Dict[str, float]]:
+    """
+    Extract, clean and chunk a whole PDF. Returns (page count, cleaned pages,
+    chunks, seconds per stage). Runs in the bulk ingestion pool, so pages are
+    extracted serially there: the pool already keeps every core busy.
+    """
+    if text_processor is None:
+        from .text_processing import get_text_processor
+        text_processor = get_text_processor()
+
+    extract_timer = metrics.StageTimer('ingest.extract')
+    clean_timer = metrics.StageTimer('ingest.clean')
+    cleaned_pages, page_count = [], 0
+
+    def iter_cleaned_pages():
+        nonlocal page_count
+        for _, text in extract_timer.iterate(iter_pdf_pages(path, workers=1)):
+            page_count += 1
+            with clean_timer.measure():
+                text = clean_text(text)
+            if text:
+                cleaned_pages.append(text)
+                yield text
+
+    started = time.perf_counter()
+    chunks = list(text_processor.iter_text_chunks(iter_cleaned_pages()))
+    timings = {
+        'ingest.extract': extract_timer.total,
+        'ingest.clean': clean_timer.total,
+        'ingest.chunk': time.perf_counter() - started - extract_timer.total - clean_timer.total,
+    }
+    return page_count, cleaned_pages, chunks, timings
+
+
+def run_bulk_ingestion(jobs: List[IngestionJob], text_processor=None, processes: Optional[int] = None,
+                       on_result: Optional[Callable[[FileResult], None]] = None) -> List[FileResult]:
+    """
+    Ingest running jobs: extract on up to processes processes (inline when
+    processes is 1), embed the new chunks of several documents together and
+    store each document's chunks. Calls on_result as each file finishes and
+    returns the results in completion order.
+    """
+    if text_processor is None:
+        from .text_processing import get_text_processor
+        text_processor = get_text_processor()
+    processes = processes or settings.BULK_INGEST_PROCESSES
+    with Heartbeat(job.id for job in jobs) as heartbeat:
+        return _run_jobs(jobs, text_processor, processes, heartbeat, on_result)
+
+
+def _run_jobs(jobs: List[IngestionJob], text_processor, processes: int, heartbeat: Heartbeat,
+              on_result: Optional[Callable[[FileResult], None]]) -> List[FileResult]:
+    results: List[FileResult] = []
+    pending: List[_Extracted] = []
+
+    def report(result: FileResult):
+        heartbeat.discard(result.job_id)
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+
+    for job, outcome, seconds in _iter_extractions(jobs, text_processor, processes):
+        if isinstance(outcome, Exception):
+            fail_job(job, outcome)
+            report(_result(job, seconds=seconds, error=str(outcome)))
+            continue
+        page_count, cleaned_pages, chunks, timings = outcome
+        for stage, stage_seconds in timings.items():
+            metrics.record(stage, stage_seconds)
+        job.pages_total = job.pages_done = page_count
+        job.chunks_total = len(chunks)
+        pending.append(_Extracted(job, page_count, "\n\n".join(cleaned_pages), chunks, seconds))
+        if sum(len(extracted.chunks) for extracted in pending) >= settings.BULK_INGEST_FLUSH_CHUNKS:
+            for result in _flush(pending, text_processor):
+                report(result)
+            pending = []
+
+    for result in _flush(pending, text_processor):
+        report(result)
+    return results
+
+
+def _iter_extractions(jobs: List[IngestionJob], text_processor,
+                      processes: int) -> Iterator[Tuple[IngestionJob, Any, float]]:
+    """Yield (job, extract_document() result or the exception it raised, seconds) as documents finish"""
+    if processes <= 1:
+        for job in jobs:
+            started = time.perf_counter()
+            try:
+                outcome = extract_document(job.document.file.path, text_processor)
+            except Exception as e:
+                outcome = e
+            yield job, outcome, time.perf_counter() - started
+        return
+
+    queue = iter(jobs)
+    in_flight = {}
+    # spawn: workers never inherit the parent's database connections
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=workers.init_django) as pool:
+        def submit():
+            job = next(queue, None)
+            if job is not None:
+                future = pool.submit(workers.extract_document, job.document.file.path)
+                in_flight[future] = (job, time.perf_counter())
+
+        # Two documents per process queued at most, so extracted text never piles up
+        for _ in range(processes * 2):
+            submit()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, started = in_flight.pop(future)
+                submit()
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    outcome = e
+                yield job, outcome, time.perf_counter() - started
+
+
+def _flush(pending: List[_Extracted], text_processor) -> List[FileResult]:
+    """Embed the new chunks of pending documents in one batch, then store each document"""
+    if not pending:
+        return []
+    results = []
+    # Chunks already stored for their document (re-ingestion) are reused, not embedded
+    stored = set(
+        TextChunk.objects.filter(document_id__in=[extracted.job.document_id for extracted in pending])
+        .values_list('document_id', 'content_hash')
+    )
+    texts = {}
+    for extracted in pending:
+        for chunk in extracted.chunks:
+            chunk_hash = text_hash(chunk)
+            if (extracted.job.document_id, chunk_hash) not in stored:
+                texts.setdefault(chunk_hash, chunk)
+
+    started = time.perf_counter()
+    try:
+        with metrics.span('ingest.embed'):
+            embeddings = text_processor.generate_embeddings_batch(list(texts.values()))
+    except PartialEmbeddingError as e:
+        # Keep what was embedded; sync_document_chunks retries the rest per document
+        logger.warning(f"Bulk embedding partially failed: {str(e)}")
+        embeddings = e.embeddings
+    except Exception as e:
+        for extracted in pending:
+            fail_job(extracted.job, e)
+            results.append(_result(extracted.job, extracted, error=str(e)))
+        return results
+    precomputed = {
+        chunk_hash: embedding for chunk_hash, embedding in zip(texts, embeddings) if embedding is not None
+    }
+    embed_seconds = (time.perf_counter() - started) / len(pending)
+
+    documents = []
+    for extracted in pending:
+        extracted.job.document.extracted_text = extracted.text
+        documents.append(extracted.job.document)
+    Document.objects.bulk_update(documents, ['extracted_text'])
+
+    for extracted in pending:
+        job = extracted.job
+        job.stage = IngestionJob.STAGE_EMBEDDING
+        started = time.perf_counter()
+        try:
+            if not extracted.chunks:
+                raise ValueError("No text chunks could be created from the document")
+            result = sync_document_chunks(job.document, extracted.chunks, text_processor, precomputed=precomputed)
+            complete_job(job, len(extracted.chunks), result)
+            error = ''
+        except Exception as e:
+            fail_job(job, e)
+            error = str(e)
+        extracted.seconds += embed_seconds + time.perf_counter() - started
+        results.append(_result(job, extracted, error=error))
+    return results
+
+
+def _result(job: IngestionJob, extracted: Optional[_Extracted] = None,
+            seconds: float = 0.0, error: str = '') -> FileResult:
+    return FileResult(
+        file=os.path.basename(job.document.file.name),
+        status=job.status,
+        document_id=job.document_id,
+        job_id=job.id,
+        pages=extracted.pages if extracted else 0,
+        chunks=len(extracted.chunks) if extracted else 0,
+        seconds=extracted.seconds if extracted else seconds,
+        error=error,
+    )
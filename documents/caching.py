@@ -0,0 +1,110 @@
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional
+
+
+class LRUTTLCache:
+    """
+    Thread-safe in-process cache with least-recently-used eviction and a
+    time-to-live per entry.
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class QueryEmbeddingCache:
+    """
+    Cache of query embeddings: an in-process LRU+TTL layer in front of an
+    optional shared Django cache backend (e.g. Redis), so workers share hits.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, shared_alias: Optional[str] = None):
+        self.local = LRUTTLCache(max_entries, ttl)
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+
+    @property
+    def shared(self):
+        if not self.shared_alias:
+            return None
+        from django.core.cache import caches
+        return caches[self.shared_alias]
+
+    @staticmethod
+    def make_key(model_name: str, query: str) -> str:
+        digest = hashlib.sha256(query.encode('utf-8')).hexdigest()
+        return f"query-embedding:{model_name}:{digest}"
+
+    def get(self, model_name: str, query: str) -> Optional[List[float]]:
+        key = self.make_key(model_name, query)
+        embedding = self.local.get(key)
+        if embedding is None and self.shared is not None:
+            embedding = self.shared.get(key)
+            if embedding is not None:
+                self.local.set(key, embedding)
+        return embedding
+
+    def set(self, model_name: str, query: str, embedding: List[float]):
+        key = self.make_key(model_name, query)
+        self.local.set(key, embedding)
+        if self.shared is not None:
+            self.shared.set(key, embedding, timeout=self.ttl)
+
+    async def aget(self, model_name: str, query: str) -> Optional[List[float]]:
+        key = self.make_key(model_name, query)
+        embedding = self.local.get(key)
+        if embedding is None and self.shared is not None:
+            embedding = await self.shared.aget(key)
+            if embedding is not None:
+                self.local.set(key, embedding)
+        return embedding
+
+    async def aset(self, model_name: str, query: str, embedding: List[float]):
+        key = self.make_key(model_name, query)
+        self.local.set(key, embedding)
+        if self.shared is not None:
+            await self.shared.aset(key, embedding, timeout=self.ttl)
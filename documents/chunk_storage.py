@@ -0,0 +1,130 @@
+from django.conf import settings
+from django.db import connection
+import numpy as np
+import struct
+import tempfile
+import logging
+from typing import Iterable, List, Sequence, Tuple
+from .embedding_cache import text_hash
+from .embedding_spaces import embedding_space
+from .vector_storage import storage_mode
+from .models import TextChunk, ChunkEmbedding, Document
+
+logger = logging.getLogger(__name__)
+
+# (chunk_index, text, embedding)
+ChunkRow = Tuple[int, str, Sequence[float]]
+
+# PostgreSQL binary COPY framing, see https://www.postgresql.org/docs/current/sql-copy.html
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+COPY_HEADER = COPY_SIGNATURE + struct.pack('!ii', 0, 0)
+COPY_TRAILER = struct.pack('!h', -1)
+
+
+def insert_chunks(document: Document, rows: List[ChunkRow]) -> List[int]:
+    """
+    Insert chunks with binary COPY for very large batches and batched
+    multi-row INSERTs otherwise. Returns the new ids ordered like rows.
+    Embeddings of a space other than TextChunk.embedding's go to ChunkEmbedding.
+    """
+    space = embedding_space()
+    if not space.in_column:
+        chunk_ids = bulk_insert_chunks(document, [(chunk_index, text, None) for chunk_index, text, _ in rows])
+        insert_chunk_embeddings(space.key, zip(chunk_ids, (embedding for _, _, embedding in rows)))
+        return chunk_ids
+    copy_threshold = settings.CHUNK_COPY_THRESHOLD
+    if copy_threshold and len(rows) >= copy_threshold:
+        return copy_insert_chunks(document, rows)
+    return bulk_insert_chunks(document, rows)
+
+
+def bulk_insert_chunks(document: Document, rows: List[ChunkRow], batch_size: int = None) -> List[int]:
+    """Insert chunks with multi-row INSERTs of batch_size rows each. Returns the new ids."""
+    batch_size = batch_size or settings.CHUNK_INSERT_BATCH_SIZE
+    chunks = TextChunk.objects.bulk_create(
+        [
+            TextChunk(
+                document=document,
+                chunk_index=chunk_index,
+                text=text,
+                content_hash=text_hash(text),
+                embedding=None if embedding is None else np.asarray(embedding, dtype=np.float32),
+            )
+            for chunk_index, text, embedding in rows
+        ],
+        batch_size=batch_size,
+    )
+    return [chunk.id for chunk in chunks]
+
+
+def insert_chunk_embeddings(space_key: str, pairs: Iterable[Tuple[int, Sequence[float]]],
+                            batch_size: int = None) -> int:
+    """Store (chunk_id, embedding) pairs of an embedding space, skipping chunks that already have one"""
+    batch_size = batch_size or settings.CHUNK_INSERT_BATCH_SIZE
+    created = ChunkEmbedding.objects.bulk_create(
+        [
+            ChunkEmbedding(chunk_id=chunk_id, space=space_key, embedding=np.asarray(embedding, dtype=np.float32))
+            for chunk_id, embedding in pairs
+        ],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    return len(created)
+
+
+def copy_insert_chunks(document: Document, rows: List[ChunkRow]) -> List[int]:
+    """
+    Stream chunks into the table with binary COPY, which skips SQL parsing and
+    the text encoding of the vectors. Returns the new ids ordered by chunk_index.
+    """
+    if not rows:
+        return []
+
+    table = TextChunk._meta.db_table
+    columns = ", ".join(
+        TextChunk._meta.get_field(name).column
+        for name in ("document", "chunk_index", "text", "content_hash", "embedding")
+    )
+
+    # Binary COPY must match the column type exactly
+    half = storage_mode() == 'halfvec'
+
+    # Spool to disk beyond 64 MB so very large documents don't sit in memory twice
+    with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as buffer:
+        buffer.write(COPY_HEADER)
+        for chunk_index, text, embedding in rows:
+            buffer.write(encode_copy_row(document.id, chunk_index, text, embedding, half=half))
+        buffer.write(COPY_TRAILER)
+        buffer.seek(0)
+
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT BINARY)", buffer)
+
+    chunk_indexes = [chunk_index for chunk_index, _, _ in rows]
+    return list(
+        TextChunk.objects.filter(document=document, chunk_index__in=chunk_indexes)
+        .order_by('chunk_index')
+        .values_list('id', flat=True)
+    )
+
+
+def encode_copy_row(document_id: int, chunk_index: int, text: str, embedding: Sequence[float],
+                    half: bool = False) -> bytes:
+    """
+    Encode one (document_id, chunk_index, text, content_hash, embedding) row in
+    binary COPY format. half encodes the embedding as a halfvec instead of a vector.
+    """
+    text_bytes = text.encode('utf-8')
+    hash_bytes = text_hash(text).encode('ascii')
+    vector = np.asarray(embedding, dtype='>f2' if half else '>f4')
+    # pgvector binary format: int16 dimensions, int16 unused, big-endian float4
+    # values (float2 for halfvec)
+    vector_bytes = struct.pack('!HH', vector.shape[0], 0) + vector.tobytes()
+    return b''.join([
+        struct.pack('!h', 5),
+        struct.pack('!iq', 8, document_id),
+        struct.pack('!ii', 4, chunk_index),
+        struct.pack('!i', len(text_bytes)), text_bytes,
+        struct.pack('!i', len(hash_bytes)), hash_bytes,
+        struct.pack('!i', len(vector_bytes)), vector_bytes,
+    ])
@@ -0,0 +1,127 @@
+"""
+Context assembly for answer prompts. Over-fetched candidate chunks are
+diversified with maximal marginal relevance (MMR) over their embeddings,
+near-duplicates (e.g. from re-uploaded documents) are dropped, the picks are
+packed into a token budget, and adjacent chunks of a document are merged into
+one passage with the splitter's overlap removed.
+"""
+from django.conf import settings
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .embedding_batching import count_tokens
+
+# Shortest repeated prefix accepted as chunk overlap, in characters
+MIN_OVERLAP = 16
+
+
+def mmr_select(query_embedding: Sequence[float], candidate_embeddings: Sequence[Sequence[float]], k: int,
+               lambda_mult: Optional[float] = None, duplicate_similarity: Optional[float] = None) -> List[int]:
+    """
+    Indexes of up to k candidates picked greedily by MMR: each step takes the
+    candidate maximizing lambda * sim(query) - (1 - lambda) * max sim(picked).
+    Candidates at least duplicate_similarity similar to a picked one are never picked.
+    """
+    lambda_mult = settings.ANSWER_CONTEXT_MMR_LAMBDA if lambda_mult is None else lambda_mult
+    duplicate_similarity = (
+        settings.ANSWER_CONTEXT_DUPLICATE_SIMILARITY if duplicate_similarity is None else duplicate_similarity
+    )
+    vectors = np.asarray(candidate_embeddings, dtype=np.float32)
+    if k <= 0 or len(vectors) == 0:
+        return []
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    relevance = vectors @ (query / max(np.linalg.norm(query), 1e-12))
+
+    # Highest similarity of each candidate to any picked one
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    picked = []
+    while len(picked) < k and available.any():
+        scores = relevance if not picked else lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        best = int(np.argmax(np.where(available, scores, -np.inf)))
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+        available &= redundancy < duplicate_similarity
+    return picked
+
+
+def strip_overlap(previous: str, text: str) -> Optional[str]:
+    """
+    text without its longest prefix that previous ends with, i.e. the overlap
+    the splitter repeats between neighbouring chunks. None if there is none.
+    """
+    probe = text[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return None
+    # The earliest match is the longest overlap
+    position = previous.find(probe, max(0, len(previous) - len(text)))
+    while position != -1:
+        if text.startswith(previous[position:]):
+            return text[len(previous) - position:]
+        position = previous.find(probe, position + 1)
+    return None
+
+
+def merge_adjacent(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge chunks with consecutive chunk_index of the same document into one
+    passage, removing their overlap. Passages are ordered by the highest
+    similarity of their chunks.
+    """
+    passages = []
+    for chunk in sorted(chunks, key=lambda chunk: (chunk["document_id"], chunk["chunk_index"])):
+        passage = passages[-1] if passages else None
+        if (passage is not None and passage["document_id"] == chunk["document_id"]
+                and passage["last_chunk_index"] + 1 == chunk["chunk_index"]):
+            rest = strip_overlap(passage["text"], chunk["text"])
+            passage["text"] += rest if rest is not None else "\n\n" + chunk["text"]
+            passage["last_chunk_index"] = chunk["chunk_index"]
+            passage["chunk_ids"].append(chunk["chunk_id"])
+            passage["similarity"] = max(passage["similarity"], chunk["similarity"])
+        else:
+            passages.append({
+                "document_id": chunk["document_id"],
+                "chunk_index": chunk["chunk_index"],
+                "last_chunk_index": chunk["chunk_index"],
+                "chunk_ids": [chunk["chunk_id"]],
+                "text": chunk["text"],
+                "similarity": chunk["similarity"],
+            })
+    return sorted(passages, key=lambda passage: -passage["similarity"])
+
+
+def assemble_context(query_embedding: Sequence[float], candidates: List[Dict[str, Any]],
+                     candidate_embeddings: Sequence[Sequence[float]], model: str,
+                     max_chunks: Optional[int] = None,
+                     max_tokens: Optional[int] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Pick up to max_chunks candidates by MMR, keep those that fit in max_tokens
+    tokens of the chat model in that order and merge neighbours. Returns
+    (passages, chunks used).
+    The budget is charged for the merged passages, so the overlap a chunk
+    shares with a neighbour already picked is not counted twice. Equally
+    similar candidates, e.g. the chunks of a re-uploaded file, are considered
+    oldest chunk first, since the order of ties in the search results is not
+    defined.
+    """
+    max_chunks = max_chunks or settings.ANSWER_CONTEXT_MAX_CHUNKS
+    max_tokens = max_tokens or settings.ANSWER_CONTEXT_TOKENS
+    order = sorted(range(len(candidates)), key=lambda i: (-candidates[i]["similarity"], candidates[i]["chunk_id"]))
+    candidates = [candidates[i] for i in order]
+    candidate_embeddings = [candidate_embeddings[i] for i in order]
+    used, passages = [], []
+    passage_tokens: Dict[str, int] = {}  # passage text -> tokens, passages recur as chunks are added
+
+    def count(passage: Dict[str, Any]) -> int:
+        if passage["text"] not in passage_tokens:
+            passage_tokens[passage["text"]] = count_tokens(passage["text"], model)
+        return passage_tokens[passage["text"]]
+
+    for index in mmr_select(query_embedding, candidate_embeddings, max_chunks):
+        merged = merge_adjacent(used + [candidates[index]])
+        if sum(count(passage) for passage in merged) > max_tokens:
+            continue
+        used.append(candidates[index])
+        passages = merged
+    return passages, sorted(used, key=lambda chunk: -chunk["similarity"])
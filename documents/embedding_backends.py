@@ -0,0 +1,108 @@
+"""
+Embedding backends selected by EMBEDDING_BACKEND. Each one implements the
+langchain Embeddings interface that TextProcessor calls:
+
+- openai: OpenAIEmbeddings on the shared HTTP client (see text_processing.build_embeddings)
+- local:  a sentence-transformers model run on the CPU, no network round trips
+- fake:   deterministic pseudo-random unit vectors, for benchmarks and tests
+"""
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import numpy as np
+import time
+from typing import List, Optional
+from .embedding_spaces import EmbeddingSpace
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ('openai', 'local', 'fake')
+
+
+def embedding_backend() -> str:
+    backend = settings.EMBEDDING_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND must be one of {', '.join(EMBEDDING_BACKENDS)}, got {backend!r}")
+    return backend
+
+
+def cache_namespace(space: EmbeddingSpace) -> str:
+    """
+    Model name under which embeddings of a space are cached. Fake vectors share
+    the model name of real ones, so they are kept apart from the OpenAI cache.
+    """
+    backend = embedding_backend()
+    return space.key if backend == 'openai' else f"{backend}:{space.key}"
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Unit vectors seeded by the SHA-256 of each text, so the same text always
+    gets the same vector. request_latency and text_latency simulate the time
+    an API call takes, per call and per text.
+    """
+
+    def __init__(self, dimensions: int, request_latency: float = 0.0, text_latency: float = 0.0):
+        self.dimensions = dimensions
+        self.request_latency = request_latency
+        self.text_latency = text_latency
+        self.texts_embedded = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.request_latency or self.text_latency:
+            time.sleep(self.request_latency + self.text_latency * len(texts))
+        self.texts_embedded += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+        vector = np.random.default_rng(seed).standard_normal(self.dimensions)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    sentence-transformers model on the CPU. Texts are split into batches of
+    batch_size that run on a pool of threads; the model is shared, and
+    torch releases the GIL during inference, so batches run in parallel.
+    """
+
+    def __init__(self, model: str, dimensions: Optional[int] = None,
+                 batch_size: int = 32, workers: int = 2, device: str = 'cpu'):
+        self.model_name = model
+        self.dimensions = dimensions
+        self.batch_size = batch_size
+        self.device = device
+        self.model = self._load_model()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='local-embeddings')
+
+    def _load_model(self):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ValueError("EMBEDDING_BACKEND=local needs the sentence-transformers package")
+        logger.info(f"Loading local embedding model {self.model_name} on {self.device}")
+        return SentenceTransformer(self.model_name, device=self.device, truncate_dim=self.dimensions)
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(
+            texts, batch_size=len(texts), normalize_embeddings=True, convert_to_numpy=True,
+        )
+        return np.asarray(vectors, dtype=np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self._encode(batches[0])
+        # map() keeps the batches in order
+        return [vector for vectors in self._pool.map(self._encode, batches) for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
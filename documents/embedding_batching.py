@@ -0,0 +1,226 @@
+"""
+Batching engine for document embeddings. Texts are packed into requests under
+a token and a text budget, requests run concurrently on a thread pool, and
+rate limited or transiently failing requests are retried with jittered
+exponential backoff. Requests that succeed are kept even when others fail.
+"""
+from django.conf import settings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+import asyncio
+import logging
+import openai
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying besides 5xx: timeout, conflict, rate limit
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+# Process-wide request counters of every EmbeddingBatcher
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "retries": 0, "failures": 0}
+
+
+class PartialEmbeddingError(Exception):
+    """
+    Some requests of a batch failed after all retries. embeddings has the
+    vectors of the texts that were embedded, None for the others.
+    """
+
+    def __init__(self, message: str, embeddings: List[Optional[List[float]]]):
+        super().__init__(message)
+        self.embeddings = embeddings
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # The BPE files are downloaded on first use, which fails offline
+        logger.warning(f"No tokenizer for {model}, estimating tokens from text length: {str(e)}")
+        return None
+
+
+def count_tokens(text: str, model: str = "text-embedding-ada-002") -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed embeddings request may succeed when sent again"""
+    if isinstance(error, openai.APIConnectionError):  # includes timeouts
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the API asked us to wait before retrying, if it said so"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        if 'retry-after-ms' in response.headers:
+            return float(response.headers['retry-after-ms']) / 1000
+        if 'retry-after' in response.headers:
+            return float(response.headers['retry-after'])
+    except ValueError:
+        pass
+    return None
+
+
+def batching_stats() -> Dict[str, int]:
+    """Return the embedding request/retry/failure counters of this process"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _count(key: str):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def _export_stats():
+    return [
+        (f"embedding_{key}_total", f"Embedding API {key}", {}, value)
+        for key, value in batching_stats().items()
+    ]
+
+
+metrics.register_collector(_export_stats)
+
+
+class EmbeddingBatcher:
+    """
+    Send texts to embed() in token-budgeted requests, up to concurrency at a
+    time, retrying transient failures. The token count of each text is
+    estimated with count_tokens().
+    """
+
+    def __init__(self, embed: Callable[[List[str]], List[List[float]]],
+                 model: str = "text-embedding-ada-002",
+                 max_tokens: Optional[int] = None, max_texts: Optional[int] = None,
+                 concurrency: Optional[int] = None, max_retries: Optional[int] = None,
+                 base_delay: Optional[float] = None, max_delay: Optional[float] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.embed = embed
+        self.model = model
+        self.max_tokens = max_tokens or settings.EMBEDDING_BATCH_MAX_TOKENS
+        self.max_texts = max_texts or settings.EMBEDDING_BATCH_MAX_TEXTS
+        self.concurrency = concurrency or settings.EMBEDDING_BATCH_CONCURRENCY
+        self.max_retries = settings.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        self.base_delay = settings.EMBEDDING_RETRY_BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = settings.EMBEDDING_RETRY_MAX_DELAY if max_delay is None else max_delay
+        self.sleep = sleep
+
+    def pack(self, texts: List[str]) -> List[List[int]]:
+        """
+        Split text indexes into consecutive requests of at most max_tokens
+        tokens and max_texts texts. A text over the token budget on its own
+        gets a request to itself.
+        """
+        batches, current, current_tokens = [], [], 0
+        for index, text in enumerate(texts):
+            tokens = count_tokens(text, self.model)
+            if current and (current_tokens + tokens > self.max_tokens or len(current) >= self.max_texts):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, but never shorter than Retry-After"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, requested + random.uniform(0, self.base_delay))
+        return delay
+
+    def call(self, function: Callable, *args):
+        """Call function(*args), retrying transient API errors"""
+        attempt = 0
+        while True:
+            _count("requests")
+            try:
+                return function(*args)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    _count("failures")
+                    raise
+                delay = self.backoff(attempt, e)
+                _count("retries")
+                logger.warning(f"Embedding request failed ({str(e)}), retry {attempt + 1} in {delay:.2f}s")
+                self.sleep(delay)
+                attempt += 1
+
+    async def acall(self, function: Callable, *args):
+        """Async call(): awaits function(*args) and sleeps without blocking the loop"""
+        attempt = 0
+        while True:
+            _count("requests")
+            try:
+                return await function(*args)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    _count("failures")
+                    raise
+                delay = self.backoff(attempt, e)
+                _count("retries")
+                logger.warning(f"Embedding request failed ({str(e)}), retry {attempt + 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts in packed, concurrent requests. When some requests still
+        fail after their retries, the others are awaited and PartialEmbeddingError
+        carries what was embedded, so callers can keep it.
+        """
+        if not texts:
+            return []
+        batches = self.pack(texts)
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        errors = []
+
+        def run(batch):
+            vectors = self.call(self.embed, [texts[index] for index in batch])
+            if len(vectors) != len(batch):
+                raise ValueError(f"Embedding count mismatch: {len(vectors)} embeddings for {len(batch)} texts")
+            return vectors
+
+        if len(batches) == 1:
+            return run(batches[0])
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+            futures = {pool.submit(run, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    for index, vector in zip(batch, future.result()):
+                        embeddings[index] = vector
+                except Exception as e:
+                    errors.append(e)
+
+        if errors:
+            failed = sum(vector is None for vector in embeddings)
+            raise PartialEmbeddingError(
+                f"{len(errors)} of {len(batches)} embedding requests failed ({failed} texts): {str(errors[0])}",
+                embeddings,
+            )
+        return embeddings
@@ -0,0 +1,135 @@
+from django.conf import settings
+from django.utils import timezone
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+from .embedding_batching import PartialEmbeddingError
+from . import metrics
+from .models import EmbeddingCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Process-wide hit/miss counters, shared by every EmbeddingCache instance
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 hex digest used as the content address of a piece of text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def cache_stats() -> Dict[str, int]:
+    """Return the embedding cache hit/miss counters of this process"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _count(hits: int, misses: int):
+    with _stats_lock:
+        _stats["hits"] += hits
+        _stats["misses"] += misses
+
+
+def _export_stats():
+    stats = cache_stats()
+    return [
+        ("embedding_cache_lookups_total", "Chunk embedding cache lookups", {"result": "hit"}, stats["hits"]),
+        ("embedding_cache_lookups_total", "Chunk embedding cache lookups", {"result": "miss"}, stats["misses"]),
+    ]
+
+
+metrics.register_collector(_export_stats)
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of document embeddings.
+    Texts are keyed by (model name, SHA-256 of the text) so identical chunks,
+    e.g. from a re-uploaded PDF, are only ever embedded once per model.
+    """
+
+    def __init__(self, model_name: str, max_entries: Optional[int] = None):
+        self.model_name = model_name
+        self.max_entries = max_entries if max_entries is not None else settings.EMBEDDING_CACHE_MAX_ENTRIES
+
+    def get_many(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """Look up cached embeddings by text hash and mark them as recently used"""
+        if not hashes:
+            return {}
+        entries = list(
+            EmbeddingCacheEntry.objects.filter(model_name=self.model_name, text_hash__in=hashes)
+            .values_list('id', 'text_hash', 'embedding')
+        )
+        if entries:
+            EmbeddingCacheEntry.objects.filter(id__in=[entry[0] for entry in entries]).update(
+                last_used_at=timezone.now()
+            )
+        return {hash_: embedding.tolist() for _, hash_, embedding in entries}
+
+    def set_many(self, embeddings: Dict[str, List[float]]):
+        """Store embeddings by text hash, then evict least recently used entries over the limit"""
+        if not embeddings:
+            return
+        EmbeddingCacheEntry.objects.bulk_create(
+            [
+                EmbeddingCacheEntry(model_name=self.model_name, text_hash=hash_, embedding=embedding)
+                for hash_, embedding in embeddings.items()
+            ],
+            batch_size=settings.CHUNK_INSERT_BATCH_SIZE,
+            # Another worker may have cached the same text in the meantime
+            ignore_conflicts=True,
+        )
+        self.evict()
+
+    def evict(self) -> int:
+        """Delete the least recently used entries so at most max_entries remain"""
+        if not self.max_entries:
+            return 0
+        excess = EmbeddingCacheEntry.objects.count() - self.max_entries
+        if excess <= 0:
+            return 0
+        stale_ids = list(
+            EmbeddingCacheEntry.objects.order_by('last_used_at', 'id').values_list('id', flat=True)[:excess]
+        )
+        deleted, _ = EmbeddingCacheEntry.objects.filter(id__in=stale_ids).delete()
+        logger.info(f"Evicted {deleted} embedding cache entries")
+        return deleted
+
+    def embed_documents(self, texts: List[str],
+                        embed: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        """
+        Return embeddings for texts, calling embed() only for texts that are not
+        cached yet. Duplicate texts within the call are embedded once.
+        """
+        hashes = [text_hash(text) for text in texts]
+        found = self.get_many(list(set(hashes)))
+
+        missing = {}
+        for hash_, text in zip(hashes, texts):
+            if hash_ not in found and hash_ not in missing:
+                missing[hash_] = text
+
+        _count(hits=len(texts) - len(missing), misses=len(missing))
+        logger.info(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+
+        if missing:
+            try:
+                new_embeddings = embed(list(missing.values()))
+            except PartialEmbeddingError as e:
+                # Keep what was embedded so a retry only pays for the rest
+                self.set_many({
+                    hash_: embedding for hash_, embedding in zip(missing.keys(), e.embeddings)
+                    if embedding is not None
+                })
+                raise
+            if len(new_embeddings) != len(missing):
+                raise ValueError(
+                    f"Embedding count mismatch: {len(new_embeddings)} embeddings for {len(missing)} texts"
+                )
+            computed = dict(zip(missing.keys(), new_embeddings))
+            self.set_many(computed)
+            found.update(computed)
+
+        return [found[hash_] for hash_ in hashes]
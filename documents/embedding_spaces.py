@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from django.conf import settings
+from typing import Optional
+from .models import TextChunk, ChunkEmbedding
+
+# Output size of embedding models when no dimensions are requested
+NATIVE_DIMENSIONS = {
+    'text-embedding-ada-002': 1536,
+    'text-embedding-3-small': 1536,
+    'text-embedding-3-large': 3072,
+    # Local models for EMBEDDING_BACKEND=local
+    'sentence-transformers/all-MiniLM-L6-v2': 384,
+    'BAAI/bge-small-en-v1.5': 384,
+    'BAAI/bge-base-en-v1.5': 768,
+}
+
+
+@dataclass(frozen=True)
+class EmbeddingSpace:
+    """An embedding model together with the size of the vectors it returns"""
+    model: str
+    dimensions: int
+    # Dimensions passed to the API; None when the model's native size is used
+    requested_dimensions: Optional[int] = None
+
+    @property
+    def key(self) -> str:
+        """Name used in cache keys and ChunkEmbedding.space"""
+        if self.requested_dimensions is None:
+            return self.model
+        return f"{self.model}:{self.dimensions}"
+
+    @property
+    def in_column(self) -> bool:
+        """Whether the vectors of this space are stored in TextChunk.embedding"""
+        return (
+            self.model == settings.EMBEDDING_COLUMN_MODEL
+            and self.dimensions == TextChunk._meta.get_field('embedding').dimensions
+        )
+
+    @property
+    def index_name(self) -> str:
+        """Name of the partial HNSW index of this space on ChunkEmbedding"""
+        slug = "".join(char if char.isalnum() else "_" for char in self.key.lower())
+        return f"chunkembedding_{slug}_hnsw"[:63]
+
+
+def embedding_space(model: Optional[str] = None, dimensions: Optional[int] = None) -> EmbeddingSpace:
+    """The space of model/dimensions, defaulting to EMBEDDING_MODEL/EMBEDDING_DIMENSIONS"""
+    if model is None:
+        model = settings.EMBEDDING_MODEL
+        dimensions = settings.EMBEDDING_DIMENSIONS if dimensions is None else dimensions
+    native = NATIVE_DIMENSIONS.get(model)
+    if dimensions is None or dimensions == native:
+        if native is None:
+            raise ValueError(f"Unknown native dimensions of embedding model {model!r}, set EMBEDDING_DIMENSIONS")
+        return EmbeddingSpace(model, native)
+    return EmbeddingSpace(model, dimensions, requested_dimensions=dimensions)
+
+
+def index_statement(space: EmbeddingSpace) -> str:
+    """
+    DDL of the partial HNSW index of a space on ChunkEmbedding. The column has
+    no fixed dimensions, so the index is on a cast that searches must repeat.
+    """
+    table = ChunkEmbedding._meta.db_table
+    space_literal = space.key.replace("'", "''")
+    return (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {space.index_name} ON {table} "
+        f"USING hnsw ((embedding::vector({space.dimensions})) vector_cosine_ops) "
+        f"WITH (m = 16, ef_construction = 64) WHERE space = '{space_literal}'"
+    )
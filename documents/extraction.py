@@ -0,0 +1,108 @@
+from django.conf import settings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import multiprocessing
+import pdfplumber
+import re
+import logging
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def count_pdf_pages(pdf_path: str) -> int:
+    """Return the number of pages in a PDF without extracting any text"""
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+def iter_pdf_pages(pdf_path: str, skip_pages: Iterable[int] = (),
+                   workers: Optional[int] = None,
+                   pages_per_task: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page_number, text) for every page of a PDF, in order.
+    Pages listed in skip_pages are not extracted (used to resume checkpointed jobs).
+
+    Large PDFs are split into page ranges of pages_per_task pages and extracted
+    on a process pool, since pdfplumber layout analysis is CPU bound. Pages are
+    still yielded in order as soon as they are ready.
+    """
+    skip_pages = set(skip_pages)
+    workers = settings.PDF_EXTRACTION_WORKERS if workers is None else workers
+    pages_per_task = pages_per_task or settings.PDF_EXTRACTION_PAGES_PER_TASK
+
+    with pdfplumber.open(pdf_path) as pdf:
+        wanted = [n for n in range(len(pdf.pages)) if n not in skip_pages]
+        if workers <= 1 or len(wanted) < settings.PDF_EXTRACTION_PARALLEL_MIN_PAGES:
+            for page_number in wanted:
+                page = pdf.pages[page_number]
+                yield page_number, page.extract_text() or ""
+                # Drop the page's cached layout objects once its text is out
+                page.close()
+            return
+
+    tasks = iter([wanted[i:i + pages_per_task] for i in range(0, len(wanted), pages_per_task)])
+    logger.info(f"Extracting {len(wanted)} pages of {pdf_path} with {workers} processes")
+
+    # spawn: workers never inherit the parent's database connections or threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        # At most two page ranges per worker are queued or waiting to be consumed,
+        # which bounds memory no matter how many pages the document has
+        in_flight = deque(
+            pool.submit(_extract_page_range, pdf_path, task)
+            for task in islice(tasks, workers * 2)
+        )
+        while in_flight:
+            results = in_flight.popleft().result()
+            task = next(tasks, None)
+            if task is not None:
+                in_flight.append(pool.submit(_extract_page_range, pdf_path, task))
+            yield from results
+
+
+def _extract_page_range(pdf_path: str, page_numbers: List[int]) -> List[Tuple[int, str]]:
+    """Process pool task: extract the given (0-based) pages, holding one page at a time"""
+    results = []
+    with pdfplumber.open(pdf_path, pages=[n + 1 for n in page_numbers]) as pdf:
+        for page_number, page in zip(page_numbers, pdf.pages):
+            results.append((page_number, page.extract_text() or ""))
+            page.close()
+    return results
+
+
+def extract_text_from_pdf(pdf_path: str) -> str:
+    """
+    Extract text from PDF with improved handling of layout and spacing.
+    """
+    full_text = [text for _, text in iter_pdf_pages(pdf_path) if text]
+
+    # Join pages with clear page separators
+    return clean_text("\n\n".join(full_text))
+
+
+# Whitespace that needs rewriting: a hyphen between whitespace runs, e.g. a word
+# hyphenated across a line break ("embed -\nding"), runs of more than one space
+# and any run containing a newline or tab. Single spaces between words, by far the
+# most common case, are left alone without calling back into Python.
+_WHITESPACE_TO_NORMALIZE = re.compile(r'\s+-\s+| \s+|[^\S ]\s*')
+
+
+def _normalize_whitespace(match: re.Match) -> str:
+    run = match.group()
+    if '-' in run:
+        # Joined like the whitespace collapsed to " - " used to be
+        return '-'
+    # Two or more line breaks separate paragraphs, anything else is a word break
+    return '\n\n' if run.count('\n') >= 2 else ' '
+
+
+def clean_text(text: str) -> str:
+    """
+    Clean up extracted text to fix common PDF extraction issues, in one pass.
+    Whitespace is collapsed to single spaces except for paragraph breaks
+    (blank lines), which are kept as "\n\n" for the chunker to split on.
+    """
+    if not text:
+        return ""
+    return _WHITESPACE_TO_NORMALIZE.sub(_normalize_whitespace, text).strip()
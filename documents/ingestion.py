@@ -0,0 +1,349 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from collections import defaultdict, deque
+from datetime import timedelta
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from .answer_cache import invalidate_documents
+from .chunk_storage import insert_chunks, insert_chunk_embeddings
+from .embedding_cache import text_hash
+from .embedding_spaces import embedding_space
+from .extraction import count_pdf_pages, iter_pdf_pages, clean_text
+from .models import Document, IngestionJob, IngestionPage, TextChunk
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_document(document: Document) -> IngestionJob:
+    """
+    Queue a document for background extraction, chunking and embedding.
+    Raises IntegrityError if the document already has a queued or running job.
+    """
+    job = IngestionJob.objects.create(document=document)
+    logger.info(f"Queued ingestion job {job.id} for document {document.id}")
+    return job
+
+
+def claim_next_job() -> Optional[IngestionJob]:
+    """
+    Atomically mark the oldest queued job as running and return it.
+    SKIP LOCKED lets several workers poll the same table without blocking each other.
+    """
+    with transaction.atomic():
+        job = (
+            IngestionJob.objects.select_for_update(skip_locked=True)
+            .filter(status=IngestionJob.STATUS_QUEUED)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = IngestionJob.STATUS_RUNNING
+        job.attempts += 1
+        job.error = ''
+        job.started_at = job.started_at or timezone.now()
+        job.save()
+        return job
+
+
+def claim_jobs(limit: int, bulk: Optional[bool] = None) -> List[IngestionJob]:
+    """
+    Atomically mark up to limit of the oldest queued jobs as running and return
+    them. bulk=True claims only jobs of bulk uploads, bulk=False only the others.
+    """
+    queued = IngestionJob.objects.filter(status=IngestionJob.STATUS_QUEUED)
+    if bulk is not None:
+        queued = queued.filter(bulk=bulk)
+    with transaction.atomic():
+        jobs = list(
+            queued.select_for_update(skip_locked=True, of=('self',))
+            .select_related('document')
+            .order_by('created_at')[:limit]
+        )
+        now = timezone.now()
+        for job in jobs:
+            job.status = IngestionJob.STATUS_RUNNING
+            job.attempts += 1
+            job.error = ''
+            job.started_at = job.started_at or now
+            job.updated_at = now
+        IngestionJob.objects.bulk_update(jobs, ['status', 'attempts', 'error', 'started_at', 'updated_at'])
+        return jobs
+
+
+def requeue_stale_jobs(timeout: Optional[int] = None) -> int:
+    """
+    Requeue running jobs whose heartbeat stopped, e.g. because the worker crashed.
+    Jobs that already used up their attempts are marked as failed instead.
+    """
+    timeout = timeout or settings.INGESTION_JOB_TIMEOUT
+    now = timezone.now()
+    stale = IngestionJob.objects.filter(
+        status=IngestionJob.STATUS_RUNNING,
+        updated_at__lt=now - timedelta(seconds=timeout),
+    )
+
+    failed = stale.filter(attempts__gte=settings.INGESTION_MAX_ATTEMPTS).update(
+        status=IngestionJob.STATUS_FAILED,
+        error="Worker stopped responding too many times",
+        finished_at=now,
+        updated_at=now,
+    )
+    requeued = stale.update(status=IngestionJob.STATUS_QUEUED, updated_at=now)
+
+    if failed or requeued:
+        logger.warning(f"Requeued {requeued} stale ingestion jobs, failed {failed}")
+    return requeued
+
+
+class Heartbeat:
+    """
+    Touch updated_at of running jobs from a background thread while the
+    enclosed block runs, so requeue_stale_jobs never hands a job that is still
+    being embedded or stored to another worker. Jobs are dropped with discard()
+    once they are finished.
+    """
+
+    def __init__(self, job_ids: Iterable[int], interval: Optional[float] = None):
+        self.job_ids = set(job_ids)
+        self.interval = settings.INGESTION_JOB_TIMEOUT / 4 if interval is None else interval
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ingestion-heartbeat', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def discard(self, job_id: int):
+        with self._lock:
+            self.job_ids.discard(job_id)
+
+    def beat(self):
+        with self._lock:
+            job_ids = list(self.job_ids)
+        if job_ids:
+            IngestionJob.objects.filter(id__in=job_ids, status=IngestionJob.STATUS_RUNNING).update(
+                updated_at=timezone.now()
+            )
+
+    def _run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    self.beat()
+                except Exception as e:
+                    logger.warning(f"Ingestion heartbeat failed: {str(e)}")
+        finally:
+            # The thread has its own database connection
+            connection.close()
+
+
+def run_ingestion_job(job_id: int, text_processor=None) -> IngestionJob:
+    """
+    Run every stage of an ingestion job. Extracted pages are streamed into the
+    chunker and checkpointed, so running an interrupted job again only
+    extracts the missing pages. Chunks already stored for the document are
+    diffed against the new ones, so re-ingesting a changed file only embeds
+    what changed.
+    """
+    job = IngestionJob.objects.select_related('document').get(pk=job_id)
+    document = job.document
+
+    # Embedding a large document takes longer than a page checkpoint
+    with Heartbeat([job.id]):
+        _run_job(job, document, text_processor)
+    return job
+
+
+def _run_job(job: IngestionJob, document: Document, text_processor):
+    try:
+        if text_processor is None:
+            from .text_processing import get_text_processor
+            text_processor = get_text_processor()
+
+        # Pages are cleaned and fed to the chunker as soon as they are extracted,
+        # so the time of each stage is accumulated while they interleave
+        cleaned_pages = []
+        extract_timer = metrics.StageTimer('ingest.extract')
+        clean_timer = metrics.StageTimer('ingest.clean')
+
+        def iter_cleaned_pages():
+            for _, text in extract_timer.iterate(_iter_pages(job)):
+                with clean_timer.measure():
+                    text = clean_text(text)
+                if text:
+                    cleaned_pages.append(text)
+                    yield text
+            # Extraction is done, what is left is splitting the buffered tail
+            _set_stage(job, IngestionJob.STAGE_CHUNKING)
+
+        chunks = []
+        started = time.perf_counter()
+        for chunk in text_processor.iter_text_chunks(iter_cleaned_pages()):
+            chunks.append(chunk)
+            job.chunks_total = len(chunks)
+        extract_timer.record()
+        clean_timer.record()
+        metrics.record('ingest.chunk', time.perf_counter() - started - extract_timer.total - clean_timer.total)
+
+        document.extracted_text = "\n\n".join(cleaned_pages)
+        document.save(update_fields=['extracted_text'])
+        logger.info(f"Created {len(chunks)} chunks for document {document.id}")
+        if not chunks:
+            raise ValueError("No text chunks could be created from the document")
+
+        # Only chunks whose text is not stored for the document yet are embedded
+        _set_stage(job, IngestionJob.STAGE_EMBEDDING)
+        result = sync_document_chunks(document, chunks, text_processor, job=job)
+        complete_job(job, len(chunks), result)
+    except Exception as e:
+        fail_job(job, e)
+
+
+def complete_job(job: IngestionJob, chunk_count: int, result: Dict[str, int]):
+    """Record the outcome of sync_document_chunks on a job and mark it completed"""
+    job.chunks_done = chunk_count
+    job.chunks_reused = result["reused"]
+    job.chunks_added = result["added"]
+    job.chunks_removed = result["removed"]
+    job.status = IngestionJob.STATUS_COMPLETED
+    job.stage = IngestionJob.STAGE_DONE
+    job.finished_at = timezone.now()
+    job.save()
+
+    # The full text now lives on the document, page checkpoints are no longer needed
+    job.pages.all().delete()
+    metrics.increment('ingestion_jobs_total', help="Finished ingestion jobs", status=job.status)
+    for kind in ("reused", "added", "removed"):
+        metrics.increment('ingestion_chunks_total', result[kind], help="Chunks synced by ingestion", kind=kind)
+    logger.info(
+        f"Ingestion job {job.id} synced {chunk_count} chunks for document {job.document_id}: "
+        f"{result['reused']} reused, {result['added']} added, {result['removed']} removed"
+    )
+
+
+def fail_job(job: IngestionJob, error: Exception):
+    logger.error(f"Ingestion job {job.id} failed in stage {job.stage}: {str(error)}")
+    job.status = IngestionJob.STATUS_FAILED
+    job.error = str(error)
+    job.finished_at = timezone.now()
+    job.save()
+    metrics.increment('ingestion_jobs_total', help="Finished ingestion jobs", status=job.status)
+
+
+def sync_document_chunks(document: Document, chunks: List[str], text_processor,
+                         job: Optional[IngestionJob] = None,
+                         precomputed: Optional[Dict[str, Sequence[float]]] = None) -> Dict[str, int]:
+    """
+    Make the stored chunks of a document match chunks, diffing by content hash.
+    Unchanged chunks keep their row and embedding (only their index moves),
+    new chunks are embedded and inserted, and chunks that are gone are deleted,
+    all in one transaction. precomputed maps text hashes to embeddings computed
+    beforehand, e.g. together with other documents; only the others are embedded.
+    """
+    existing = defaultdict(deque)
+    for chunk_id, chunk_index, content_hash in (
+        TextChunk.objects.filter(document=document)
+        .order_by('chunk_index', 'id')
+        .values_list('id', 'chunk_index', 'content_hash')
+    ):
+        existing[content_hash].append((chunk_id, chunk_index))
+
+    moved, new_rows, reused_ids = [], [], []
+    for chunk_index, chunk in enumerate(chunks):
+        matches = existing.get(text_hash(chunk))
+        if matches:
+            chunk_id, old_index = matches.popleft()
+            reused_ids.append(chunk_id)
+            if old_index != chunk_index:
+                moved.append(TextChunk(id=chunk_id, chunk_index=chunk_index))
+        else:
+            new_rows.append((chunk_index, chunk))
+    removed_ids = [chunk_id for matches in existing.values() for chunk_id, _ in matches]
+
+    precomputed = precomputed or {}
+    missing = [chunk for _, chunk in new_rows if text_hash(chunk) not in precomputed]
+    with metrics.span('ingest.embed'):
+        computed = text_processor.generate_embeddings_batch(missing) if missing else []
+    if len(computed) != len(missing):
+        raise ValueError(f"Embedding count mismatch: {len(computed)} embeddings for {len(missing)} chunks")
+    computed = iter(computed)
+    embeddings = [
+        precomputed[text_hash(chunk)] if text_hash(chunk) in precomputed else next(computed)
+        for _, chunk in new_rows
+    ]
+
+    # Kept chunks may predate the active embedding space when it lives in ChunkEmbedding
+    backfill = []
+    space = embedding_space()
+    if not space.in_column and reused_ids:
+        missing = list(
+            TextChunk.objects.filter(id__in=reused_ids)
+            .exclude(embeddings__space=space.key)
+            .values_list('id', 'text')
+        )
+        if missing:
+            with metrics.span('ingest.embed'):
+                backfill = list(zip(
+                    [chunk_id for chunk_id, _ in missing],
+                    text_processor.generate_embeddings_batch([text for _, text in missing]),
+                ))
+
+    if job is not None:
+        _set_stage(job, IngestionJob.STAGE_STORING)
+    with metrics.span('ingest.store'), transaction.atomic():
+        TextChunk.objects.filter(id__in=removed_ids).only('id').delete()
+        TextChunk.objects.bulk_update(moved, ['chunk_index'], batch_size=settings.CHUNK_INSERT_BATCH_SIZE)
+        if backfill:
+            insert_chunk_embeddings(space.key, backfill)
+        insert_chunks(document, [
+            (chunk_index, chunk, embedding)
+            for (chunk_index, chunk), embedding in zip(new_rows, embeddings)
+        ])
+        if removed_ids or moved or new_rows:
+            invalidate_documents([document.id])
+
+    return {"reused": len(reused_ids), "added": len(new_rows), "removed": len(removed_ids)}
+
+
+def _set_stage(job: IngestionJob, stage: str):
+    job.stage = stage
+    job.save()
+
+
+def _iter_pages(job: IngestionJob) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page_number, text) for every page in order, checkpointing newly
+    extracted pages and reusing the checkpoints of an earlier attempt.
+    """
+    path = job.document.file.path
+    checkpoints = dict(job.pages.values_list('page_number', 'text'))
+    pending = sorted(checkpoints)
+
+    if not job.pages_total:
+        job.pages_total = count_pdf_pages(path)
+    job.pages_done = len(checkpoints)
+    _set_stage(job, IngestionJob.STAGE_EXTRACTING)
+
+    for page_number, text in iter_pdf_pages(path, skip_pages=checkpoints.keys()):
+        while pending and pending[0] < page_number:
+            checkpointed = pending.pop(0)
+            yield checkpointed, checkpoints[checkpointed]
+
+        IngestionPage.objects.create(job=job, page_number=page_number, text=text)
+        job.pages_done += 1
+        job.save(update_fields=['pages_done', 'chunks_total', 'updated_at'])
+        yield page_number, text
+
+    for checkpointed in pending:
+        yield checkpointed, checkpoints[checkpointed]
@@ -0,0 +1,39 @@
+from langchain_core.messages import AIMessage, AIMessageChunk
+import asyncio
+import time
+from typing import AsyncIterator, Iterator
+
+
+class FakeStreamingChatModel:
+    """
+    Local stand-in for ChatOpenAI that emits a canned answer word by word with
+    an artificial per-token delay. Used to measure time-to-first-byte of the
+    streaming endpoints without calling OpenAI.
+    """
+
+    def __init__(self, token_delay: float = 0.05,
+                 answer: str = "This is a fake answer generated from the provided context."):
+        self.token_delay = token_delay
+        self.answer = answer
+
+    def _tokens(self):
+        words = self.answer.split(" ")
+        return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+    def invoke(self, prompt) -> AIMessage:
+        time.sleep(self.token_delay * len(self._tokens()))
+        return AIMessage(content=self.answer)
+
+    async def ainvoke(self, prompt) -> AIMessage:
+        await asyncio.sleep(self.token_delay * len(self._tokens()))
+        return AIMessage(content=self.answer)
+
+    def stream(self, prompt) -> Iterator[AIMessageChunk]:
+        for token in self._tokens():
+            time.sleep(self.token_delay)
+            yield AIMessageChunk(content=token)
+
+    async def astream(self, prompt) -> AsyncIterator[AIMessageChunk]:
+        for token in self._tokens():
+            await asyncio.sleep(self.token_delay)
+            yield AIMessageChunk(content=token)
@@ -0,0 +1,68 @@
+import hashlib
+
+from django.core.management.base import BaseCommand
+
+from documents.models import Document
+from documents.uploads import HASH_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        "Hash the files of documents uploaded before Document.content_hash existed, so "
+        "uploads of the same bytes are recognized as duplicates. Files are read in "
+        "chunks; a document whose bytes another document already has keeps no hash "
+        "and is reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        missing = Document.objects.filter(content_hash__isnull=True).exclude(file='')
+        total = missing.count()
+        self.stdout.write(f"Hashing the files of {total} documents")
+
+        hashed, duplicates, unreadable, last_id = 0, 0, 0, 0
+        while True:
+            # Keyset pagination: each batch is a short query regardless of table size
+            batch = list(missing.filter(id__gt=last_id).order_by('id').only('id', 'file')[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            hashes = {}
+            for document in batch:
+                try:
+                    hashes[document.id] = self._hash(document.file)
+                except OSError as e:
+                    unreadable += 1
+                    self.stderr.write(f"Document {document.id}: cannot read {document.file.name}: {str(e)}")
+
+            taken = dict(
+                Document.objects.filter(content_hash__in=set(hashes.values())).values_list('content_hash', 'id')
+            )
+            updates = []
+            for document in batch:
+                content_hash = hashes.get(document.id)
+                if content_hash is None:
+                    continue
+                if content_hash in taken:
+                    duplicates += 1
+                    self.stdout.write(f"Document {document.id} has the same file as document {taken[content_hash]}")
+                    continue
+                taken[content_hash] = document.id
+                document.content_hash = content_hash
+                updates.append(document)
+            Document.objects.bulk_update(updates, ['content_hash'])
+            hashed += len(updates)
+            self.stdout.write(f"{hashed + duplicates + unreadable}/{total} documents checked")
+
+        self.stdout.write(f"Hashed {hashed} documents, {duplicates} duplicates, {unreadable} unreadable files")
+
+    @staticmethod
+    def _hash(file) -> str:
+        hasher = hashlib.sha256()
+        with file.open('rb') as content:
+            for chunk in content.chunks(HASH_CHUNK_SIZE):
+                hasher.update(chunk)
+        return hasher.hexdigest()
@@ -0,0 +1,64 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from documents.chunk_storage import copy_insert_chunks
+from documents.models import Document, TextChunk
+from documents.text_processing import TextProcessor, query_embedding_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare queries per second of sequential searches with the batch search "
+        "(one embedding call and one LATERAL query per batch) on a synthetic corpus. "
+        "Queries are embedded by the fake backend with a simulated API latency. "
+        "Benchmark rows are removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks', type=int, default=20_000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--limit', type=int, default=5)
+        parser.add_argument('--latency', type=float, default=0.05,
+                            help="Seconds per simulated embeddings request")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        dims = TextChunk._meta.get_field('embedding').dimensions
+        vectors = rng.standard_normal((options['chunks'], dims))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        rows = [(i, f"benchmark chunk {i}", vectors[i]) for i in range(options['chunks'])]
+        limit, batch_size = options['limit'], options['batch_size']
+
+        document = Document.objects.create(file='benchmark/batch_search.pdf')
+        try:
+            copy_insert_chunks(document, rows)
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE documents_textchunk")
+
+            with override_settings(EMBEDDING_BACKEND='fake', FAKE_EMBEDDING_LATENCY=options['latency']):
+                processor = TextProcessor()
+                for mode in ("sequential", "batch"):
+                    # Distinct texts per mode, so no query embedding is cached
+                    queries = [f"{mode} query {i}" for i in range(options['queries'])]
+                    query_embedding_cache.local.clear()
+                    started = time.perf_counter()
+                    if mode == "sequential":
+                        for query in queries:
+                            processor.find_similar_chunks(query, limit)
+                    else:
+                        for start in range(0, len(queries), batch_size):
+                            processor.batch_find_similar_chunks(queries[start:start + batch_size], limit)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"{mode:<10} {len(queries) / elapsed:9.1f} queries/s "
+                        f"({elapsed * 1000 / len(queries):7.2f}ms per query)"
+                    )
+        finally:
+            TextChunk.objects.filter(document=document).delete()
+            document.delete()
@@ -0,0 +1,66 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from documents.chunk_storage import bulk_insert_chunks, copy_insert_chunks
+from documents.models import Document, TextChunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure chunk insert throughput (rows/s) for per-row INSERTs, batched "
+        "bulk_create and binary COPY. Benchmark rows are removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000)
+        parser.add_argument('--dimensions', type=int, default=1536)
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 500, 1000])
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        embeddings = rng.standard_normal((options['rows'], options['dimensions'])).astype(np.float32)
+        rows = [
+            (i, f"benchmark chunk {i} " + "lorem ipsum " * 80, embedding)
+            for i, embedding in enumerate(embeddings)
+        ]
+
+        document = Document.objects.create(file='benchmark/chunk_insert.pdf')
+        try:
+            self._report("per-row create", options['repeat'], rows,
+                         lambda: self._insert_per_row(document, rows))
+            for batch_size in options['batch_sizes']:
+                self._report(f"bulk_create batch={batch_size}", options['repeat'], rows,
+                             lambda: bulk_insert_chunks(document, rows, batch_size=batch_size))
+            self._report("binary COPY", options['repeat'], rows,
+                         lambda: copy_insert_chunks(document, rows))
+        finally:
+            TextChunk.objects.filter(document=document).delete()
+            document.delete()
+
+    def _report(self, label, repeat, rows, insert):
+        document_chunks = TextChunk.objects.filter(document__file__startswith='benchmark/chunk_insert')
+        timings = []
+        for _ in range(repeat):
+            with transaction.atomic():
+                started = time.perf_counter()
+                insert()
+                timings.append(time.perf_counter() - started)
+            document_chunks.delete()
+        best = min(timings)
+        self.stdout.write(f"{label:<26} {len(rows) / best:>10,.0f} rows/s  (best of {repeat}: {best:.3f}s)")
+
+    @staticmethod
+    def _insert_per_row(document, rows):
+        """The original one INSERT per chunk path, kept as the baseline"""
+        for chunk_index, text, embedding in rows:
+            TextChunk.objects.create(
+                document=document,
+                chunk_index=chunk_index,
+                text=text,
+                embedding=embedding,
+            )
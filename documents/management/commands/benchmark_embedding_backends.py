@@ -0,0 +1,54 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from documents.embedding_backends import EMBEDDING_BACKENDS
+from documents.embedding_spaces import embedding_space
+from documents.text_processing import build_embeddings
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ingestion throughput (chunks/s) and single-query latency of the "
+        "embedding backends. The embedding caches are bypassed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', choices=EMBEDDING_BACKENDS, default=['fake', 'local'])
+        parser.add_argument('--model', default=None, help="OpenAI model, defaults to EMBEDDING_MODEL")
+        parser.add_argument('--local-model', default='BAAI/bge-small-en-v1.5')
+        parser.add_argument('--dimensions', type=int, default=None)
+        parser.add_argument('--chunks', type=int, default=512)
+        parser.add_argument('--queries', type=int, default=50)
+
+    def handle(self, *args, **options):
+        chunks = [f"chunk {i} about pump maintenance " + "lorem ipsum dolor sit amet " * 30
+                  for i in range(options['chunks'])]
+        queries = [f"how do I replace seal number {i}?" for i in range(options['queries'])]
+
+        for backend in options['backends']:
+            with override_settings(EMBEDDING_BACKEND=backend):
+                try:
+                    model = options['local_model'] if backend == 'local' else options['model']
+                    space = embedding_space(model, options['dimensions'])
+                    embeddings = build_embeddings(space)
+                except Exception as e:
+                    self.stdout.write(f"{backend:<7} skipped: {str(e)}")
+                    continue
+
+                started = time.perf_counter()
+                embeddings.embed_documents(chunks)
+                ingest = time.perf_counter() - started
+
+                timings = []
+                for query in queries:
+                    started = time.perf_counter()
+                    embeddings.embed_query(query)
+                    timings.append((time.perf_counter() - started) * 1000)
+
+                self.stdout.write(
+                    f"{backend:<7} {space.key:<40} ingest={len(chunks) / ingest:9.1f} chunks/s "
+                    f"query p50={np.median(timings):7.2f}ms p95={np.percentile(timings, 95):7.2f}ms"
+                )
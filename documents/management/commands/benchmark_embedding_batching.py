@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from openai import OpenAI
+
+from documents.embedding_batching import EmbeddingBatcher, batching_stats
+from documents.stub_openai import start_stub_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure document embedding throughput against the local stub API with "
+        "simulated latency and rate limiting, for several request concurrencies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks', type=int, default=2000)
+        parser.add_argument('--max-texts', type=int, default=64)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16])
+        parser.add_argument('--latency', type=float, default=0.2, help="Seconds per embeddings request")
+        parser.add_argument('--rate-limit', type=int, default=40, help="Requests per second (0 = unlimited)")
+        parser.add_argument('--dimensions', type=int, default=1536)
+
+    def handle(self, *args, **options):
+        server = start_stub_server(
+            dimensions=options['dimensions'],
+            embedding_latency=options['latency'],
+            rate_limit=options['rate_limit'],
+        )
+        client = OpenAI(api_key="stub", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", max_retries=0)
+
+        def embed(texts):
+            response = client.embeddings.create(input=texts, model="text-embedding-ada-002")
+            return [item.embedding for item in response.data]
+
+        chunks = [f"chunk {i} " + "lorem ipsum dolor sit amet " * 40 for i in range(options['chunks'])]
+        try:
+            for concurrency in options['concurrency']:
+                batcher = EmbeddingBatcher(
+                    embed, max_texts=options['max_texts'], concurrency=concurrency, base_delay=0.1,
+                )
+                before, rejected_before = batching_stats(), server.requests_rejected
+                started = time.perf_counter()
+                batcher.embed_documents(chunks)
+                elapsed = time.perf_counter() - started
+                after = batching_stats()
+                self.stdout.write(
+                    f"concurrency={concurrency:<3} {elapsed:7.2f}s {len(chunks) / elapsed:9.1f} chunks/s "
+                    f"requests={after['requests'] - before['requests']} "
+                    f"retries={after['retries'] - before['retries']} "
+                    f"rejected={server.requests_rejected - rejected_before}"
+                )
+        finally:
+            server.shutdown()
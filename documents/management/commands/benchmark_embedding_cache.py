@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from documents.embedding_backends import FakeEmbeddings
+from documents.embedding_cache import EmbeddingCache, cache_stats
+from documents.models import EmbeddingCacheEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure re-ingest embedding time with and without the embedding cache, "
+        "using a stubbed embeddings backend."
+    )
+
+    model_name = 'benchmark-stub'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks', type=int, default=2000)
+        parser.add_argument('--changed', type=float, default=0.1,
+                            help="Fraction of chunks that differ in the re-uploaded version")
+        parser.add_argument('--dimensions', type=int, default=1536)
+        parser.add_argument('--request-latency', type=float, default=0.2)
+        parser.add_argument('--text-latency', type=float, default=0.002)
+
+    def handle(self, *args, **options):
+        chunks = options['chunks']
+        changed = int(chunks * options['changed'])
+        version_1 = [f"chunk {i} of the original upload " + "lorem ipsum " * 60 for i in range(chunks)]
+        version_2 = [f"chunk {i} of the edited upload " + "lorem ipsum " * 60 for i in range(changed)]
+        version_2 += version_1[changed:]
+
+        stub = FakeEmbeddings(options['dimensions'], options['request_latency'], options['text_latency'])
+        cache = EmbeddingCache(self.model_name, max_entries=0)
+        EmbeddingCacheEntry.objects.filter(model_name=self.model_name).delete()
+        try:
+            started = time.perf_counter()
+            stub.embed_documents(version_2)
+            uncached = time.perf_counter() - started
+            self.stdout.write(f"no cache:             {uncached:7.2f}s  {len(version_2)} texts embedded")
+
+            stub.texts_embedded = 0
+            started = time.perf_counter()
+            cache.embed_documents(version_1, stub.embed_documents)
+            cold = time.perf_counter() - started
+            self.stdout.write(f"cold cache (v1):      {cold:7.2f}s  {stub.texts_embedded} texts embedded")
+
+            stub.texts_embedded = 0
+            before = cache_stats()
+            started = time.perf_counter()
+            cache.embed_documents(version_2, stub.embed_documents)
+            warm = time.perf_counter() - started
+            after = cache_stats()
+            self.stdout.write(
+                f"re-ingest (v2):       {warm:7.2f}s  {stub.texts_embedded} texts embedded, "
+                f"hits={after['hits'] - before['hits']} misses={after['misses'] - before['misses']} "
+                f"speedup={uncached / warm:.1f}x"
+            )
+        finally:
+            EmbeddingCacheEntry.objects.filter(model_name=self.model_name).delete()
@@ -0,0 +1,119 @@
+import io
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from documents import vector_storage
+from documents.text_processing import to_vector_literal
+
+
+class Command(BaseCommand):
+    help = (
+        "Report table size, index size, search latency and recall@k of each embedding "
+        "storage mode (vector, halfvec, binary with rescoring) on synthetic embeddings. "
+        "Each mode is loaded into a scratch table that is dropped afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50_000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--dimensions', type=int, default=1536)
+        parser.add_argument('--rescore-candidates', type=int, default=200)
+        parser.add_argument('--modes', nargs='+', choices=vector_storage.STORAGE_MODES,
+                            default=list(vector_storage.STORAGE_MODES))
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        dims, limit = options['dimensions'], options['limit']
+        # Clustered data: pure noise would make every ANN index look bad
+        centers = self._normalize(rng.standard_normal((100, dims)))
+        embeddings = self._sample(rng, centers, options['rows']).astype(np.float32)
+        queries = self._sample(rng, centers, options['queries'])
+        # Exact top-k by cosine similarity on the full-precision data
+        truth = [set(np.argsort(-(embeddings @ query))[:limit] + 1) for query in queries]
+
+        quantized = vector_storage.supports_quantization()
+        for mode in options['modes']:
+            if mode != 'vector' and not quantized:
+                self.stdout.write(f"{mode:<8} skipped: needs pgvector 0.7 or later")
+                continue
+            table = f"benchmark_embedding_{mode}"
+            try:
+                self._load(table, mode, embeddings, dims)
+                sizes = self._sizes(table)
+                timings, found = [], 0
+                for query, expected in zip(queries, truth):
+                    started = time.perf_counter()
+                    ids = self._search(table, mode, query, limit, dims, options['rescore_candidates'])
+                    timings.append((time.perf_counter() - started) * 1000)
+                    found += len(expected & set(ids))
+                self.stdout.write(
+                    f"{mode:<8} table={sizes['table'] / 2**20:8.1f}MB index={sizes['index'] / 2**20:8.1f}MB "
+                    f"p50={np.median(timings):7.2f}ms p95={np.percentile(timings, 95):7.2f}ms "
+                    f"recall@{limit}={found / (len(queries) * limit):.3f}"
+                )
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+    @staticmethod
+    def _normalize(vectors):
+        return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+    def _sample(self, rng, centers, n):
+        """Unit vectors scattered around random cluster centers"""
+        dims = centers.shape[1]
+        noise = rng.standard_normal((n, dims)) * (0.6 / np.sqrt(dims))
+        return self._normalize(centers[rng.integers(0, len(centers), n)] + noise)
+
+    def _load(self, table, mode, embeddings, dims):
+        column_sql = f"halfvec({dims})" if mode == 'halfvec' else f"vector({dims})"
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(f"CREATE TABLE {table} (id bigint PRIMARY KEY, embedding {column_sql})")
+            buffer = io.StringIO()
+            for i, embedding in enumerate(embeddings, start=1):
+                buffer.write(f"{i}\t{to_vector_literal(embedding)}\n")
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {table} (id, embedding) FROM STDIN", buffer)
+            if mode == 'binary':
+                cursor.execute(
+                    f"CREATE INDEX ON {table} USING hnsw "
+                    f"((binary_quantize(embedding)::bit({dims})) bit_hamming_ops)"
+                )
+            else:
+                opclass = "halfvec_cosine_ops" if mode == 'halfvec' else "vector_cosine_ops"
+                cursor.execute(f"CREATE INDEX ON {table} USING hnsw (embedding {opclass})")
+            cursor.execute(f"ANALYZE {table}")
+
+    @staticmethod
+    def _sizes(table):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_table_size(%s::regclass), pg_indexes_size(%s::regclass)", [table, table])
+            table_size, index_size = cursor.fetchone()
+        return {"table": table_size, "index": index_size}
+
+    @staticmethod
+    def _search(table, mode, query, limit, dims, rescore_candidates):
+        literal = to_vector_literal(query)
+        with transaction.atomic(), connection.cursor() as cursor:
+            if mode == 'binary':
+                cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(rescore_candidates)])
+                cursor.execute(
+                    f"SELECT id FROM ("
+                    f"  SELECT id, embedding FROM {table}"
+                    f"  ORDER BY binary_quantize(embedding)::bit({dims}) <~> binary_quantize(%s::vector)::bit({dims})"
+                    f"  LIMIT %s"
+                    f") candidates ORDER BY embedding <=> %s::vector LIMIT %s",
+                    [literal, rescore_candidates, literal, limit],
+                )
+            else:
+                cast = f"halfvec({dims})" if mode == 'halfvec' else f"vector({dims})"
+                cursor.execute(
+                    f"SELECT id FROM {table} ORDER BY embedding <=> %s::{cast} LIMIT %s", [literal, limit]
+                )
+            return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,91 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from documents.chunk_storage import copy_insert_chunks
+from documents.models import Document, TextChunk
+from documents.text_processing import get_text_processor
+
+WORDS = (
+    "pump valve seal housing pressure flow sensor gasket bearing shaft motor "
+    "torque inspection warranty clause supplier delivery invoice liability"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare latency and recall@k of vector-only and hybrid search on a synthetic "
+        "corpus with exact identifiers. Benchmark rows are removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks', type=int, default=20_000)
+        parser.add_argument('--queries', type=int, default=100)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--dimensions', type=int, default=1536)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        dims, limit = options['dimensions'], options['limit']
+        embeddings = self._normalize(rng.standard_normal((options['chunks'], dims)))
+        identifiers = [f"PN-{i:06d}" for i in range(options['chunks'])]
+        rows = [
+            (i, f"Part number {identifiers[i]}: " + " ".join(rng.choice(WORDS, 40)), embeddings[i])
+            for i in range(options['chunks'])
+        ]
+
+        document = Document.objects.create(file='benchmark/hybrid_search.pdf')
+        try:
+            chunk_ids = copy_insert_chunks(document, rows)
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE documents_textchunk")
+
+            targets = rng.choice(len(rows), options['queries'], replace=False)
+            half = len(targets) // 2
+            # Identifier lookups: the embedding only weakly points at the target chunk.
+            # Semantic lookups: the embedding is close to the target, the text shares no terms.
+            query_sets = {
+                "identifier": [(identifiers[t], self._near(rng, embeddings[t], 0.1), t) for t in targets[:half]],
+                "semantic": [("unrelated wording", self._near(rng, embeddings[t], 0.8), t) for t in targets[half:]],
+            }
+
+            processor = get_text_processor()
+            for name, queries in query_sets.items():
+                for mode in ("vector", "hybrid"):
+                    timings, found = [], 0
+                    for text, embedding, target in queries:
+                        started = time.perf_counter()
+                        if mode == "vector":
+                            hits = self._vector_search(embedding, limit)
+                        else:
+                            result = processor.hybrid_search(text, limit, query_embedding=embedding)
+                            hits = [hit['chunk_id'] for hit in result['results']]
+                        timings.append((time.perf_counter() - started) * 1000)
+                        found += chunk_ids[target] in hits
+                    self.stdout.write(
+                        f"{name:<10} {mode:<6} p50={np.median(timings):7.2f}ms "
+                        f"p95={np.percentile(timings, 95):7.2f}ms recall@{limit}={found / len(queries):.3f}"
+                    )
+        finally:
+            TextChunk.objects.filter(document=document).delete()
+            document.delete()
+
+    @staticmethod
+    def _normalize(vectors):
+        return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+    def _near(self, rng, target, weight):
+        noise = self._normalize(rng.standard_normal(target.shape[0]))
+        return self._normalize(weight * target + (1 - weight) * noise).tolist()
+
+    @staticmethod
+    def _vector_search(embedding, limit):
+        from pgvector.django import CosineDistance
+        return list(
+            TextChunk.objects.annotate(distance=CosineDistance('embedding', embedding))
+            .order_by('distance')
+            .values_list('id', flat=True)[:limit]
+        )
@@ -0,0 +1,79 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from documents.chunk_storage import copy_insert_chunks
+from documents.models import Document, TextChunk
+from documents.text_processing import get_text_processor
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare latency and recall@k of exact pre-filtering, filtered ANN with over-fetch "
+        "and the automatic choice for selective and broad document scopes. "
+        "Benchmark rows are removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=200)
+        parser.add_argument('--chunks-per-document', type=int, default=100)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--dimensions', type=int, default=1536)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        dims, limit = options['dimensions'], options['limit']
+        per_document = options['chunks_per_document']
+
+        documents = Document.objects.bulk_create([
+            Document(file=f'benchmark/scoped_search_{i}.pdf', metadata={"benchmark": "scoped", "bucket": i % 10})
+            for i in range(options['documents'])
+        ])
+        try:
+            for document in documents:
+                embeddings = self._normalize(rng.standard_normal((per_document, dims)))
+                copy_insert_chunks(document, [
+                    (i, f"Chunk {i} of document {document.id}", embeddings[i]) for i in range(per_document)
+                ])
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE documents_textchunk")
+
+            scopes = {
+                "1 document": {"document_ids": [documents[0].id]},
+                "10% (metadata)": {"metadata": {"benchmark": "scoped", "bucket": 3}},
+                "50% (ids)": {"document_ids": [document.id for document in documents[::2]]},
+            }
+            queries = self._normalize(rng.standard_normal((options['queries'], dims)))
+
+            processor = get_text_processor()
+            for name, filters in scopes.items():
+                scope = processor.scope_documents(**filters)
+                chosen = processor._scoped_search_strategy(scope, limit)
+                truth = [
+                    {chunk.id for chunk in processor._query_similar_chunks(q, limit, scope=scope, strategy='exact')}
+                    for q in queries
+                ]
+                for strategy in ('exact', 'ann', None):
+                    timings, found = [], 0
+                    for query, expected in zip(queries, truth):
+                        started = time.perf_counter()
+                        chunks = processor._query_similar_chunks(query, limit, scope=scope, strategy=strategy)
+                        timings.append((time.perf_counter() - started) * 1000)
+                        found += len(expected & {chunk.id for chunk in chunks})
+                    label = strategy or f"auto({chosen})"
+                    self.stdout.write(
+                        f"{name:<15} {label:<12} p50={np.median(timings):7.2f}ms "
+                        f"p95={np.percentile(timings, 95):7.2f}ms "
+                        f"recall@{limit}={found / (len(queries) * limit):.3f}"
+                    )
+        finally:
+            TextChunk.objects.filter(document__in=documents).delete()
+            Document.objects.filter(id__in=[document.id for document in documents]).delete()
+
+    @staticmethod
+    def _normalize(vectors):
+        return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
@@ -0,0 +1,99 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from pgvector.django import CosineDistance
+
+from documents.models import Document, TextChunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare recall and latency of the HNSW index against an exact sequential "
+        "scan on synthetic chunks. Inserts benchmark rows and removes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--ef-search', type=int, nargs='+', default=[40, 100, 200])
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--dimensions', type=int, default=1536)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        dims = options['dimensions']
+        limit = options['limit']
+        queries = self._unit_vectors(rng, options['queries'], dims)
+
+        document = Document.objects.create(file='benchmark/vector_index.pdf')
+        try:
+            inserted = 0
+            for size in sorted(options['sizes']):
+                inserted = self._fill(document, rng, inserted, size, dims, options['batch_size'])
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE documents_textchunk")
+
+                exact_ids, exact_ms = self._run(queries, limit, exact=True)
+                self.stdout.write(
+                    f"rows={size:>9,} exact       p50={np.median(exact_ms):8.2f}ms "
+                    f"p95={np.percentile(exact_ms, 95):8.2f}ms recall@{limit}=1.000"
+                )
+                for ef_search in options['ef_search']:
+                    ann_ids, ann_ms = self._run(queries, limit, ef_search=ef_search)
+                    recall = np.mean([
+                        len(set(a) & set(e)) / max(len(e), 1)
+                        for a, e in zip(ann_ids, exact_ids)
+                    ])
+                    self.stdout.write(
+                        f"rows={size:>9,} hnsw ef={ef_search:<4} p50={np.median(ann_ms):8.2f}ms "
+                        f"p95={np.percentile(ann_ms, 95):8.2f}ms recall@{limit}={recall:.3f}"
+                    )
+        finally:
+            TextChunk.objects.filter(document=document).delete()
+            document.delete()
+
+    @staticmethod
+    def _unit_vectors(rng, n, dims):
+        vectors = rng.standard_normal((n, dims)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def _fill(self, document, rng, start, target, dims, batch_size):
+        """Insert synthetic chunks until the benchmark document holds `target` rows."""
+        for offset in range(start, target, batch_size):
+            count = min(batch_size, target - offset)
+            vectors = self._unit_vectors(rng, count, dims)
+            TextChunk.objects.bulk_create([
+                TextChunk(
+                    document=document,
+                    chunk_index=offset + i,
+                    text=f"benchmark chunk {offset + i}",
+                    embedding=vector,
+                )
+                for i, vector in enumerate(vectors)
+            ])
+        return target
+
+    @staticmethod
+    def _run(queries, limit, exact=False, ef_search=None):
+        ids, timings = [], []
+        for query in queries:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    if exact:
+                        # Plain index scans are the only way to use HNSW for ORDER BY
+                        cursor.execute("SET LOCAL enable_indexscan = off")
+                    else:
+                        cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(ef_search)])
+                started = time.perf_counter()
+                result = list(
+                    TextChunk.objects.annotate(distance=CosineDistance('embedding', query))
+                    .order_by('distance')
+                    .values_list('id', flat=True)[:limit]
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+            ids.append(result)
+        return ids, timings
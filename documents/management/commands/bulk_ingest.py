@@ -0,0 +1,92 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.bulk_ingestion import create_documents, is_archive, run_bulk_ingestion
+from documents.ingestion import claim_jobs
+from documents.models import IngestionJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Ingest many PDFs at once: files, directories (searched recursively) and zip/tar "
+        "archives of PDFs. Documents are extracted on a process pool and their chunks "
+        "embedded in requests shared across documents. With --queued, drains jobs "
+        "queued by the bulk upload endpoint instead. Prints one line per file and the "
+        "overall throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help="PDF files, directories or archives")
+        parser.add_argument('--metadata', default=None, help="JSON object stored on every document")
+        parser.add_argument('--processes', type=int, default=None,
+                            help="Extraction processes (default: BULK_INGEST_PROCESSES)")
+        parser.add_argument('--queued', action='store_true', help="Ingest queued jobs instead of paths")
+        parser.add_argument('--limit', type=int, default=None,
+                            help="With --queued, ingest at most this many jobs")
+
+    def handle(self, *args, **options):
+        try:
+            metadata = json.loads(options['metadata']) if options['metadata'] else {}
+        except ValueError as e:
+            raise CommandError(f"--metadata is not valid JSON: {str(e)}")
+        if not isinstance(metadata, dict):
+            raise CommandError("--metadata must be a JSON object")
+
+        started = time.perf_counter()
+        failed = 0
+        if options['queued']:
+            jobs = claim_jobs(options['limit'] or IngestionJob.objects.count(), bulk=True)
+        else:
+            if not options['paths']:
+                raise CommandError("Pass files, directories or archives to ingest, or --queued")
+            results, jobs = create_documents(self._iter_uploads(options['paths']), metadata, claim=True)
+            for result in results:
+                if result.job_id is None:
+                    failed += 1
+                    self.stderr.write(f"{result.file}: {result.status}, {result.error}")
+
+        processes = options['processes'] or settings.BULK_INGEST_PROCESSES
+        self.stdout.write(f"Ingesting {len(jobs)} documents with {processes} processes")
+        results = run_bulk_ingestion(jobs, processes=processes, on_result=self._report)
+
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        completed = [result for result in results if result.status == IngestionJob.STATUS_COMPLETED]
+        failed += len(results) - len(completed)
+        chunks = sum(result.chunks for result in completed)
+        pages = sum(result.pages for result in completed)
+        self.stdout.write(
+            f"{len(completed)} files ingested, {failed} failed in {elapsed:.1f}s: "
+            f"{len(completed) / elapsed:.2f} files/s, {pages / elapsed:.1f} pages/s, {chunks / elapsed:.1f} chunks/s"
+        )
+
+    def _report(self, result):
+        if result.status == IngestionJob.STATUS_COMPLETED:
+            self.stdout.write(
+                f"{result.file}: document {result.document_id}, {result.pages} pages, "
+                f"{result.chunks} chunks in {result.seconds:.2f}s"
+            )
+        else:
+            self.stderr.write(f"{result.file}: document {result.document_id} {result.status}, {result.error}")
+
+    def _iter_uploads(self, paths):
+        # Each file is open only while create_documents copies it
+        for path in self._iter_paths(paths):
+            with open(path, 'rb') as upload:
+                yield os.path.basename(path), upload
+
+    @staticmethod
+    def _iter_paths(paths):
+        for path in paths:
+            if os.path.isdir(path):
+                for root, _, names in sorted(os.walk(path)):
+                    for name in sorted(names):
+                        if name.lower().endswith('.pdf') or is_archive(name):
+                            yield os.path.join(root, name)
+            elif os.path.exists(path):
+                yield path
+            else:
+                raise CommandError(f"No such file or directory: {path}")
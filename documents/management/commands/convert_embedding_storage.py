@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from documents import vector_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert the stored chunk embeddings and their index to another storage mode "
+        "(vector, halfvec or binary). Set EMBEDDING_STORAGE to the same mode afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('mode', choices=vector_storage.STORAGE_MODES)
+        parser.add_argument('--dry-run', action='store_true', help="Print the SQL without running it")
+
+    def handle(self, *args, **options):
+        mode = options['mode']
+        statements = vector_storage.conversion_statements(mode, vector_storage.current_column_type())
+        if options['dry_run']:
+            for statement in statements:
+                self.stdout.write(f"{statement};")
+            return
+
+        before = vector_storage.relation_sizes()
+        try:
+            vector_storage.convert_storage(mode)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        after = vector_storage.relation_sizes()
+
+        for name in sorted(set(before) | set(after)):
+            self.stdout.write(
+                f"{name:<45} {before.get(name, 0) / 2**20:10.1f} MB -> {after.get(name, 0) / 2**20:10.1f} MB"
+            )
+        if settings.EMBEDDING_STORAGE != mode:
+            self.stdout.write(self.style.WARNING(f"Set EMBEDDING_STORAGE={mode} before serving searches"))
@@ -0,0 +1,58 @@
+import asyncio
+import json
+import time
+
+import httpx
+import numpy as np
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Send concurrent POST requests to an endpoint and report requests per second "
+        "and latency percentiles, e.g. to compare the WSGI and ASGI search/answer paths."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="e.g. http://localhost:8000/api/documents/search/async/")
+        parser.add_argument('--payload', default='{"query": "What is this document about?"}',
+                            help="JSON request body")
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--timeout', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        payload = json.loads(options['payload'])
+        latencies, errors, elapsed = asyncio.run(self._run(
+            options['url'], payload, options['requests'], options['concurrency'], options['timeout']
+        ))
+
+        self.stdout.write(f"{options['url']}")
+        self.stdout.write(
+            f"requests={len(latencies) + errors} errors={errors} concurrency={options['concurrency']} "
+            f"rps={len(latencies) / elapsed:.1f}"
+        )
+        if latencies:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            self.stdout.write(f"latency p50={p50:.1f}ms p95={p95:.1f}ms p99={p99:.1f}ms max={max(latencies):.1f}ms")
+
+    async def _run(self, url, payload, total, concurrency, timeout):
+        latencies, errors = [], 0
+        remaining = iter(range(total))
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+        async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+            async def worker():
+                nonlocal errors
+                for _ in remaining:
+                    started = time.perf_counter()
+                    try:
+                        response = await client.post(url, json=payload)
+                        response.raise_for_status()
+                        latencies.append((time.perf_counter() - started) * 1000)
+                    except httpx.HTTPError:
+                        errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            return latencies, errors, time.perf_counter() - started
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from documents.chunk_storage import insert_chunk_embeddings
+from documents.embedding_backends import cache_namespace
+from documents.embedding_cache import EmbeddingCache
+from documents.embedding_spaces import embedding_space, index_statement
+from documents.models import TextChunk
+from documents.text_processing import build_embeddings
+
+
+class Command(BaseCommand):
+    help = (
+        "Embed every chunk with another model and/or output size into ChunkEmbedding, "
+        "in batches and without locking the chunk table, then build the space's HNSW "
+        "index concurrently. Searches keep using the current space until "
+        "EMBEDDING_MODEL/EMBEDDING_DIMENSIONS point to the new one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=None, help="Embedding model, defaults to EMBEDDING_MODEL")
+        parser.add_argument('--dimensions', type=int, default=None,
+                            help="Output dimensions, defaults to the model's native size")
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--no-index', action='store_true', help="Skip building the HNSW index")
+
+    def handle(self, *args, **options):
+        try:
+            space = embedding_space(options['model'], options['dimensions'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if space.in_column:
+            raise CommandError(f"{space.key} is stored in TextChunk.embedding and needs no backfill")
+
+        batch_size = options['batch_size'] or settings.EMBEDDING_BACKFILL_BATCH_SIZE
+        embeddings = build_embeddings(space)
+        cache = EmbeddingCache(cache_namespace(space))
+        missing = TextChunk.objects.exclude(embeddings__space=space.key)
+        total = missing.count()
+        self.stdout.write(f"Embedding {total} chunks into {space.key} ({space.dimensions} dimensions)")
+
+        done, last_id = 0, 0
+        while True:
+            # Keyset pagination: each batch is a short query regardless of table size
+            batch = list(missing.filter(id__gt=last_id).order_by('id').values_list('id', 'text')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            texts = [text for _, text in batch]
+            if settings.EMBEDDING_CACHE_ENABLED:
+                vectors = cache.embed_documents(texts, embeddings.embed_documents)
+            else:
+                vectors = embeddings.embed_documents(texts)
+            insert_chunk_embeddings(space.key, zip([chunk_id for chunk_id, _ in batch], vectors))
+            done += len(batch)
+            self.stdout.write(f"{done}/{total} chunks embedded")
+
+        if not options['no_index']:
+            self.stdout.write(f"Building index {space.index_name}")
+            with connection.cursor() as cursor:
+                cursor.execute(index_statement(space))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Set EMBEDDING_MODEL={space.model}"
+            + (f" and EMBEDDING_DIMENSIONS={space.requested_dimensions}" if space.requested_dimensions else "")
+            + " to search this space"
+        ))
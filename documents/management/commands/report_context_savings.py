@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from documents.embedding_batching import count_tokens
+from documents.models import TextChunk
+from documents.text_processing import CHAT_MODEL, TextProcessor
+
+
+class Command(BaseCommand):
+    help = (
+        "Answer queries over the stored documents with the top_k and mmr context "
+        "strategies and report prompt tokens and end-to-end answer latency of each. "
+        "The answer cache is bypassed. Latency includes the configured LLM_BACKEND."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*')
+        parser.add_argument('--queries-file', help="File with one query per line")
+
+    def handle(self, *args, **options):
+        queries = list(options['queries'])
+        if options['queries_file']:
+            with open(options['queries_file'], encoding='utf-8') as f:
+                queries += [line.strip() for line in f if line.strip()]
+        if not queries:
+            raise CommandError("Pass queries as arguments or with --queries-file")
+        if not TextChunk.objects.exists():
+            raise CommandError("No chunks stored, upload some documents first")
+
+        processor = TextProcessor()
+        report = {}
+        for strategy in ('top_k', 'mmr'):
+            with override_settings(ANSWER_CONTEXT_STRATEGY=strategy, ANSWER_CACHE_ENABLED=False):
+                tokens, chunks, timings = [], [], []
+                for query in queries:
+                    context, sources = processor.build_context(query)
+                    tokens.append(count_tokens(processor.build_answer_prompt(query, context), CHAT_MODEL))
+                    chunks.append(len(sources))
+                    started = time.perf_counter()
+                    processor.answer_query(query)
+                    timings.append((time.perf_counter() - started) * 1000)
+            report[strategy] = (np.mean(tokens), np.median(timings))
+            self.stdout.write(
+                f"{strategy:<6} prompt tokens={np.mean(tokens):8.1f} chunks={np.mean(chunks):4.1f} "
+                f"answer p50={np.median(timings):8.2f}ms p95={np.percentile(timings, 95):8.2f}ms"
+            )
+
+        (top_k_tokens, top_k_latency), (mmr_tokens, mmr_latency) = report['top_k'], report['mmr']
+        self.stdout.write(
+            f"mmr vs top_k: {top_k_tokens - mmr_tokens:+.1f} prompt tokens saved per answer "
+            f"({(top_k_tokens - mmr_tokens) / top_k_tokens:.1%}), "
+            f"latency {mmr_latency - top_k_latency:+.2f}ms at p50"
+        )
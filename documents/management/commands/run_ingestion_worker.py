@@ -0,0 +1,109 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents import metrics, workers
+from documents.ingestion import claim_jobs, claim_next_job, requeue_stale_jobs
+from documents.purge import claim_next_purge_job, requeue_stale_purge_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued document ingestion and purge jobs with a local process pool. "
+        "Jobs of bulk uploads are run in batches of up to INGESTION_WORKER_BULK_BATCH "
+        "documents whose embedding requests are pooled. "
+        "The stage timings and counters of the jobs are served on /metrics of --metrics-port."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help="Number of worker processes (default: INGESTION_WORKER_PROCESSES)")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Seconds to wait between polls when the queue is empty")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is drained instead of polling forever")
+        parser.add_argument('--metrics-port', type=int, default=None,
+                            help="Port of the /metrics endpoint, 0 to disable "
+                                 "(default: INGESTION_WORKER_METRICS_PORT)")
+
+    def handle(self, *args, **options):
+        processes = options['processes'] or settings.INGESTION_WORKER_PROCESSES
+        poll_interval = options['poll_interval']
+        metrics_port = options['metrics_port']
+        if metrics_port is None:
+            metrics_port = settings.INGESTION_WORKER_METRICS_PORT
+        self.stdout.write(f"Starting ingestion worker with {processes} processes")
+        metrics_server = None
+        if metrics_port:
+            metrics_server = metrics.start_http_server(metrics_port)
+            self.stdout.write(f"Serving metrics on port {metrics_server.server_address[1]}")
+
+        pool = self._make_pool(processes)
+        in_flight = {}
+        try:
+            while True:
+                requeue_stale_jobs()
+                requeue_stale_purge_jobs()
+
+                # Keep every process busy while there is queued work
+                while len(in_flight) < processes:
+                    purge = claim_next_purge_job()
+                    if purge is not None:
+                        in_flight[pool.submit(workers.run_purge_job, purge.id)] = f"purge-{purge.id}"
+                        self.stdout.write(f"Started purge job {purge.id}")
+                        continue
+                    job = claim_next_job()
+                    if job is None:
+                        break
+                    if job.bulk:
+                        jobs = [job] + claim_jobs(settings.INGESTION_WORKER_BULK_BATCH - 1, bulk=True)
+                        job_ids = [job.id for job in jobs]
+                        label = f"bulk-{job_ids[0]}" + (f"..{job_ids[-1]}" if len(jobs) > 1 else "")
+                        in_flight[pool.submit(workers.run_bulk_ingestion, job_ids)] = label
+                        self.stdout.write(f"Started {len(jobs)} bulk upload jobs {label}")
+                        continue
+                    in_flight[pool.submit(workers.run_ingestion_job, job.id)] = job.id
+                    self.stdout.write(f"Started job {job.id} for document {job.document_id}")
+
+                if not in_flight:
+                    if options['once']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job_id = in_flight.pop(future)
+                    try:
+                        job_status, job_metrics = future.result()
+                    except Exception as e:
+                        # The job stays "running" and is requeued once its heartbeat times out
+                        self.stderr.write(f"Job {job_id} crashed its worker: {str(e)}")
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        continue
+                    metrics.merge(job_metrics)
+                    self.stdout.write(f"Job {job_id} finished: {job_status}")
+                if broken:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    in_flight.clear()
+                    pool = self._make_pool(processes)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping ingestion worker")
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            if metrics_server is not None:
+                metrics_server.shutdown()
+
+    @staticmethod
+    def _make_pool(processes):
+        # "spawn" keeps children from inheriting the parent's database connections
+        return ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=workers.init_django,
+        )
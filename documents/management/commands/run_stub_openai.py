@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from documents.stub_openai import start_stub_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stub of the OpenAI embeddings and chat APIs with artificial "
+        "latency. Start the app with OPENAI_BASE_URL=http://<host>:<port>/v1 to use it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument('--dimensions', type=int, default=1536)
+        parser.add_argument('--embedding-latency', type=float, default=0.05)
+        parser.add_argument('--chat-latency', type=float, default=0.5)
+        parser.add_argument('--rate-limit', type=int, default=0,
+                            help="Embedding requests per second before answering 429 (0 = unlimited)")
+
+    def handle(self, *args, **options):
+        server = start_stub_server(
+            host=options['host'],
+            port=options['port'],
+            dimensions=options['dimensions'],
+            embedding_latency=options['embedding_latency'],
+            chat_latency=options['chat_latency'],
+            rate_limit=options['rate_limit'],
+        )
+        host, port = server.server_address
+        self.stdout.write(f"Stub OpenAI API listening on http://{host}:{port}/v1")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
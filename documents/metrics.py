@@ -0,0 +1,285 @@
+"""
+Stage timings and counters of the upload, ingestion, search and answer
+pipelines, exposed in the Prometheus text format on /metrics.
+
+Metrics are kept per process in plain dicts behind a lock: recording a span
+costs two perf_counter() calls and a bisect, so instrumentation stays on in
+production. Each web worker process serves its own numbers. Processes that
+serve no requests, e.g. the children of the ingestion worker's pool, drain()
+what they recorded and hand it to a parent that merge()s it and serves it with
+start_http_server().
+
+Spans that finish while a request is handled are also collected for its
+Server-Timing header (see ServerTimingMiddleware).
+"""
+from django.conf import settings
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Upper bounds in seconds, from a cache hit to a slow LLM answer or a large PDF
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+LabelValues = Tuple[Tuple[str, str], ...]
+# (histograms, counters) recorded in one process, as returned by drain()
+Snapshot = Tuple[Dict[str, Tuple[str, Dict[LabelValues, List[float]]]], Dict[str, Tuple[str, Dict[LabelValues, float]]]]
+
+_lock = threading.Lock()
+# name -> (help, {labels: [bucket counts..., +Inf count, sum]})
+_histograms: Dict[str, Tuple[str, Dict[LabelValues, List[float]]]] = {}
+# name -> (help, {labels: value})
+_counters: Dict[str, Tuple[str, Dict[LabelValues, float]]] = {}
+# Callables returning (name, help, labels, value) of counters owned elsewhere
+_collectors: List[Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]] = []
+
+_DONE = object()
+
+# Spans of the request being handled: [(stage, seconds)], or None outside requests
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('request_spans', default=None)
+
+
+def _label_values(labels: Dict[str, str]) -> LabelValues:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def observe(name: str, value: float, help: str = "", **labels):
+    """Add a value to a histogram with DURATION_BUCKETS"""
+    key = _label_values(labels)
+    index = bisect_left(DURATION_BUCKETS, value)
+    with _lock:
+        _, series = _histograms.setdefault(name, (help, {}))
+        buckets = series.get(key)
+        if buckets is None:
+            buckets = series[key] = [0.0] * (len(DURATION_BUCKETS) + 2)
+        buckets[index] += 1  # cumulated when rendered
+        buckets[-1] += value
+
+
+def increment(name: str, value: float = 1, help: str = "", **labels):
+    key = _label_values(labels)
+    with _lock:
+        _, series = _counters.setdefault(name, (help, {}))
+        series[key] = series.get(key, 0) + value
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]):
+    """Export counters kept by another module, read when /metrics is rendered"""
+    _collectors.append(collector)
+
+
+def record(stage: str, seconds: float):
+    """Record the duration of a pipeline stage"""
+    observe('pipeline_stage_duration_seconds', seconds, help="Duration of pipeline stages", stage=stage)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    """Time the enclosed block as a pipeline stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+class StageTimer:
+    """
+    Accumulate the time of many short blocks into one stage, e.g. cleaning
+    pages or pulling pages from the extractor while they are interleaved
+    with chunking.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.total = 0.0
+
+    @contextmanager
+    def measure(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.total += time.perf_counter() - started
+
+    def iterate(self, iterable: Iterable) -> Iterator:
+        """Yield from iterable, counting the time spent producing each item"""
+        iterator = iter(iterable)
+        while True:
+            with self.measure():
+                item = next(iterator, _DONE)
+            if item is _DONE:
+                return
+            yield item
+
+    def record(self):
+        record(self.stage, self.total)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: LabelValues, extra: LabelValues = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format 0.0.4"""
+    lines = []
+    with _lock:
+        histograms = {
+            name: (help, {labels: list(buckets) for labels, buckets in series.items()})
+            for name, (help, series) in _histograms.items()
+        }
+        counters = {name: (help, dict(series)) for name, (help, series) in _counters.items()}
+
+    for collector in _collectors:
+        for name, help, labels, value in collector():
+            _, series = counters.setdefault(name, (help, {}))
+            series[_label_values(labels)] = value
+
+    for name, (help, series) in sorted(histograms.items()):
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, buckets in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS + (float('inf'),), buckets):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', le),))} {int(cumulative)}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {buckets[-1]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {int(cumulative)}")
+
+    for name, (help, series) in sorted(counters.items()):
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in sorted(series.items()):
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Forget every recorded value (tests)"""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def drain() -> Snapshot:
+    """Remove and return the histograms and counters recorded so far, to merge() in another process"""
+    global _histograms, _counters
+    with _lock:
+        snapshot = (_histograms, _counters)
+        _histograms, _counters = {}, {}
+    return snapshot
+
+
+def merge(snapshot: Snapshot):
+    """Add the values of a drain() from another process to this one's"""
+    histograms, counters = snapshot
+    with _lock:
+        for name, (help, series) in histograms.items():
+            _, own = _histograms.setdefault(name, (help, {}))
+            for labels, buckets in series.items():
+                total = own.setdefault(labels, [0.0] * len(buckets))
+                for index, value in enumerate(buckets):
+                    total[index] += value
+        for name, (help, series) in counters.items():
+            _, own = _counters.setdefault(name, (help, {}))
+            for labels, value in series.items():
+                own[labels] = own.get(labels, 0) + value
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_http_server(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """
+    Serve /metrics on a background thread, for processes without a web
+    server such as the ingestion worker. Port 0 picks a free port.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def server_timing(spans: List[Tuple[str, float]]) -> str:
+    """Server-Timing header value, durations in milliseconds"""
+    return ", ".join(f"{stage.replace('.', '-')};dur={seconds * 1000:.1f}" for stage, seconds in spans)
+
+
+class ServerTimingMiddleware:
+    """
+    Count and time every request by route and status, and collect the spans
+    recorded while handling it. With SERVER_TIMING_ENABLED they are sent in a
+    Server-Timing header (streamed responses only get the spans finished
+    before the first byte).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        spans, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_spans.reset(token)
+        return self._finish(request, response, spans, started)
+
+    async def __acall__(self, request):
+        spans, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_spans.reset(token)
+        return self._finish(request, response, spans, started)
+
+    @staticmethod
+    def _start():
+        spans = []
+        return spans, _request_spans.set(spans), time.perf_counter()
+
+    @staticmethod
+    def _finish(request, response, spans, started):
+        elapsed = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        # The route pattern, not the path, so ids don't multiply the series
+        route = match.route if match is not None else "unmatched"
+        observe('http_request_duration_seconds', elapsed, help="Duration of HTTP requests",
+                method=request.method, route=route, status=response.status_code)
+        if settings.SERVER_TIMING_ENABLED:
+            response['Server-Timing'] = server_timing(spans + [("total", elapsed)])
+        return response
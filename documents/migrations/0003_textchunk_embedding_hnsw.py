@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 11:58
+
+import pgvector.django.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_textchunk'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='textchunk',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='textchunk_embedding_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+    ]
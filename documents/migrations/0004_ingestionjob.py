@@ -0,0 +1,50 @@
+# Generated by Django 5.1.6 on 2026-10-17 11:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0003_textchunk_embedding_hnsw'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('stage', models.CharField(choices=[('queued', 'Queued'), ('extracting', 'Extracting text'), ('chunking', 'Chunking'), ('embedding', 'Generating embeddings'), ('storing', 'Storing chunks'), ('done', 'Done')], default='queued', max_length=16)),
+                ('pages_total', models.IntegerField(default=0)),
+                ('pages_done', models.IntegerField(default=0)),
+                ('chunks_total', models.IntegerField(default=0)),
+                ('chunks_done', models.IntegerField(default=0)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingestion_jobs', to='documents.document')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IngestionPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.IntegerField()),
+                ('text', models.TextField(blank=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='documents.ingestionjob')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ingestionjob',
+            index=models.Index(fields=['status', 'created_at'], name='documents_i_status_5c65bb_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingestionpage',
+            constraint=models.UniqueConstraint(fields=('job', 'page_number'), name='unique_ingestion_page'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:08
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_embeddingcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='textchunk',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector('text', config='english'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='textchunk',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='textchunk_search_vector_gin'),
+        ),
+    ]
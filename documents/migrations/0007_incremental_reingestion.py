@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_textchunk_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='chunks_added',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='chunks_removed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='chunks_reused',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='textchunk',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        # Backfill hashes of existing chunks so they can be reused on re-ingestion
+        migrations.RunSQL(
+            sql="UPDATE documents_textchunk SET content_hash = encode(sha256(convert_to(text, 'UTF8')), 'hex')",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:20
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_purgejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='metadata',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['metadata'], name='document_metadata_gin', opclasses=['jsonb_path_ops']),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:30
+
+import django.db.models.deletion
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_document_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='textchunk',
+            name='embedding',
+            field=pgvector.django.vector.VectorField(dimensions=1536, null=True),
+        ),
+        migrations.CreateModel(
+            name='ChunkEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('space', models.CharField(max_length=100)),
+                ('embedding', pgvector.django.vector.VectorField()),
+                ('chunk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='documents.textchunk')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('space', 'chunk'), name='unique_chunk_embedding_space')],
+            },
+        ),
+    ]
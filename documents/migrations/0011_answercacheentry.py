@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:46
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_chunkembedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('chunk_key', models.CharField(max_length=64)),
+                ('query', models.TextField()),
+                ('query_embedding', pgvector.django.vector.VectorField()),
+                ('document_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None)),
+                ('answer', models.TextField()),
+                ('generation_seconds', models.FloatField(default=0)),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['chunk_key'], name='documents_a_chunk_k_6857cd_idx'), models.Index(fields=['created_at'], name='documents_a_created_8e5310_idx'), models.Index(fields=['last_used_at'], name='documents_a_last_us_f7d023_idx'), django.contrib.postgres.indexes.GinIndex(fields=['document_ids'], name='answercache_document_ids_gin')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_document_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='bulk',
+            field=models.BooleanField(default=False),
+        ),
+    ]
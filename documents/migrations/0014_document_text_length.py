@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-17 13:31
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_ingestionjob_bulk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='text_length',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Length('extracted_text'), output_field=models.IntegerField()),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-17 13:34
+
+from django.db import migrations, models
+
+
+def fail_superseded_jobs(apps, schema_editor):
+    """Keep only the newest queued or running job of each document."""
+    IngestionJob = apps.get_model('documents', 'IngestionJob')
+    active = IngestionJob.objects.filter(status__in=['queued', 'running']).order_by('document_id', '-created_at')
+    seen = set()
+    superseded = []
+    for job_id, document_id in active.values_list('id', 'document_id'):
+        if document_id in seen:
+            superseded.append(job_id)
+        seen.add(document_id)
+    IngestionJob.objects.filter(id__in=superseded).update(
+        status='failed', error='Superseded by a newer job for the same document'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0014_document_text_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_superseded_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingestionjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('document',), name='one_active_ingestion_job_per_document'),
+        ),
+    ]
@@ -1,11 +1,32 @@
 from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db.models.functions import Length
 import numpy as np
-from pgvector.django import VectorField
+from pgvector.django import VectorField, HnswIndex
 
 class Document(models.Model):
     file = models.FileField(upload_to='documents/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     extracted_text = models.TextField(blank=True)
+    # Characters of extracted_text, maintained by Postgres when the text is written so
+    # listings never detoast the text to count it
+    text_length = models.GeneratedField(
+        expression=Length('extracted_text'),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
+    # SHA-256 of the file, computed while it is uploaded; an upload of the same
+    # bytes returns this document instead of being ingested again
+    content_hash = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    # Free-form attributes (tenant, tags, ...) that searches can be scoped by
+    metadata = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        indexes = [
+            GinIndex(name="document_metadata_gin", fields=["metadata"], opclasses=["jsonb_path_ops"]),
+        ]
     
     def __str__(self):
         return f"Document {self.id} - {self.file.name}"
@@ -14,19 +35,212 @@ class TextChunk(models.Model):
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
     chunk_index = models.IntegerField()
     text = models.TextField()
-    embedding = VectorField(dimensions=1536)  # For OpenAI embeddings
+    content_hash = models.CharField(max_length=64, blank=True, default='')  # SHA-256 of text
+    # Vector of EMBEDDING_COLUMN_MODEL; empty when chunks are embedded in another space
+    embedding = VectorField(dimensions=1536, null=True)
+    # Full-text search document maintained by Postgres for lexical/hybrid search
+    search_vector = models.GeneratedField(
+        expression=SearchVector('text', config='english'),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
     
     class Meta:
         indexes = [
             models.Index(fields=["document"]),
-            # Vector index will be added in a separate migration
+            # Approximate nearest neighbour index for cosine similarity search
+            HnswIndex(
+                name="textchunk_embedding_hnsw",
+                fields=["embedding"],
+                m=16,
+                ef_construction=64,
+                opclasses=["vector_cosine_ops"],
+            ),
+            GinIndex(name="textchunk_search_vector_gin", fields=["search_vector"]),
         ]
     
     def set_embedding(self, embedding_list):
         """Convert list to NumPy array before storing"""
-        if len(embedding_list) != 1536:  # Check for OpenAI's embedding dimension
-            raise ValueError(f"Expected embedding dimension 1536, got {len(embedding_list)}")
+        dimensions = self._meta.get_field('embedding').dimensions
+        if len(embedding_list) != dimensions:
+            raise ValueError(f"Expected embedding dimension {dimensions}, got {len(embedding_list)}")
         self.embedding = np.array(embedding_list)
     
     def __str__(self):
-        return f"Chunk {self.chunk_index} of Document {self.document.id}"
\ No newline at end of file
+        return f"Chunk {self.chunk_index} of Document {self.document.id}"
+
+class ChunkEmbedding(models.Model):
+    """
+    Embedding of a chunk in an embedding space other than TextChunk.embedding,
+    i.e. another model or output size. Each space gets its own partial HNSW
+    index on embedding::vector(dimensions), created by reembed_chunks.
+    """
+    chunk = models.ForeignKey(TextChunk, on_delete=models.CASCADE, related_name='embeddings')
+    space = models.CharField(max_length=100)  # EmbeddingSpace.key, e.g. "text-embedding-3-small:512"
+    embedding = VectorField()  # Dimensions vary by space
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["space", "chunk"], name="unique_chunk_embedding_space"),
+        ]
+
+    def __str__(self):
+        return f"{self.space} embedding of chunk {self.chunk_id}"
+
+class IngestionJob(models.Model):
+    """Background job that extracts, chunks and embeds an uploaded document."""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    STAGE_QUEUED = 'queued'
+    STAGE_EXTRACTING = 'extracting'
+    STAGE_CHUNKING = 'chunking'
+    STAGE_EMBEDDING = 'embedding'
+    STAGE_STORING = 'storing'
+    STAGE_DONE = 'done'
+    STAGE_CHOICES = [
+        (STAGE_QUEUED, 'Queued'),
+        (STAGE_EXTRACTING, 'Extracting text'),
+        (STAGE_CHUNKING, 'Chunking'),
+        (STAGE_EMBEDDING, 'Generating embeddings'),
+        (STAGE_STORING, 'Storing chunks'),
+        (STAGE_DONE, 'Done'),
+    ]
+
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='ingestion_jobs')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    stage = models.CharField(max_length=16, choices=STAGE_CHOICES, default=STAGE_QUEUED)
+    pages_total = models.IntegerField(default=0)
+    pages_done = models.IntegerField(default=0)
+    chunks_total = models.IntegerField(default=0)
+    chunks_done = models.IntegerField(default=0)
+    # Outcome of diffing the new chunks against the stored ones by content hash
+    chunks_reused = models.IntegerField(default=0)
+    chunks_added = models.IntegerField(default=0)
+    chunks_removed = models.IntegerField(default=0)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    # Created by a bulk upload: the worker ingests these in batches whose embedding requests are pooled
+    bulk = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Doubles as the worker heartbeat
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+        constraints = [
+            # Two jobs re-chunking the same document would race in sync_document_chunks
+            models.UniqueConstraint(
+                fields=["document"],
+                condition=models.Q(status__in=["queued", "running"]),
+                name="one_active_ingestion_job_per_document",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Ingestion job {self.id} for Document {self.document_id} ({self.status})"
+
+
+class IngestionPage(models.Model):
+    """Checkpoint of one extracted PDF page so a crashed job can resume."""
+    job = models.ForeignKey(IngestionJob, on_delete=models.CASCADE, related_name='pages')
+    page_number = models.IntegerField()
+    text = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["job", "page_number"], name="unique_ingestion_page"),
+        ]
+
+    def __str__(self):
+        return f"Page {self.page_number} of ingestion job {self.job_id}"
+
+
+class PurgeJob(models.Model):
+    """Background deletion of every document uploaded up to max_document_id."""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = IngestionJob.STATUS_CHOICES
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    # Documents uploaded after the purge was requested are left alone
+    max_document_id = models.BigIntegerField(default=0)
+    documents_total = models.IntegerField(default=0)
+    documents_done = models.IntegerField(default=0)
+    chunks_deleted = models.BigIntegerField(default=0)
+    files_deleted = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Doubles as the worker heartbeat
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"Purge job {self.id} up to Document {self.max_document_id} ({self.status})"
+
+
+class EmbeddingCacheEntry(models.Model):
+    """Embedding of a piece of text, keyed by embedding model and SHA-256 of the text."""
+    model_name = models.CharField(max_length=100)
+    text_hash = models.CharField(max_length=64)
+    embedding = VectorField()  # No fixed dimensions so any embedding model can be cached
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["model_name", "text_hash"], name="unique_embedding_cache_key"),
+        ]
+        indexes = [
+            models.Index(fields=["last_used_at"]),
+        ]
+
+    def __str__(self):
+        return f"Cached {self.model_name} embedding {self.text_hash[:12]}"
+
+
+class AnswerCacheEntry(models.Model):
+    """
+    LLM answer keyed by the normalized query and the ids of the chunks it was
+    generated from. Entries of a document are deleted when its chunks change.
+    """
+    key = models.CharField(max_length=64, unique=True)  # SHA-256 of chunk_key and query
+    chunk_key = models.CharField(max_length=64)  # SHA-256 of the namespace and sorted chunk ids
+    query = models.TextField()  # Normalized query
+    query_embedding = VectorField()  # No fixed dimensions, compared within a chunk_key only
+    document_ids = ArrayField(models.BigIntegerField())
+    answer = models.TextField()
+    generation_seconds = models.FloatField(default=0)  # LLM time a hit saves
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["chunk_key"]),
+            models.Index(fields=["created_at"]),
+            models.Index(fields=["last_used_at"]),
+            GinIndex(name="answercache_document_ids_gin", fields=["document_ids"]),
+        ]
+
+    def __str__(self):
+        return f"Cached answer {self.key[:12]} ({self.hits} hits)"
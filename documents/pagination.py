@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ChunkCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a document's chunks. Unlike offset pagination the
+    cost of a page does not grow with its position and no COUNT(*) is run.
+    """
+    ordering = ('chunk_index', 'id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
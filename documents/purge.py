@@ -0,0 +1,183 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, QuerySet
+from django.utils import timezone
+from datetime import timedelta
+import logging
+from typing import Callable, Dict, Optional
+from .models import (
+    Document, TextChunk, ChunkEmbedding, IngestionJob, IngestionPage, PurgeJob, AnswerCacheEntry,
+)
+from .answer_cache import invalidate_documents
+
+logger = logging.getLogger(__name__)
+
+
+def delete_in_batches(queryset: QuerySet, batch_size: Optional[int] = None) -> int:
+    """
+    Delete the rows of queryset with DELETEs of at most batch_size rows.
+    Only ids are read, and each batch is its own short statement, so neither
+    memory nor lock time grows with the number of rows.
+    """
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    model = queryset.model
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by().values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        count, _ = model.objects.filter(id__in=ids).only('id').delete()
+        deleted += count
+
+
+def delete_documents(documents: QuerySet, batch_size: Optional[int] = None,
+                     on_progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+    """
+    Delete documents together with their chunks, ingestion jobs and uploaded
+    files. Dependent rows are removed bottom-up in batches before the
+    documents themselves, so Django's collector never has anything to cascade.
+    """
+    document_batch_size = settings.PURGE_DOCUMENT_BATCH_SIZE
+    counts = {"documents": 0, "chunks": 0, "files": 0}
+    last_id = 0
+    while True:
+        batch = list(
+            documents.filter(id__gt=last_id).order_by('id').values_list('id', 'file')[:document_batch_size]
+        )
+        if not batch:
+            return counts
+        ids = [document_id for document_id, _ in batch]
+        last_id = ids[-1]
+
+        invalidate_documents(ids)
+        delete_in_batches(ChunkEmbedding.objects.filter(chunk__document_id__in=ids), batch_size)
+        counts["chunks"] += delete_in_batches(TextChunk.objects.filter(document_id__in=ids), batch_size)
+        delete_in_batches(IngestionPage.objects.filter(job__document_id__in=ids), batch_size)
+        IngestionJob.objects.filter(document_id__in=ids).delete()
+        counts["documents"] += Document.objects.filter(id__in=ids).only('id').delete()[0]
+
+        # Files go last: a failure above leaves documents that still have their file
+        for _, name in batch:
+            if name and delete_file(name):
+                counts["files"] += 1
+
+        if on_progress is not None:
+            on_progress(counts)
+
+
+def delete_file(name: str) -> bool:
+    """Delete an uploaded file from storage. Returns whether it existed."""
+    storage = Document._meta.get_field('file').storage
+    try:
+        if not storage.exists(name):
+            return False
+        storage.delete(name)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not delete uploaded file {name}: {str(e)}")
+        return False
+
+
+def truncate_documents() -> Dict[str, int]:
+    """
+    Empty every document table with TRUNCATE and delete the upload directory's
+    files. Much faster than DELETE, but it briefly takes an exclusive lock on
+    the tables, so concurrent searches wait until it commits.
+    """
+    counts = {"documents": Document.objects.count(), "chunks": 0, "files": 0}
+    tables = ", ".join(
+        model._meta.db_table
+        for model in (Document, TextChunk, ChunkEmbedding, IngestionJob, IngestionPage, AnswerCacheEntry)
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        # TRUNCATE refuses to run while deferred foreign key checks of the
+        # surrounding transaction are still pending
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"TRUNCATE {tables}")
+
+    storage = Document._meta.get_field('file').storage
+    upload_to = Document._meta.get_field('file').upload_to
+    try:
+        _, files = storage.listdir(upload_to)
+    except FileNotFoundError:
+        files = []
+    for name in files:
+        if delete_file(f"{upload_to.rstrip('/')}/{name}"):
+            counts["files"] += 1
+    return counts
+
+
+def enqueue_purge() -> PurgeJob:
+    """Queue a background purge of every document uploaded so far."""
+    max_document_id = Document.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    job = PurgeJob.objects.create(
+        max_document_id=max_document_id,
+        documents_total=Document.objects.filter(id__lte=max_document_id).count(),
+    )
+    logger.info(f"Queued purge job {job.id} for documents up to {max_document_id}")
+    return job
+
+
+def claim_next_purge_job() -> Optional[PurgeJob]:
+    """Atomically mark the oldest queued purge job as running and return it."""
+    with transaction.atomic():
+        job = (
+            PurgeJob.objects.select_for_update(skip_locked=True)
+            .filter(status=PurgeJob.STATUS_QUEUED)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = PurgeJob.STATUS_RUNNING
+        job.error = ''
+        job.started_at = job.started_at or timezone.now()
+        job.save()
+        return job
+
+
+def requeue_stale_purge_jobs(timeout: Optional[int] = None) -> int:
+    """Requeue running purge jobs whose heartbeat stopped. Purges are idempotent."""
+    timeout = timeout or settings.INGESTION_JOB_TIMEOUT
+    now = timezone.now()
+    requeued = PurgeJob.objects.filter(
+        status=PurgeJob.STATUS_RUNNING,
+        updated_at__lt=now - timedelta(seconds=timeout),
+    ).update(status=PurgeJob.STATUS_QUEUED, updated_at=now)
+    if requeued:
+        logger.warning(f"Requeued {requeued} stale purge jobs")
+    return requeued
+
+
+def run_purge_job(job_id: int) -> PurgeJob:
+    """Delete the documents of a purge job, saving progress after every batch."""
+    job = PurgeJob.objects.get(pk=job_id)
+    # A requeued job continues from what an earlier attempt already deleted
+    done_before = job.documents_done
+    chunks_before = job.chunks_deleted
+    files_before = job.files_deleted
+
+    def on_progress(counts):
+        job.documents_done = done_before + counts["documents"]
+        job.chunks_deleted = chunks_before + counts["chunks"]
+        job.files_deleted = files_before + counts["files"]
+        job.save(update_fields=['documents_done', 'chunks_deleted', 'files_deleted', 'updated_at'])
+
+    try:
+        counts = delete_documents(Document.objects.filter(id__lte=job.max_document_id), on_progress=on_progress)
+        job.status = PurgeJob.STATUS_COMPLETED
+        job.finished_at = timezone.now()
+        job.save()
+        logger.info(
+            f"Purge job {job.id} deleted {counts['documents']} documents, "
+            f"{counts['chunks']} chunks and {counts['files']} files"
+        )
+    except Exception as e:
+        logger.error(f"Purge job {job.id} failed: {str(e)}")
+        job.status = PurgeJob.STATUS_FAILED
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save()
+
+    return job
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Document, TextChunk
+import json
+from .models import Document, TextChunk, IngestionJob, PurgeJob
 
 class TextChunkSerializer(serializers.ModelSerializer):
     class Meta:
@@ -7,9 +8,63 @@ class TextChunkSerializer(serializers.ModelSerializer):
         fields = ['id', 'chunk_index', 'text']
 
 class DocumentSerializer(serializers.ModelSerializer):
-    chunks = TextChunkSerializer(many=True, read_only=True)
+    """Full document with its extracted text. Chunks are listed by the chunks endpoint."""
+    chunk_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Document
-        fields = ['id', 'file', 'uploaded_at', 'extracted_text', 'chunks']
-        read_only_fields = ['extracted_text', 'chunks']
\ No newline at end of file
+        fields = ['id', 'file', 'uploaded_at', 'metadata', 'content_hash', 'extracted_text', 'chunk_count']
+        read_only_fields = ['content_hash', 'extracted_text', 'chunk_count']
+    
+    def validate_metadata(self, metadata):
+        # Multipart uploads carry the metadata object as a JSON string
+        if isinstance(metadata, str):
+            try:
+                metadata = json.loads(metadata)
+            except ValueError:
+                raise serializers.ValidationError("Metadata must be a JSON object")
+        if not isinstance(metadata, dict):
+            raise serializers.ValidationError("Metadata must be a JSON object")
+        return metadata
+    
+    def get_chunk_count(self, document):
+        # Annotated by the viewset queryset, counted on demand otherwise
+        count = getattr(document, 'chunk_count', None)
+        return document.chunks.count() if count is None else count
+
+class DocumentSummarySerializer(serializers.ModelSerializer):
+    """Document list entry: counts instead of the text and chunk bodies"""
+    chunk_count = serializers.IntegerField(read_only=True)
+    text_length = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = Document
+        fields = ['id', 'file', 'uploaded_at', 'metadata', 'chunk_count', 'text_length']
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = IngestionJob
+        fields = ['id', 'document', 'status', 'stage', 'progress', 'attempts', 'error',
+                  'created_at', 'updated_at', 'started_at', 'finished_at']
+    
+    def get_progress(self, job):
+        """Per-stage progress counters"""
+        return {
+            'pages': {'done': job.pages_done, 'total': job.pages_total},
+            'chunks': {
+                'done': job.chunks_done,
+                'total': job.chunks_total,
+                'reused': job.chunks_reused,
+                'added': job.chunks_added,
+                'removed': job.chunks_removed,
+            },
+        }
+
+class PurgeJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PurgeJob
+        fields = ['id', 'status', 'max_document_id', 'documents_total', 'documents_done',
+                  'chunks_deleted', 'files_deleted', 'error',
+                  'created_at', 'updated_at', 'started_at', 'finished_at']
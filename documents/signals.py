@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .answer_cache import invalidate_documents
+from .models import Document, TextChunk
+
+# Bulk writes (ingestion, purge) invalidate the answer cache themselves. There
+# are no post_delete receivers on purpose: they would turn Django's fast
+# batched deletes into per-row deletes with signal dispatch.
+
+
+@receiver(post_save, sender=Document)
+def invalidate_document_answers(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_documents([instance.id])
+
+
+@receiver(post_save, sender=TextChunk)
+def invalidate_chunk_answers(sender, instance, **kwargs):
+    invalidate_documents([instance.document_id])
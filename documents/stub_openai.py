@@ -0,0 +1,161 @@
+"""
+Local stand-in for the OpenAI embeddings and chat completions APIs, used for
+load tests and benchmarks. Point the app at it with OPENAI_BASE_URL.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import base64
+import hashlib
+import json
+import threading
+import time
+
+import numpy as np
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    server_version = "StubOpenAI/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path.endswith('/embeddings'):
+            self._embeddings(body)
+        elif self.path.endswith('/chat/completions'):
+            self._chat_completions(body)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _embeddings(self, body):
+        if self.server.rate_limited():
+            self._send_json(
+                429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                headers={"Retry-After-Ms": str(int(self.server.rate_limit_window * 1000))},
+            )
+            return
+
+        inputs = body.get('input', [])
+        if not isinstance(inputs, list) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+
+        time.sleep(self.server.embedding_latency)
+        data = []
+        for index, item in enumerate(inputs):
+            vector = stub_embedding(json.dumps(item), self.server.dimensions)
+            if body.get('encoding_format') == 'base64':
+                embedding = base64.b64encode(vector.astype('<f4').tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": body.get('model', 'stub'),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def _chat_completions(self, body):
+        answer = "This is a stub answer generated from the provided context."
+        model = body.get('model', 'stub')
+
+        if not body.get('stream'):
+            time.sleep(self.server.chat_latency)
+            self._send_json(200, {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        tokens = answer.split(" ")
+        for i, token in enumerate(tokens):
+            time.sleep(self.server.chat_latency / len(tokens))
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": token if i == 0 else f" {token}"},
+                    "finish_reason": None,
+                }],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def stub_embedding(text: str, dimensions: int) -> np.ndarray:
+    """Deterministic unit vector derived from the text"""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+    vector = np.random.default_rng(seed).standard_normal(dimensions)
+    return vector / np.linalg.norm(vector)
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    """
+    Threaded stub server. With rate_limit set, embedding requests beyond
+    rate_limit per rate_limit_window seconds get a 429 like the real API.
+    """
+    daemon_threads = True
+    rate_limit = 0
+    rate_limit_window = 1.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._rate_lock = threading.Lock()
+        self._window_started = 0.0
+        self._window_requests = 0
+        self.requests_rejected = 0
+
+    def rate_limited(self) -> bool:
+        if not self.rate_limit:
+            return False
+        with self._rate_lock:
+            now = time.monotonic()
+            if now - self._window_started >= self.rate_limit_window:
+                self._window_started, self._window_requests = now, 0
+            self._window_requests += 1
+            if self._window_requests > self.rate_limit:
+                self.requests_rejected += 1
+                return True
+            return False
+
+
+def start_stub_server(host: str = '127.0.0.1', port: int = 0, dimensions: int = 1536,
+                      embedding_latency: float = 0.05, chat_latency: float = 0.5,
+                      rate_limit: int = 0, rate_limit_window: float = 1.0) -> StubOpenAIServer:
+    """Start the stub API on a background thread. Port 0 picks a free port."""
+    server = StubOpenAIServer((host, port), StubOpenAIHandler)
+    server.rate_limit = rate_limit
+    server.rate_limit_window = rate_limit_window
+    server.dimensions = dimensions
+    server.embedding_latency = embedding_latency
+    server.chat_latency = chat_latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -1,12 +1,73 @@
-from django.test import TestCase
-from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
 from unittest.mock import patch, MagicMock
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from openai import OpenAI
+import asyncio
+import hashlib
+import io
+import json
 import os
+import tarfile
 import tempfile
-from .models import Document, TextChunk
+import time
+import zipfile
+import numpy as np
+from .models import (
+    Document, TextChunk, ChunkEmbedding, IngestionJob, IngestionPage, EmbeddingCacheEntry, PurgeJob,
+    AnswerCacheEntry,
+)
+from .ingestion import Heartbeat, claim_next_job, run_ingestion_job, sync_document_chunks
+from .bulk_ingestion import create_documents, run_bulk_ingestion
+from .uploads import file_hash
+from .views import DocumentViewSet
+from .purge import claim_next_purge_job, run_purge_job
+from .chunk_storage import bulk_insert_chunks, copy_insert_chunks, encode_copy_row, insert_chunks
+from .embedding_spaces import embedding_space, index_statement
+from .embedding_backends import FakeEmbeddings, LocalEmbeddings
+from .embedding_batching import EmbeddingBatcher, PartialEmbeddingError
+from .extraction import clean_text, iter_pdf_pages
+from .embedding_cache import EmbeddingCache, cache_stats, text_hash
+from .answer_cache import AnswerCache
+from .context import assemble_context, merge_adjacent, mmr_select
+from .caching import LRUTTLCache
+from .llm import FakeStreamingChatModel
+from .stub_openai import start_stub_server, stub_embedding
+from . import metrics, vector_storage
+from .text_processing import (
+    TextProcessor, async_semaphore, build_embeddings, get_async_http_client, get_http_client, get_text_processor,
+    processor_stats, query_embedding_cache, reset_text_processor, warm_text_processor,
+)
+from .management.commands import run_ingestion_worker
+from .management.commands.benchmark_text_cleaning import legacy_clean_text
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from urllib.request import urlopen
+
+
+class InlineExecutor:
+    """Stands in for the worker's process pool: runs submitted calls right away, in the test's transaction"""
+    
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
 
 class DocumentAPITests(TestCase):
     def setUp(self):
@@ -21,43 +82,222 @@ class DocumentAPITests(TestCase):
         # Clean up the temporary file
         os.unlink(self.pdf_file.name)
     
-    @patch('pdfplumber.open')
-    def test_document_upload(self, mock_pdf_open):
-        # Mock PDF extraction
+    def _upload_pdf(self):
+        with open(self.pdf_file.name, 'rb') as pdf:
+            file_content = pdf.read()
+            
+        upload_file = SimpleUploadedFile(
+            "test.pdf", 
+            file_content,
+            content_type="application/pdf"
+        )
+        
+        url = reverse('document-list')
+        return self.client.post(url, {'file': upload_file}, format='multipart')
+    
+    @staticmethod
+    def _mock_pdf(mock_pdf_open, page_texts):
         mock_pdf = MagicMock()
-        mock_page = MagicMock()
-        mock_page.extract_text.return_value = "Test document content."
-        mock_pdf.pages = [mock_page]
+        mock_pdf.pages = []
+        for text in page_texts:
+            mock_page = MagicMock()
+            mock_page.extract_text.return_value = text
+            mock_pdf.pages.append(mock_page)
         mock_pdf_open.return_value.__enter__.return_value = mock_pdf
+        return mock_pdf
+    
+    @staticmethod
+    def _mock_processor():
+        mock_processor = MagicMock()
+        mock_processor.iter_text_chunks.side_effect = lambda pages: list(pages)
+        mock_processor.generate_embeddings_batch.side_effect = lambda texts: [[0.1] * 1536 for _ in texts]
+        return mock_processor
+    
+    def test_document_upload_queues_ingestion_job(self):
+        response = self._upload_pdf()
         
-        # Mock the text processor to avoid actual embedding generation
-        with patch('documents.views.DocumentViewSet._get_text_processor') as mock_get_processor:
-            mock_processor = MagicMock()
-            mock_processor.create_text_chunks.return_value = ["Test document content."]
-            mock_processor.store_document_chunks.return_value = [1]
-            mock_get_processor.return_value = mock_processor
-            
-            # Upload the PDF file
-            with open(self.pdf_file.name, 'rb') as pdf:
-                file_content = pdf.read()
-                
-            upload_file = SimpleUploadedFile(
-                "test.pdf", 
-                file_content,
-                content_type="application/pdf"
+        # Upload returns immediately with a job to poll
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Document.objects.count(), 1)
+        job = IngestionJob.objects.get(pk=response.data['job_id'])
+        self.assertEqual(job.status, IngestionJob.STATUS_QUEUED)
+        
+        status_response = self.client.get(reverse('ingestionjob-detail', args=[job.id]))
+        self.assertEqual(status_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(status_response.data['stage'], IngestionJob.STAGE_QUEUED)
+    
+    @patch('pdfplumber.open')
+    def test_ingestion_job_processes_document(self, mock_pdf_open):
+        self._mock_pdf(mock_pdf_open, ["Test document content."])
+        response = self._upload_pdf()
+        mock_processor = self._mock_processor()
+        
+        self.assertEqual(claim_next_job().id, response.data['job_id'])
+        job = run_ingestion_job(response.data['job_id'], text_processor=mock_processor)
+        
+        self.assertEqual(job.status, IngestionJob.STATUS_COMPLETED)
+        self.assertEqual(job.stage, IngestionJob.STAGE_DONE)
+        self.assertEqual((job.pages_done, job.pages_total), (1, 1))
+        self.assertEqual((job.chunks_done, job.chunks_total), (1, 1))
+        self.assertEqual(job.document.extracted_text, "Test document content.")
+        mock_processor.iter_text_chunks.assert_called_once()
+        chunk = TextChunk.objects.get(document=job.document)
+        self.assertEqual(chunk.content_hash, text_hash("Test document content."))
+    
+    @patch('pdfplumber.open')
+    def test_ingestion_job_resumes_from_checkpointed_pages(self, mock_pdf_open):
+        mock_pdf = self._mock_pdf(mock_pdf_open, ["Fresh first page.", "Second page."])
+        response = self._upload_pdf()
+        job = IngestionJob.objects.get(pk=response.data['job_id'])
+        IngestionPage.objects.create(job=job, page_number=0, text="Checkpointed first page.")
+        
+        job = run_ingestion_job(job.id, text_processor=self._mock_processor())
+        
+        self.assertEqual(job.status, IngestionJob.STATUS_COMPLETED)
+        mock_pdf.pages[0].extract_text.assert_not_called()
+        self.assertEqual(job.document.extracted_text, "Checkpointed first page.\n\nSecond page.")
+        self.assertFalse(job.pages.exists())
+    
+    @patch('pdfplumber.open')
+    def test_heartbeat_continues_while_chunks_are_embedded(self, mock_pdf_open):
+        self._mock_pdf(mock_pdf_open, ["Test document content."])
+        response = self._upload_pdf()
+        claim_next_job()
+        mock_processor = self._mock_processor()
+        beats = []
+        
+        def slow_embeddings(texts):
+            time.sleep(0.3)
+            return [[0.1] * 1536 for _ in texts]
+        
+        mock_processor.generate_embeddings_batch.side_effect = slow_embeddings
+        with override_settings(INGESTION_JOB_TIMEOUT=0.2), \
+                patch.object(Heartbeat, 'beat', side_effect=lambda: beats.append(time.monotonic())):
+            job = run_ingestion_job(response.data['job_id'], text_processor=mock_processor)
+        
+        self.assertEqual(job.status, IngestionJob.STATUS_COMPLETED)
+        # One beat every INGESTION_JOB_TIMEOUT / 4 seconds during the slow embedding call
+        self.assertGreaterEqual(len(beats), 3)
+    
+    def test_heartbeat_touches_only_unfinished_running_jobs(self):
+        stale = timezone.now() - timedelta(hours=1)
+        jobs = [
+            IngestionJob.objects.create(document=Document.objects.create(file=f"test-{i}.pdf"),
+                                        status=IngestionJob.STATUS_RUNNING)
+            for i in range(2)
+        ]
+        IngestionJob.objects.update(updated_at=stale)
+        heartbeat = Heartbeat(job.id for job in jobs)
+        heartbeat.discard(jobs[1].id)
+        
+        heartbeat.beat()
+        
+        self.assertGreater(IngestionJob.objects.get(pk=jobs[0].id).updated_at, stale)
+        self.assertEqual(IngestionJob.objects.get(pk=jobs[1].id).updated_at, stale)
+    
+    @patch('pdfplumber.open')
+    def test_worker_merges_the_metrics_of_its_jobs(self, mock_pdf_open):
+        self._mock_pdf(mock_pdf_open, ["Test document content."])
+        self._upload_pdf()
+        metrics.reset()
+        
+        with patch('documents.text_processing.get_text_processor', return_value=self._mock_processor()), \
+                patch.object(run_ingestion_worker.Command, '_make_pool', return_value=InlineExecutor()), \
+                patch('documents.metrics.merge', wraps=metrics.merge) as merge:
+            call_command('run_ingestion_worker', '--once', '--metrics-port', '0', stdout=io.StringIO())
+        
+        # What the pool process recorded is handed back to the worker command
+        histograms, _ = merge.call_args[0][0]
+        stages = {dict(labels)['stage'] for labels in histograms['pipeline_stage_duration_seconds'][1]}
+        self.assertTrue({'ingest.extract', 'ingest.clean', 'ingest.chunk', 'ingest.store'} <= stages)
+        text = metrics.render()
+        self.assertIn('pipeline_stage_duration_seconds_count{stage="ingest.extract"} 1', text)
+        self.assertIn('ingestion_jobs_total{status="completed"} 1', text)
+    
+    @patch('pdfplumber.open')
+    def test_reingestion_only_embeds_changed_chunks(self, mock_pdf_open):
+        first = ["Unchanged opening page.", "Page that will be edited.", "Page that will be removed."]
+        self._mock_pdf(mock_pdf_open, first)
+        response = self._upload_pdf()
+        run_ingestion_job(response.data['job_id'], text_processor=self._mock_processor())
+        document_id = response.data['document']['id']
+        old_file = Document.objects.get(pk=document_id).file.name
+        opening_id = TextChunk.objects.get(document_id=document_id, chunk_index=0).id
+        
+        second = ["Newly inserted page.", "Unchanged opening page.", "Page that was edited."]
+        self._mock_pdf(mock_pdf_open, second)
+        with open(self.pdf_file.name, 'rb') as pdf:
+            upload_file = SimpleUploadedFile("test-v2.pdf", pdf.read(), content_type="application/pdf")
+        response = self.client.put(
+            reverse('document-detail', args=[document_id]), {'file': upload_file}, format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(default_storage.exists(old_file))
+        
+        mock_processor = self._mock_processor()
+        job = run_ingestion_job(response.data['job_id'], text_processor=mock_processor)
+        
+        self.assertEqual(job.status, IngestionJob.STATUS_COMPLETED)
+        self.assertEqual((job.chunks_reused, job.chunks_added, job.chunks_removed), (1, 2, 2))
+        mock_processor.generate_embeddings_batch.assert_called_once_with(
+            ["Newly inserted page.", "Page that was edited."]
+        )
+        chunks = TextChunk.objects.filter(document_id=document_id).order_by('chunk_index')
+        self.assertEqual([chunk.text for chunk in chunks], second)
+        self.assertEqual(chunks[1].id, opening_id)
+        
+        status_response = self.client.get(reverse('ingestionjob-detail', args=[job.id]))
+        self.assertEqual(status_response.data['progress']['chunks']['reused'], 1)
+    
+    @patch('pdfplumber.open')
+    def test_reupload_is_refused_while_the_ingestion_job_is_active(self, mock_pdf_open):
+        self._mock_pdf(mock_pdf_open, ["First version."])
+        response = self._upload_pdf()
+        document_id = response.data['document']['id']
+        job_id = response.data['job_id']
+        old_file = Document.objects.get(pk=document_id).file.name
+        
+        for job_status in IngestionJob.ACTIVE_STATUSES:
+            IngestionJob.objects.filter(pk=job_id).update(status=job_status)
+            reupload = self.client.put(
+                reverse('document-detail', args=[document_id]),
+                {'file': SimpleUploadedFile("test-v2.pdf", b"%PDF-1.4 second version")}, format='multipart',
             )
-            
-            url = reverse('document-list')
-            response = self.client.post(url, {'file': upload_file}, format='multipart')
-            
-            # Check response
-            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-            self.assertEqual(Document.objects.count(), 1)
-            
-            # Verify the document was processed
-            mock_get_processor.assert_called_once()
-            mock_processor.create_text_chunks.assert_called_once()
-            mock_processor.store_document_chunks.assert_called_once()
+            self.assertEqual(reupload.status_code, status.HTTP_409_CONFLICT)
+            self.assertEqual(reupload.data['job_id'], job_id)
+            self.assertEqual(Document.objects.get(pk=document_id).file.name, old_file)
+            self.assertEqual(IngestionJob.objects.filter(document_id=document_id).count(), 1)
+        
+        run_ingestion_job(job_id, text_processor=self._mock_processor())
+        reupload = self.client.put(
+            reverse('document-detail', args=[document_id]),
+            {'file': SimpleUploadedFile("test-v2.pdf", b"%PDF-1.4 second version")}, format='multipart',
+        )
+        self.assertEqual(reupload.status_code, status.HTTP_202_ACCEPTED)
+        self.assertNotEqual(reupload.data['job_id'], job_id)
+    
+    @patch('pdfplumber.open')
+    def test_reupload_losing_the_race_for_the_active_job_changes_nothing(self, mock_pdf_open):
+        self._mock_pdf(mock_pdf_open, ["First version."])
+        response = self._upload_pdf()
+        document_id = response.data['document']['id']
+        job_id = response.data['job_id']
+        old_file = Document.objects.get(pk=document_id).file.name
+        
+        # Another request enqueued its job after this one checked for an active job
+        with patch.object(DocumentViewSet, '_active_job', side_effect=[None, IngestionJob.objects.get(pk=job_id)]):
+            reupload = self.client.put(
+                reverse('document-detail', args=[document_id]),
+                {'file': SimpleUploadedFile("test-v2.pdf", b"%PDF-1.4 second version")}, format='multipart',
+            )
+        
+        self.assertEqual(reupload.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(reupload.data['job_id'], job_id)
+        self.assertEqual(Document.objects.get(pk=document_id).file.name, old_file)
+        self.assertTrue(default_storage.exists(old_file))
+        self.assertEqual(IngestionJob.objects.filter(document_id=document_id).count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            IngestionJob.objects.create(document_id=document_id, status=IngestionJob.STATUS_RUNNING)
     
     @patch('documents.text_processing.TextProcessor.generate_embeddings')
     @patch('documents.text_processing.TextProcessor.find_similar_chunks')
@@ -87,4 +327,1393 @@ class DocumentAPITests(TestCase):
         # Check response
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['text'], "Test document content.")
\ No newline at end of file
+        self.assertEqual(response.data[0]['text'], "Test document content.")
+    @patch('documents.text_processing.TextProcessor.__init__', return_value=None)
+    @patch('documents.text_processing.TextProcessor.find_similar_chunks')
+    def test_search_passes_ann_parameters(self, mock_find_chunks, mock_init):
+        mock_find_chunks.return_value = []
+        
+        url = reverse('document-search')
+        response = self.client.post(
+            url, {'query': 'test query', 'limit': 3, 'ef_search': 100, 'probes': 10}, format='json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_find_chunks.assert_called_once_with(
+            'test query', 3, ef_search=100, probes=10, document_ids=None, metadata=None
+        )
+    
+    def test_search_rejects_invalid_ann_parameters(self):
+        url = reverse('document-search')
+        for params in ({'ef_search': -1}, {'ef_search': 1001}, {'limit': 0}, {'limit': -3}, {'limit': 1001},
+                       {'limit': [5]}, {'limit': {'n': 5}}, {'document_ids': [{'id': 1}]}):
+            response = self.client.post(url, {'query': 'test query', **params}, format='json')
+            
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class ChunkStorageTests(TestCase):
+    def setUp(self):
+        self.document = Document.objects.create(file="test.pdf", extracted_text="Test")
+        self.chunks = [f"Chunk number {i} of the test document." for i in range(5)]
+        self.embeddings = [[float(i) / 10] * 1536 for i in range(5)]
+    
+    @patch('documents.text_processing.TextProcessor.__init__', return_value=None)
+    def _store(self, mock_init):
+        return TextProcessor().store_document_chunks(self.document, self.chunks, embeddings=self.embeddings)
+    
+    def _assert_stored(self, chunk_ids):
+        stored = list(TextChunk.objects.filter(document=self.document).order_by('chunk_index'))
+        self.assertEqual([chunk.id for chunk in stored], chunk_ids)
+        self.assertEqual([chunk.text for chunk in stored], self.chunks)
+        self.assertEqual([chunk.content_hash for chunk in stored], [text_hash(text) for text in self.chunks])
+        for chunk, embedding in zip(stored, self.embeddings):
+            self.assertAlmostEqual(float(chunk.embedding[0]), embedding[0], places=5)
+    
+    @override_settings(CHUNK_COPY_THRESHOLD=0, CHUNK_INSERT_BATCH_SIZE=2)
+    def test_store_chunks_with_bulk_insert(self):
+        self._assert_stored(self._store())
+    
+    @override_settings(CHUNK_COPY_THRESHOLD=1)
+    def test_store_chunks_with_binary_copy(self):
+        self._assert_stored(self._store())
+
+
+class DocumentListingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.documents = []
+        rng = np.random.default_rng(0)
+        for i in range(5):
+            document = Document.objects.create(file=f"doc{i}.pdf", extracted_text="Long extracted text. " * 2000)
+            bulk_insert_chunks(document, [
+                (index, f"Chunk {index} of document {i}.", rng.standard_normal(1536)) for index in range(30)
+            ])
+            self.documents.append(document)
+    
+    def test_list_returns_summaries_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('document-list'))
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"embedding"', queries[0]['sql'])
+        # The stored text_length is read, the TOASTed text is never touched
+        self.assertNotIn('"extracted_text"', queries[0]['sql'])
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(response.data[0]['chunk_count'], 30)
+        self.assertEqual(response.data[0]['text_length'], len("Long extracted text. " * 2000))
+        self.assertNotIn('extracted_text', response.data[0])
+        self.assertNotIn('chunks', response.data[0])
+        # 5 documents with ~40 KB of text and 30 chunks each stay a few hundred bytes each
+        self.assertLess(len(response.content), 2000)
+    
+    def test_chunks_are_cursor_paginated_without_embeddings(self):
+        url = reverse('document-chunks', args=[self.documents[0].id])
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'page_size': 20})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([chunk['chunk_index'] for chunk in response.data['results']], list(range(20)))
+        self.assertTrue(all('"embedding"' not in query['sql'] for query in queries))
+        self.assertLessEqual(len(queries), 2)
+        
+        response = self.client.get(response.data['next'])
+        self.assertEqual([chunk['chunk_index'] for chunk in response.data['results']], list(range(20, 30)))
+        self.assertIsNone(response.data['next'])
+    
+    def test_detail_reports_chunk_count(self):
+        response = self.client.get(reverse('document-detail', args=[self.documents[0].id]))
+        
+        self.assertEqual(response.data['chunk_count'], 30)
+        self.assertNotIn('chunks', response.data)
+
+
+class PurgeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.media_root = tempfile.TemporaryDirectory()
+        media_override = override_settings(MEDIA_ROOT=self.media_root.name, PURGE_BATCH_SIZE=7)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(self.media_root.cleanup)
+        self.documents = [self._create_document(i) for i in range(3)]
+    
+    def _create_document(self, i):
+        document = Document.objects.create(
+            file=default_storage.save(f"documents/doc{i}.pdf", ContentFile(b"%PDF-1.5")),
+            extracted_text="Text",
+        )
+        bulk_insert_chunks(document, [(index, f"Chunk {index}.", [0.1] * 1536) for index in range(20)])
+        job = IngestionJob.objects.create(document=document)
+        IngestionPage.objects.create(job=job, page_number=0, text="Page")
+        return document
+    
+    def test_destroy_deletes_chunks_in_batches_and_removes_file(self):
+        document = self.documents[0]
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(reverse('document-detail', args=[document.id]))
+        
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(TextChunk.objects.filter(document_id=document.id).exists())
+        self.assertFalse(IngestionJob.objects.filter(document_id=document.id).exists())
+        self.assertFalse(default_storage.exists(document.file.name))
+        self.assertEqual(TextChunk.objects.count(), 40)
+        # Chunks are deleted by id without ever being loaded
+        chunk_selects = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'documents_textchunk' in q['sql']]
+        self.assertTrue(chunk_selects)
+        self.assertTrue(all('"embedding"' not in sql and '"text"' not in sql for sql in chunk_selects))
+    
+    def test_clear_all_deletes_everything_in_batches(self):
+        response = self.client.delete(reverse('document-clear-all'))
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted'], {"documents": 3, "chunks": 60, "files": 3})
+        self.assertFalse(Document.objects.exists())
+        self.assertFalse(TextChunk.objects.exists())
+        self.assertFalse(IngestionPage.objects.exists())
+    
+    def test_clear_all_truncates(self):
+        response = self.client.delete(reverse('document-clear-all'), QUERY_STRING='mode=truncate')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted']['files'], 3)
+        self.assertFalse(Document.objects.exists())
+        self.assertFalse(TextChunk.objects.exists())
+        self.assertEqual(default_storage.listdir('documents')[1], [])
+    
+    def test_clear_all_in_background_keeps_later_uploads(self):
+        response = self.client.delete(reverse('document-clear-all'), QUERY_STRING='mode=background')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        later = self._create_document(3)
+        
+        self.assertEqual(claim_next_purge_job().id, response.data['job_id'])
+        job = run_purge_job(response.data['job_id'])
+        
+        self.assertEqual(job.status, PurgeJob.STATUS_COMPLETED)
+        self.assertEqual((job.documents_done, job.documents_total), (3, 3))
+        self.assertEqual((job.chunks_deleted, job.files_deleted), (60, 3))
+        self.assertEqual(list(Document.objects.values_list('id', flat=True)), [later.id])
+        self.assertEqual(TextChunk.objects.count(), 20)
+        
+        status_response = self.client.get(response.data['status_url'])
+        self.assertEqual(status_response.data['status'], PurgeJob.STATUS_COMPLETED)
+    
+    def test_clear_all_rejects_unknown_mode(self):
+        response = self.client.delete(reverse('document-clear-all'), QUERY_STRING='mode=drop')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+def build_pdf(page_texts):
+    """Build a minimal PDF with one line of Helvetica text per page"""
+    page_count = len(page_texts)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(page_count))
+        + b"] /Count %d >>" % page_count,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(page_texts):
+        stream = b"BT /F1 12 Tf 72 720 Td (%s) Tj ET" % text.encode('latin-1')
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (5 + 2 * i)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+    
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
+
+class PdfExtractionTests(SimpleTestCase):
+    def setUp(self):
+        self.page_texts = [f"Page number {i}" for i in range(7)]
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as pdf_file:
+            pdf_file.write(build_pdf(self.page_texts))
+        self.pdf_path = pdf_file.name
+    
+    def tearDown(self):
+        os.unlink(self.pdf_path)
+    
+    def test_serial_extraction_skips_checkpointed_pages(self):
+        pages = list(iter_pdf_pages(self.pdf_path, skip_pages={0, 3}, workers=1))
+        
+        expected = [(i, text) for i, text in enumerate(self.page_texts) if i not in (0, 3)]
+        self.assertEqual(pages, expected)
+    
+    @override_settings(PDF_EXTRACTION_PARALLEL_MIN_PAGES=1)
+    def test_parallel_extraction_keeps_page_order(self):
+        pages = list(iter_pdf_pages(self.pdf_path, skip_pages={2}, workers=2, pages_per_task=2))
+        
+        expected = [(i, text) for i, text in enumerate(self.page_texts) if i != 2]
+        self.assertEqual(pages, expected)
+
+
+class StreamingChunkerTests(SimpleTestCase):
+    @patch('documents.text_processing.TextProcessor.__init__', return_value=None)
+    def test_streamed_pages_cover_the_full_text(self, mock_init):
+        processor = TextProcessor()
+        processor.text_splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=20)
+        pages = [" ".join(f"page{p}word{w}" for w in range(60)) for p in range(5)]
+        
+        chunks = list(processor.iter_text_chunks(iter(pages)))
+        
+        full_text_chunks = processor.create_text_chunks("\n\n".join(pages))
+        self.assertTrue(all(len(chunk) <= 100 for chunk in chunks))
+        self.assertEqual(set(" ".join(chunks).split()), set(" ".join(full_text_chunks).split()))
+
+
+class CleanTextTests(SimpleTestCase):
+    def test_whitespace_is_collapsed_but_paragraphs_are_kept(self):
+        text = "  First line\nwrapped   here\t and\n\n \n Second - paragraph\r\n\r\nThird "
+        
+        self.assertEqual(clean_text(text), "First line wrapped here and\n\nSecond-paragraph\n\nThird")
+    
+    def test_hyphenation_across_line_breaks_matches_the_multi_pass_cleaner(self):
+        texts = [
+            "Sentence embed -\nding models use word -\n  pieces and self - attention.",
+            "A hyphen -\r\n\r\nacross a page break, pre -\tpost, a - - b and a -- b.",
+            "embed-\nding keeps its break, - leading and trailing -",
+        ]
+        
+        for text in texts:
+            # The multi-pass cleaner turned paragraph breaks into spaces as well
+            self.assertEqual(clean_text(text).replace("\n\n", " "), legacy_clean_text(text), text)
+        self.assertEqual(clean_text(texts[0]), "Sentence embed-ding models use word-pieces and self-attention.")
+    
+    @override_settings(CHUNK_SIZE_TOKENS=20, CHUNK_OVERLAP_TOKENS=5)
+    @patch('documents.text_processing.count_tokens', side_effect=lambda text, model: len(text.split()))
+    def test_chunks_follow_paragraphs_within_the_token_budget(self, count_tokens):
+        paragraphs = [" ".join(f"para{p}word{w}" for w in range(15)) for p in range(6)]
+        pages = ["\n\n".join(paragraphs[:3]), "\n\n".join(paragraphs[3:])]
+        
+        chunks = list(TextProcessor().iter_text_chunks(iter(pages)))
+        
+        self.assertEqual(chunks, paragraphs)
+
+
+class EmbeddingCacheTests(TestCase):
+    def setUp(self):
+        self.embed = MagicMock(side_effect=lambda texts: [[float(len(text))] * 3 for text in texts])
+    
+    def test_only_cache_misses_are_embedded(self):
+        cache = EmbeddingCache('test-model', max_entries=0)
+        before = cache_stats()
+        
+        first = cache.embed_documents(["alpha", "beta", "alpha"], self.embed)
+        second = cache.embed_documents(["beta", "gamma"], self.embed)
+        
+        self.assertEqual(first, [[5.0] * 3, [4.0] * 3, [5.0] * 3])
+        self.assertEqual(second, [[4.0] * 3, [5.0] * 3])
+        self.assertEqual([c.args[0] for c in self.embed.call_args_list], [["alpha", "beta"], ["gamma"]])
+        after = cache_stats()
+        self.assertEqual(after['hits'] - before['hits'], 2)
+        self.assertEqual(after['misses'] - before['misses'], 3)
+    
+    def test_cache_is_scoped_by_model(self):
+        EmbeddingCache('model-a', max_entries=0).embed_documents(["alpha"], self.embed)
+        EmbeddingCache('model-b', max_entries=0).embed_documents(["alpha"], self.embed)
+        
+        self.assertEqual(self.embed.call_count, 2)
+    
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = EmbeddingCache('test-model', max_entries=2)
+        cache.embed_documents(["alpha"], self.embed)
+        cache.embed_documents(["beta"], self.embed)
+        cache.embed_documents(["alpha"], self.embed)  # refreshes "alpha"
+        cache.embed_documents(["gamma"], self.embed)
+        
+        cached = set(EmbeddingCacheEntry.objects.values_list('text_hash', flat=True))
+        self.assertEqual(cached, {text_hash("alpha"), text_hash("gamma")})
+
+
+class EmbeddingBatchingTests(TestCase):
+    @patch('documents.embedding_batching.count_tokens', side_effect=lambda text, model: len(text))
+    def test_texts_are_packed_under_token_and_text_budgets(self, count_tokens):
+        batcher = EmbeddingBatcher(MagicMock(), max_tokens=10, max_texts=3)
+        
+        batches = batcher.pack(["aaaa", "bbbb", "cc", "d", "e", "f", "g" * 20, "h"])
+        
+        self.assertEqual(batches, [[0, 1, 2], [3, 4, 5], [6], [7]])
+    
+    def test_rate_limited_requests_are_retried_against_the_stub(self):
+        server = start_stub_server(dimensions=8, embedding_latency=0, rate_limit=2, rate_limit_window=0.2)
+        client = OpenAI(api_key="test", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", max_retries=0)
+        embed = lambda texts: [item.embedding for item in client.embeddings.create(input=texts, model="stub").data]
+        texts = [f"text {i}" for i in range(8)]
+        try:
+            vectors = EmbeddingBatcher(embed, max_texts=1, concurrency=4, base_delay=0.05).embed_documents(texts)
+        finally:
+            server.shutdown()
+        
+        self.assertGreater(server.requests_rejected, 0)
+        expected = [stub_embedding(json.dumps(text), 8) for text in texts]
+        np.testing.assert_allclose(np.array(vectors), np.array(expected), rtol=1e-6)
+    
+    def test_failed_requests_keep_the_other_batches_in_the_cache(self):
+        def embed(texts):
+            if "bad" in texts:
+                raise ValueError("bad input")
+            return [[float(len(text))] * 3 for text in texts]
+        batcher = EmbeddingBatcher(embed, max_texts=1, concurrency=2)
+        
+        with self.assertRaises(PartialEmbeddingError) as raised:
+            EmbeddingCache("batching-test").embed_documents(["one", "bad", "three"], batcher.embed_documents)
+        
+        self.assertEqual(raised.exception.embeddings, [[3.0] * 3, None, [5.0] * 3])
+        self.assertEqual(EmbeddingCacheEntry.objects.filter(model_name="batching-test").count(), 2)
+    
+    def test_only_transient_errors_are_retried(self):
+        embed = MagicMock(side_effect=ValueError("bad input"))
+        sleep = MagicMock()
+        
+        with self.assertRaises(ValueError):
+            EmbeddingBatcher(embed, max_retries=3, sleep=sleep).call(embed, ["text"])
+        
+        self.assertEqual(embed.call_count, 1)
+        sleep.assert_not_called()
+
+
+class QueryEmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        query_embedding_cache.local.clear()
+    
+    def test_lru_cache_evicts_oldest_and_expired_entries(self):
+        cache = LRUTTLCache(max_entries=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        cache.set('d', 4, ttl=-1)
+        
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.get('d'), None)
+    
+    @patch('documents.text_processing.OpenAIEmbeddings')
+    def test_processor_construction_makes_no_network_calls(self, mock_embeddings_class):
+        TextProcessor()
+        
+        mock_embeddings_class.assert_not_called()
+    
+    @patch('documents.text_processing.OpenAIEmbeddings')
+    def test_repeated_queries_are_embedded_once(self, mock_embeddings_class):
+        mock_embeddings = mock_embeddings_class.return_value
+        mock_embeddings.model = 'test-model'
+        mock_embeddings.embed_query.return_value = [0.1] * 1536
+        
+        for _ in range(3):
+            self.assertEqual(TextProcessor().generate_embeddings("same question"), [0.1] * 1536)
+        
+        mock_embeddings.embed_query.assert_called_once_with("same question")
+
+
+class TextProcessorRegistryTests(SimpleTestCase):
+    def setUp(self):
+        reset_text_processor()
+    
+    def tearDown(self):
+        reset_text_processor()
+    
+    def test_concurrent_requests_share_one_processor(self):
+        before = processor_stats()
+        
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            processors = list(pool.map(lambda _: get_text_processor(), range(500)))
+        
+        self.assertEqual(len({id(processor) for processor in processors}), 1)
+        self.assertEqual(processor_stats()['text_processors'] - before['text_processors'], 1)
+    
+    @patch('documents.text_processing.ChatOpenAI')
+    @patch('documents.text_processing.OpenAIEmbeddings')
+    def test_api_clients_share_the_pooled_http_client(self, mock_embeddings_class, mock_llm_class):
+        warm_text_processor()
+        get_text_processor().embeddings
+        
+        mock_embeddings_class.assert_called_once()
+        mock_llm_class.assert_called_once()
+        self.assertIs(mock_embeddings_class.call_args.kwargs['http_client'], get_http_client())
+        self.assertIs(mock_llm_class.call_args.kwargs['http_client'], get_http_client())
+        self.assertIs(mock_embeddings_class.call_args.kwargs['http_async_client'], get_async_http_client())
+        self.assertIs(mock_llm_class.call_args.kwargs['http_async_client'], get_async_http_client())
+
+
+class ScopedSearchTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.documents = {}
+        for name, tenant in (("a", "acme"), ("b", "acme"), ("c", "globex")):
+            document = Document.objects.create(file=f"{name}.pdf", metadata={"tenant": tenant})
+            bulk_insert_chunks(document, [
+                (index, f"Chunk {index} of {name}.", vector / np.linalg.norm(vector))
+                for index, vector in enumerate(rng.standard_normal((20, 1536)))
+            ])
+            self.documents[name] = document
+        # The query is closest to a chunk of document c
+        self.query = TextChunk.objects.get(document=self.documents["c"], chunk_index=3).embedding
+    
+    def _search(self, limit=5, **kwargs):
+        processor = TextProcessor()
+        scope = processor.scope_documents(kwargs.pop('document_ids', None), kwargs.pop('metadata', None))
+        return processor._query_similar_chunks(self.query, limit, scope=scope, **kwargs)
+    
+    def _exact(self, documents, limit=5):
+        chunks = TextChunk.objects.filter(document__in=documents)
+        ranked = sorted(chunks, key=lambda chunk: -float(np.dot(chunk.embedding, self.query)))
+        return [chunk.id for chunk in ranked[:limit]]
+    
+    @override_settings(VECTOR_SEARCH_EF_SEARCH=10)
+    def test_limit_above_ef_search_widens_the_hnsw_search(self):
+        with CaptureQueriesContext(connection) as queries:
+            chunks = self._search(limit=30)
+        
+        # HNSW returns at most ef_search rows
+        ef_search = [q['sql'] for q in queries if "set_config('hnsw.ef_search'" in q['sql']][-1]
+        self.assertIn("'30'", ef_search)
+        self.assertTrue(chunks)
+    
+    def test_document_ids_restrict_results(self):
+        a = self.documents["a"]
+        chunks = self._search(document_ids=[a.id])
+        
+        self.assertEqual([chunk.id for chunk in chunks], self._exact([a]))
+    
+    def test_metadata_filter_uses_containment(self):
+        chunks = self._search(metadata={"tenant": "acme"}, limit=10)
+        
+        self.assertEqual([chunk.id for chunk in chunks], self._exact([self.documents["a"], self.documents["b"]], 10))
+    
+    @override_settings(SCOPED_SEARCH_EXACT_THRESHOLD=10)
+    def test_broad_scope_uses_ann_over_fetch(self):
+        processor = TextProcessor()
+        scope = processor.scope_documents(metadata={"tenant": "acme"})
+        
+        self.assertEqual(processor._scoped_search_strategy(scope, 5), 'ann')
+        chunks = self._search(metadata={"tenant": "acme"}, strategy='ann')
+        self.assertEqual(len(chunks), 5)
+        self.assertTrue(all(chunk.document_id != self.documents["c"].id for chunk in chunks))
+    
+    def test_small_scope_uses_exact_search(self):
+        processor = TextProcessor()
+        scope = processor.scope_documents(document_ids=[self.documents["a"].id])
+        
+        self.assertEqual(processor._scoped_search_strategy(scope, 5), 'exact')
+    
+    @override_settings(SCOPED_SEARCH_MAX_CANDIDATES=2)
+    def test_ann_falls_back_to_exact_search_when_too_few_candidates_match(self):
+        a = self.documents["a"]
+        chunks = self._search(document_ids=[a.id], strategy='ann')
+        
+        self.assertEqual([chunk.id for chunk in chunks], self._exact([a]))
+    
+    @patch('documents.text_processing.TextProcessor.generate_embeddings')
+    def test_search_endpoint_accepts_filters(self, mock_generate_embeddings):
+        mock_generate_embeddings.return_value = list(self.query)
+        b = self.documents["b"]
+        
+        response = APIClient().post(
+            reverse('document-search'),
+            {'query': 'test', 'limit': 3, 'document_ids': [b.id], 'metadata': {'tenant': 'acme'}},
+            format='json',
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([hit['chunk_id'] for hit in response.data], self._exact([b], 3))
+    
+    def test_search_endpoint_rejects_invalid_filters(self):
+        client = APIClient()
+        url = reverse('document-search')
+        
+        response = client.post(url, {'query': 'test', 'document_ids': 'abc'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = client.post(url, {'query': 'test', 'mode': 'hybrid', 'document_ids': [1]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_upload_accepts_metadata_as_json_string(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        upload_file = SimpleUploadedFile("notes.txt", b"Notes", content_type="text/plain")
+        
+        with override_settings(MEDIA_ROOT=media_root.name):
+            response = APIClient().post(
+                reverse('document-list'),
+                {'file': upload_file, 'metadata': json.dumps({'tenant': 'initech'})},
+                format='multipart',
+            )
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Document.objects.get(pk=response.data['id']).metadata, {'tenant': 'initech'})
+
+
+class VectorStorageTests(TestCase):
+    def test_halfvec_conversion_rewrites_column_and_index(self):
+        statements = vector_storage.conversion_statements('halfvec', 'vector(1536)')
+        
+        self.assertIn(
+            "ALTER TABLE documents_textchunk ALTER COLUMN embedding TYPE halfvec(1536) "
+            "USING embedding::halfvec(1536)", statements
+        )
+        self.assertTrue(any('halfvec_cosine_ops' in statement for statement in statements))
+    
+    def test_binary_conversion_keeps_full_vectors_for_rescoring(self):
+        statements = vector_storage.conversion_statements('binary', 'vector(1536)')
+        
+        self.assertFalse(any(statement.startswith('ALTER TABLE') for statement in statements))
+        self.assertIn('DROP INDEX IF EXISTS textchunk_embedding_hnsw', statements)
+        self.assertTrue(any('binary_quantize(embedding)::bit(1536)) bit_hamming_ops' in s for s in statements))
+    
+    def test_halfvec_copy_rows_use_two_bytes_per_dimension(self):
+        full = encode_copy_row(1, 0, "text", [0.5] * 1536)
+        half = encode_copy_row(1, 0, "text", [0.5] * 1536, half=True)
+        
+        self.assertEqual(len(full) - len(half), 1536 * 2)
+    
+    @override_settings(EMBEDDING_STORAGE='binary')
+    def test_binary_storage_preselects_candidates_by_hamming_distance(self):
+        candidates = TextProcessor()._nearest_candidates([0.1] * 1536, 50)
+        sql = str(candidates.query)
+        
+        self.assertIn('binary_quantize(embedding)::bit(1536) <~> binary_quantize(', sql)
+        self.assertIn('LIMIT 50', sql)
+    
+    def test_search_after_converting_to_halfvec(self):
+        if not vector_storage.supports_quantization():
+            self.skipTest("halfvec needs pgvector 0.7 or later")
+        document = Document.objects.create(file="half.pdf")
+        vector_storage.convert_storage('halfvec')
+        with override_settings(EMBEDDING_STORAGE='halfvec', CHUNK_COPY_THRESHOLD=1):
+            copy_insert_chunks(document, [(0, "First", [1.0] + [0.0] * 1535), (1, "Second", [0.0, 1.0] + [0.0] * 1534)])
+            chunks = TextProcessor()._query_similar_chunks([0.0, 1.0] + [0.0] * 1534, 1)
+        
+        self.assertEqual([chunk.text for chunk in chunks], ["Second"])
+
+
+@override_settings(EMBEDDING_MODEL='text-embedding-3-small', EMBEDDING_DIMENSIONS=4)
+class EmbeddingSpaceTests(TestCase):
+    def setUp(self):
+        self.document = Document.objects.create(file="spaces.pdf")
+    
+    def test_space_keys(self):
+        self.assertEqual(embedding_space('text-embedding-ada-002').key, 'text-embedding-ada-002')
+        self.assertTrue(embedding_space('text-embedding-ada-002').in_column)
+        self.assertEqual(embedding_space('text-embedding-3-large', 3072).key, 'text-embedding-3-large')
+        reduced = embedding_space()
+        self.assertEqual((reduced.key, reduced.requested_dimensions), ('text-embedding-3-small:4', 4))
+        self.assertFalse(reduced.in_column)
+        self.assertIn("WHERE space = 'text-embedding-3-small:4'", index_statement(reduced))
+    
+    def test_client_requests_reduced_dimensions(self):
+        embeddings = build_embeddings(embedding_space())
+        
+        self.assertEqual((embeddings.model, embeddings.dimensions), ('text-embedding-3-small', 4))
+    
+    def test_chunks_of_other_spaces_are_stored_and_searched_in_chunk_embeddings(self):
+        ids = insert_chunks(self.document, [(0, "First", [1.0, 0.0, 0.0, 0.0]), (1, "Second", [0.0, 1.0, 0.0, 0.0])])
+        
+        self.assertEqual(TextChunk.objects.filter(id__in=ids, embedding__isnull=True).count(), 2)
+        self.assertEqual(ChunkEmbedding.objects.filter(space='text-embedding-3-small:4').count(), 2)
+        chunks = TextProcessor()._query_similar_chunks([0.1, 0.9, 0.0, 0.0], 2)
+        self.assertEqual([chunk.text for chunk in chunks], ["Second", "First"])
+    
+    def test_reembed_command_backfills_missing_chunks(self):
+        for i in range(3):
+            TextChunk.objects.create(document=self.document, chunk_index=i, text=f"Chunk {i}", embedding=[0.1] * 1536)
+        ChunkEmbedding.objects.create(
+            chunk=TextChunk.objects.get(chunk_index=0), space='text-embedding-3-small:4', embedding=[1.0, 0.0, 0.0, 0.0]
+        )
+        embeddings = MagicMock()
+        embeddings.embed_documents.side_effect = lambda texts: [[0.0, 0.0, 1.0, 0.0] for _ in texts]
+        
+        with patch('documents.management.commands.reembed_chunks.build_embeddings', return_value=embeddings):
+            call_command('reembed_chunks', '--batch-size', '1', '--no-index', stdout=open(os.devnull, 'w'))
+        
+        self.assertEqual(ChunkEmbedding.objects.filter(space='text-embedding-3-small:4').count(), 3)
+        self.assertEqual(sum(len(call.args[0]) for call in embeddings.embed_documents.call_args_list), 2)
+
+
+class EmbeddingBackendTests(TestCase):
+    def test_fake_vectors_are_deterministic_unit_vectors(self):
+        embeddings = FakeEmbeddings(8)
+        first, second = embeddings.embed_documents(["alpha", "beta"])
+        
+        self.assertEqual(embeddings.embed_query("alpha"), first)
+        self.assertNotEqual(first, second)
+        self.assertAlmostEqual(float(np.linalg.norm(first)), 1.0, places=6)
+    
+    @override_settings(EMBEDDING_BACKEND='fake')
+    def test_fake_backend_embeddings_are_cached_apart_from_openai(self):
+        processor = TextProcessor()
+        vectors = processor.generate_embeddings_batch(["Some chunk"])
+        
+        self.assertIsInstance(processor.embeddings, FakeEmbeddings)
+        self.assertEqual(len(vectors[0]), 1536)
+        self.assertEqual(
+            list(EmbeddingCacheEntry.objects.values_list('model_name', flat=True)), ['fake:text-embedding-ada-002']
+        )
+    
+    @override_settings(EMBEDDING_BACKEND='unknown')
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaises(ValueError):
+            build_embeddings(embedding_space())
+    
+    def test_local_backend_encodes_batches_in_order_on_the_pool(self):
+        model = MagicMock()
+        model.encode.side_effect = lambda texts, **kwargs: np.array([[float(text), 0.0] for text in texts])
+        with patch.object(LocalEmbeddings, '_load_model', return_value=model):
+            embeddings = LocalEmbeddings('BAAI/bge-small-en-v1.5', batch_size=2, workers=3)
+        
+        vectors = embeddings.embed_documents([str(i) for i in range(5)])
+        
+        self.assertEqual([vector[0] for vector in vectors], [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(model.encode.call_count, 3)
+        self.assertEqual(embeddings.embed_query("7"), [7.0, 0.0])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+    
+    def test_stage_histograms_and_counters_render_in_prometheus_format(self):
+        metrics.record('ingest.clean', 0.003)
+        metrics.record('ingest.clean', 0.2)
+        metrics.increment('ingestion_jobs_total', status='completed')
+        
+        text = metrics.render()
+        
+        self.assertIn('pipeline_stage_duration_seconds_bucket{stage="ingest.clean",le="0.005"} 1', text)
+        self.assertIn('pipeline_stage_duration_seconds_bucket{stage="ingest.clean",le="+Inf"} 2', text)
+        self.assertIn('pipeline_stage_duration_seconds_count{stage="ingest.clean"} 2', text)
+        self.assertIn('ingestion_jobs_total{status="completed"} 1', text)
+        self.assertIn('embedding_cache_lookups_total{result="hit"}', text)
+    
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    @patch('documents.text_processing.TextProcessor.generate_embeddings', return_value=[0.1] * 1536)
+    def test_search_stages_are_timed_per_request_and_served(self, mock_generate_embeddings):
+        response = APIClient().post(reverse('document-search'), {'query': 'test'}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertRegex(response['Server-Timing'], r'^search-embed_query;dur=[\d.]+, search-vector_query;dur=[\d.]+, total;dur=')
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('pipeline_stage_duration_seconds_count{stage="search.vector_query"} 1', text)
+        self.assertRegex(text, r'http_request_duration_seconds_count\{method="POST",route="[^"]*search[^"]*",status="200"\} 1')
+    
+    def test_drained_metrics_merge_into_another_process_and_are_served(self):
+        metrics.record('ingest.embed', 0.2)
+        metrics.increment('ingestion_jobs_total', status='completed')
+        snapshot = metrics.drain()
+        metrics.record('ingest.embed', 0.4)
+        
+        metrics.merge(snapshot)
+        server = metrics.start_http_server(0, host='127.0.0.1')
+        try:
+            with urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+                text = response.read().decode()
+        finally:
+            server.shutdown()
+        
+        self.assertIn('pipeline_stage_duration_seconds_count{stage="ingest.embed"} 2', text)
+        self.assertIn('ingestion_jobs_total{status="completed"} 1', text)
+    
+    def test_server_timing_header_is_off_by_default(self):
+        response = self.client.get(reverse('metrics'))
+        
+        self.assertNotIn('Server-Timing', response)
+
+
+class AnswerCacheTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.document = Document.objects.create(file="test.pdf", extracted_text="Test")
+        self.chunk = TextChunk.objects.create(
+            document=self.document, chunk_index=0, text="Pumps need new seals yearly.",
+            content_hash=text_hash("Pumps need new seals yearly."), embedding=[1.0] + [0.0] * 1535,
+        )
+        self.processor = TextProcessor()
+        self.processor.llm = FakeStreamingChatModel(token_delay=0)
+        self.vectors = {
+            "How often do seals need replacing?": [1.0] + [0.0] * 1535,
+            "how often do the seals need replacing": [0.99, 0.1] + [0.0] * 1534,
+            "Who maintains the pumps?": [0.8, 0.6] + [0.0] * 1534,
+        }
+        self.vectors["  how OFTEN do seals need replacing "] = self.vectors["How often do seals need replacing?"]
+        patcher = patch.object(TextProcessor, 'generate_embeddings', side_effect=lambda text: self.vectors[text])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def ask(self, query):
+        with patch.object(self.processor.llm, 'invoke', wraps=self.processor.llm.invoke) as invoke:
+            result = self.processor.answer_query(query)
+        return result, invoke.call_count
+    
+    def test_repeated_query_is_answered_from_the_cache(self):
+        first, first_calls = self.ask("How often do seals need replacing?")
+        second, second_calls = self.ask("  how OFTEN do seals need replacing ")
+        
+        self.assertEqual((first_calls, second_calls), (1, 0))
+        self.assertEqual(second["answer"], first["answer"])
+        self.assertTrue(second["cached"])
+        self.assertEqual(second["source_chunks"][0]["chunk_id"], self.chunk.id)
+        self.assertEqual(AnswerCacheEntry.objects.get().hits, 1)
+    
+    def test_near_duplicate_queries_share_an_answer(self):
+        self.ask("How often do seals need replacing?")
+        
+        _, paraphrase_calls = self.ask("how often do the seals need replacing")
+        _, different_calls = self.ask("Who maintains the pumps?")
+        
+        self.assertEqual((paraphrase_calls, different_calls), (0, 1))
+        text = metrics.render()
+        self.assertIn('answer_cache_lookups_total{result="similar_hit"}', text)
+        self.assertIn('answer_cache_saved_seconds_total', text)
+    
+    @override_settings(ANSWER_CACHE_SIMILARITY=0)
+    def test_near_duplicate_lookup_can_be_disabled(self):
+        self.ask("How often do seals need replacing?")
+        
+        _, calls = self.ask("how often do the seals need replacing")
+        
+        self.assertEqual(calls, 1)
+    
+    def test_changed_chunks_invalidate_answers(self):
+        self.ask("How often do seals need replacing?")
+        
+        sync_document_chunks(self.document, ["Pumps need new seals monthly."], MagicMock(
+            generate_embeddings_batch=lambda texts: [[1.0] + [0.0] * 1535 for _ in texts]
+        ))
+        
+        self.assertFalse(AnswerCacheEntry.objects.exists())
+    
+    def test_saving_a_chunk_or_document_invalidates_answers(self):
+        self.ask("How often do seals need replacing?")
+        self.chunk.save()
+        self.assertFalse(AnswerCacheEntry.objects.exists())
+        
+        self.ask("How often do seals need replacing?")
+        self.document.save()
+        self.assertFalse(AnswerCacheEntry.objects.exists())
+    
+    def test_deleting_a_document_invalidates_answers(self):
+        self.ask("How often do seals need replacing?")
+        
+        response = APIClient().delete(reverse('document-detail', args=[self.document.id]))
+        
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(AnswerCacheEntry.objects.exists())
+    
+    def test_expired_and_excess_entries_are_evicted(self):
+        cache = AnswerCache("test", ttl=60, max_entries=2, similarity=0)
+        chunks = [{"chunk_id": self.chunk.id, "document_id": self.document.id}]
+        for i in range(3):
+            cache.set(f"question {i}", [1.0, 0.0], chunks, f"answer {i}")
+        
+        self.assertEqual(sorted(AnswerCacheEntry.objects.values_list('answer', flat=True)), ["answer 1", "answer 2"])
+        
+        AnswerCacheEntry.objects.update(created_at=timezone.now() - timedelta(seconds=120))
+        self.assertIsNone(cache.get("question 2", [1.0, 0.0], chunks))
+        self.assertEqual(cache.evict(), 2)
+
+
+class HybridSearchTests(TestCase):
+    def setUp(self):
+        document = Document.objects.create(file="test.pdf", extracted_text="Test")
+        self.near = TextChunk.objects.create(
+            document=document, chunk_index=0, embedding=[1.0] + [0.0] * 1535,
+            text="General maintenance instructions for the pump assembly.",
+        )
+        self.identifier = TextChunk.objects.create(
+            document=document, chunk_index=1, embedding=[0.0, 1.0] + [0.0] * 1534,
+            text="Replacement seal kit, part number PN-48213, fits all models.",
+        )
+    
+    def test_lexical_matches_are_fused_with_vector_matches(self):
+        result = TextProcessor().hybrid_search(
+            "PN-48213", limit=2, query_embedding=[1.0] + [0.0] * 1535
+        )
+        
+        by_id = {hit['chunk_id']: hit for hit in result['results']}
+        self.assertEqual(set(by_id), {self.near.id, self.identifier.id})
+        self.assertEqual(by_id[self.identifier.id]['lexical_rank'], 1)
+        self.assertEqual(by_id[self.near.id]['vector_rank'], 1)
+        self.assertIsNone(by_id[self.near.id]['lexical_rank'])
+        self.assertEqual(set(result['timings']), {'embedding_ms', 'query_ms', 'total_ms'})
+    
+    @patch('documents.text_processing.TextProcessor.hybrid_search')
+    def test_search_action_hybrid_mode(self, mock_hybrid_search):
+        mock_hybrid_search.return_value = {"results": [], "timings": {"total_ms": 1.0}}
+        
+        response = APIClient().post(reverse('document-search'), {'query': 'PN-48213', 'mode': 'hybrid'}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['mode'], 'hybrid')
+        self.assertEqual(response.data['timings'], {"total_ms": 1.0})
+
+
+class BatchSearchTests(TestCase):
+    def setUp(self):
+        query_embedding_cache.local.clear()
+        document = Document.objects.create(file="test.pdf", extracted_text="Test")
+        self.chunks = [
+            TextChunk.objects.create(
+                document=document, chunk_index=i, text=f"Chunk {i}.",
+                embedding=[0.0] * i + [1.0] + [0.0] * (1535 - i),
+            )
+            for i in range(3)
+        ]
+        self.vectors = {
+            "first": [1.0, 0.2] + [0.0] * 1534,
+            "second": [0.0, 0.3, 1.0] + [0.0] * 1533,
+        }
+        self.embed = MagicMock(side_effect=lambda texts: [self.vectors[text] for text in texts])
+        patcher = patch.object(TextProcessor, 'embeddings', new=MagicMock(embed_documents=self.embed))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_batch_matches_sequential_search_with_one_embedding_call(self):
+        processor = TextProcessor()
+        
+        with CaptureQueriesContext(connection) as queries:
+            results = processor.batch_find_similar_chunks(["first", "second", "first"], limit=2)
+        
+        self.embed.assert_called_once_with(["first", "second"])
+        self.assertEqual(len([q for q in queries.captured_queries if 'LATERAL' in q['sql']]), 1)
+        self.assertEqual([hit['chunk_id'] for hit in results[0]], [self.chunks[0].id, self.chunks[1].id])
+        self.assertEqual([hit['chunk_id'] for hit in results[1]], [self.chunks[2].id, self.chunks[1].id])
+        self.assertEqual(results[2], results[0])
+        with patch.object(TextProcessor, 'generate_embeddings', side_effect=lambda text: self.vectors[text]):
+            self.assertEqual(processor.find_similar_chunks("second", limit=2), results[1])
+    
+    def test_endpoint_streams_one_line_per_query(self):
+        response = APIClient().post(
+            reverse('document-search-batch'), {'queries': ['first', 'second'], 'limit': 1}, format='json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(line['index'], line['query']) for line in lines], [(0, 'first'), (1, 'second')])
+        self.assertEqual(lines[1]['results'][0]['chunk_id'], self.chunks[2].id)
+    
+    def test_endpoint_rejects_invalid_batches(self):
+        client = APIClient()
+        
+        for body in ({}, {'queries': []}, {'queries': 'first'}, {'queries': ['first', '']}):
+            response = client.post(reverse('document-search-batch'), body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(BATCH_SEARCH_MAX_QUERIES=1):
+            response = client.post(reverse('document-search-batch'), {'queries': ['first', 'second']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ContextAssemblyTests(TestCase):
+    def chunk(self, chunk_id, text, chunk_index=None, document_id=1, similarity=0.5):
+        return {
+            "chunk_id": chunk_id, "document_id": document_id, "text": text, "similarity": similarity,
+            "chunk_index": chunk_id if chunk_index is None else chunk_index,
+        }
+    
+    def test_mmr_prefers_diverse_chunks_and_drops_duplicates(self):
+        vectors = [[1.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.9, 0.1, 0.0], [0.6, 0.0, 0.8]]
+        
+        picked = mmr_select([1.0, 0.0, 0.3], vectors, k=3, lambda_mult=0.5, duplicate_similarity=0.98)
+        
+        self.assertEqual(picked[:2], [0, 3])
+        self.assertNotIn(1, picked)
+    
+    def test_adjacent_chunks_are_merged_without_their_overlap(self):
+        text = " ".join(f"word{i}" for i in range(600))
+        chunks = TextProcessor().create_text_chunks(text)
+        
+        passages = merge_adjacent(
+            [self.chunk(i, chunk) for i, chunk in enumerate(chunks)] + [self.chunk(99, "Other document.", 0, 2)]
+        )
+        
+        self.assertEqual([passage["text"] for passage in passages], [text, "Other document."])
+        self.assertEqual((passages[0]["chunk_index"], passages[0]["last_chunk_index"]), (0, len(chunks) - 1))
+    
+    def test_chunks_are_packed_into_the_token_budget(self):
+        candidates = [self.chunk(i, "x" * 400, document_id=i, similarity=1 - i / 10) for i in range(4)]
+        vectors = np.eye(4).tolist()
+        
+        with patch('documents.context.count_tokens', return_value=100):
+            passages, used = assemble_context([1, 1, 1, 1], candidates, vectors, model="gpt-3.5-turbo",
+                                              max_chunks=4, max_tokens=250)
+        
+        self.assertEqual(len(used), 2)
+        self.assertEqual(sum(len(passage["chunk_ids"]) for passage in passages), 2)
+    
+    @patch('documents.context.count_tokens', side_effect=lambda text, model: len(text.split()))
+    def test_overlapping_neighbours_are_charged_once(self, count_tokens):
+        words = [f"w{i}" for i in range(60)]
+        # 30-word chunks overlapping by 10 words: 80 words counted apart, 60 once merged
+        candidates = [
+            self.chunk(0, " ".join(words[0:30]), similarity=0.9),
+            self.chunk(1, " ".join(words[20:50]), similarity=0.8),
+            self.chunk(2, " ".join(words[40:60]), similarity=0.7),
+        ]
+        
+        passages, used = assemble_context([1, 1, 1], candidates, np.eye(3).tolist(), model="gpt-3.5-turbo",
+                                          max_chunks=3, max_tokens=60)
+        
+        self.assertEqual(len(used), 3)
+        self.assertEqual([passage["text"] for passage in passages], [" ".join(words)])
+        
+        _, used = assemble_context([1, 1, 1], candidates, np.eye(3).tolist(), model="gpt-3.5-turbo",
+                                   max_chunks=3, max_tokens=59)
+        self.assertEqual(len(used), 2)
+    
+    def test_equally_similar_duplicates_keep_the_oldest_chunk(self):
+        candidates = [self.chunk(7, "Same text.", 0, 2, similarity=0.9), self.chunk(3, "Same text.", 0, 1, similarity=0.9)]
+        
+        _, used = assemble_context([1, 0], candidates, [[1, 0], [1, 0]], model="gpt-3.5-turbo")
+        
+        self.assertEqual([chunk["chunk_id"] for chunk in used], [3])
+    
+    @override_settings(ANSWER_CACHE_ENABLED=False)
+    def test_answer_prompt_merges_neighbours_and_skips_duplicates(self):
+        text = " ".join(f"word{i}" for i in range(120))
+        first, second = TextProcessor().create_text_chunks(text)[:2]
+        original = Document.objects.create(file="original.pdf")
+        reupload = Document.objects.create(file="reupload.pdf")
+        vector = [1.0] + [0.0] * 1535
+        chunks = [
+            TextChunk.objects.create(document=original, chunk_index=0, text=first, embedding=vector),
+            TextChunk.objects.create(document=original, chunk_index=1, text=second, embedding=[0.9, 0.4] + [0.0] * 1534),
+            TextChunk.objects.create(document=reupload, chunk_index=0, text=first, embedding=vector),
+        ]
+        processor = TextProcessor()
+        processor.llm = MagicMock(invoke=MagicMock(return_value=MagicMock(content="answer")))
+        
+        with patch.object(TextProcessor, 'generate_embeddings', return_value=vector):
+            result = processor.answer_query("question")
+        
+        prompt = processor.llm.invoke.call_args[0][0]
+        self.assertIn(f"Document {original.id}, Chunks 0-1: ", prompt)
+        self.assertEqual(prompt.count("word0 "), 1)
+        self.assertEqual(sorted(chunk["chunk_id"] for chunk in result["source_chunks"]), [chunks[0].id, chunks[1].id])
+
+
+class BulkIngestionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.media_root = tempfile.TemporaryDirectory()
+        media_override = override_settings(MEDIA_ROOT=self.media_root.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(self.media_root.cleanup)
+    
+    @staticmethod
+    def _zip(members):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name, content in members.items():
+                archive.writestr(name, content)
+        return buffer.getvalue()
+    
+    def test_bulk_upload_expands_archives_and_queues_jobs(self):
+        archive = self._zip({
+            "reports/a.pdf": build_pdf(["Alpha"]),
+            "reports/b.pdf": build_pdf(["Beta"]),
+            "reports/notes.txt": b"not a pdf",
+            "__MACOSX/reports/._a.pdf": b"resource fork",
+        })
+        files = [
+            SimpleUploadedFile("reports.zip", archive, content_type="application/zip"),
+            SimpleUploadedFile("c.pdf", build_pdf(["Gamma"]), content_type="application/pdf"),
+        ]
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('document-bulk-upload'), {'files': files, 'metadata': '{"tenant": "acme"}'},
+                format='multipart',
+            )
+        
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual((response.data['queued'], response.data['failed']), (3, 1))
+        self.assertEqual([entry['file'] for entry in response.data['files']], ["a.pdf", "b.pdf", "notes.txt", "c.pdf"])
+        self.assertEqual(response.data['files'][2]['status'], 'skipped')
+        self.assertEqual(IngestionJob.objects.filter(status=IngestionJob.STATUS_QUEUED).count(), 3)
+        self.assertEqual(Document.objects.filter(metadata__tenant="acme").count(), 3)
+        # One INSERT for all documents and one for all jobs
+        self.assertEqual(sum(q['sql'].startswith('INSERT') for q in queries), 2)
+    
+    @override_settings(BULK_UPLOAD_MAX_FILES=1)
+    def test_bulk_upload_rejects_too_many_files_and_keeps_none(self):
+        archive = self._zip({"a.pdf": build_pdf(["Alpha"]), "b.pdf": build_pdf(["Beta"])})
+        
+        response = self.client.post(
+            reverse('document-bulk-upload'), {'files': [SimpleUploadedFile("pdfs.zip", archive)]}, format='multipart'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Document.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root.name, 'documents')), [])
+    
+    @override_settings(BULK_UPLOAD_MAX_FILES=2)
+    def test_bulk_upload_limit_counts_duplicate_files(self):
+        archive = self._zip({f"copy-{i}.pdf": build_pdf(["Alpha"]) for i in range(3)})
+        
+        response = self.client.post(
+            reverse('document-bulk-upload'), {'files': [SimpleUploadedFile("pdfs.zip", archive)]}, format='multipart'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Document.objects.exists())
+    
+    @override_settings(INGESTION_WORKER_BULK_BATCH=10)
+    def test_worker_pools_embedding_requests_of_bulk_upload_jobs(self):
+        archive = self._zip({"a.pdf": build_pdf(["Alpha page"]), "b.pdf": build_pdf(["Beta page"])})
+        self.client.post(
+            reverse('document-bulk-upload'), {'files': [SimpleUploadedFile("pdfs.zip", archive)]}, format='multipart'
+        )
+        processor = MagicMock()
+        processor.iter_text_chunks.side_effect = lambda pages: list(pages)
+        processor.generate_embeddings_batch.side_effect = lambda texts: [[0.1] * 1536 for _ in texts]
+        
+        with patch('documents.text_processing.get_text_processor', return_value=processor), \
+                patch.object(run_ingestion_worker.Command, '_make_pool', return_value=InlineExecutor()):
+            call_command('run_ingestion_worker', '--once', '--metrics-port', '0', stdout=io.StringIO())
+        
+        processor.generate_embeddings_batch.assert_called_once_with(["Alpha page", "Beta page"])
+        self.assertEqual(IngestionJob.objects.filter(bulk=True, status=IngestionJob.STATUS_COMPLETED).count(), 2)
+    
+    @override_settings(BULK_INGEST_FLUSH_CHUNKS=100)
+    def test_embedding_requests_are_pooled_across_documents(self):
+        uploads = [
+            ("a.pdf", io.BytesIO(build_pdf(["Alpha page one", "Alpha page two"]))),
+            ("broken.pdf", io.BytesIO(b"%PDF-1.5 truncated")),
+            ("b.pdf", io.BytesIO(build_pdf(["Beta page one"]))),
+        ]
+        processor = MagicMock()
+        processor.iter_text_chunks.side_effect = lambda pages: list(pages)
+        processor.generate_embeddings_batch.side_effect = lambda texts: [[0.1] * 1536 for _ in texts]
+        _, jobs = create_documents(uploads, claim=True)
+        
+        results = run_bulk_ingestion(jobs, text_processor=processor, processes=1)
+        
+        processor.generate_embeddings_batch.assert_called_once_with(
+            ["Alpha page one", "Alpha page two", "Beta page one"]
+        )
+        by_file = {result.file: result for result in results}
+        self.assertEqual(by_file["a.pdf"].status, IngestionJob.STATUS_COMPLETED)
+        self.assertEqual((by_file["a.pdf"].pages, by_file["a.pdf"].chunks), (2, 2))
+        self.assertEqual(by_file["broken.pdf"].status, IngestionJob.STATUS_FAILED)
+        self.assertTrue(by_file["broken.pdf"].error)
+        self.assertEqual(TextChunk.objects.count(), 3)
+        self.assertEqual(Document.objects.get(pk=by_file["b.pdf"].document_id).extracted_text, "Beta page one")
+    
+    def test_partially_embedded_batch_only_fails_what_is_missing(self):
+        uploads = [("a.pdf", io.BytesIO(build_pdf(["Alpha"]))), ("b.pdf", io.BytesIO(build_pdf(["Beta"])))]
+        processor = MagicMock()
+        processor.iter_text_chunks.side_effect = lambda pages: list(pages)
+        processor.generate_embeddings_batch.side_effect = [
+            PartialEmbeddingError("rate limited", [[0.1] * 1536, None]),
+            RuntimeError("still rate limited"),
+        ]
+        _, jobs = create_documents(uploads, claim=True)
+        
+        results = run_bulk_ingestion(jobs, text_processor=processor, processes=1)
+        
+        self.assertEqual(
+            {result.file: result.status for result in results},
+            {"a.pdf": IngestionJob.STATUS_COMPLETED, "b.pdf": IngestionJob.STATUS_FAILED},
+        )
+        # The document left over retried only its own chunk
+        self.assertEqual(processor.generate_embeddings_batch.call_args_list[1][0][0], ["Beta"])
+    
+    @override_settings(EMBEDDING_BACKEND='fake', EMBEDDING_CACHE_ENABLED=False)
+    def test_command_ingests_a_tar_archive_on_the_process_pool(self):
+        reset_text_processor()
+        self.addCleanup(reset_text_processor)
+        archive_path = os.path.join(self.media_root.name, "pdfs.tar.gz")
+        with tarfile.open(archive_path, 'w:gz') as archive:
+            for name, text in [("one.pdf", "The first document of the archive, long enough to be kept"),
+                               ("two.pdf", "The second document of the archive, long enough to be kept")]:
+                content = build_pdf([text])
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                archive.addfile(info, io.BytesIO(content))
+        out = io.StringIO()
+        
+        call_command('bulk_ingest', archive_path, '--processes', '2', stdout=out)
+        
+        self.assertEqual(IngestionJob.objects.filter(status=IngestionJob.STATUS_COMPLETED).count(), 2)
+        self.assertEqual(TextChunk.objects.count(), 2)
+        self.assertIn("2 files ingested, 0 failed", out.getvalue())
+
+
+class UploadDeduplicationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.media_root = tempfile.TemporaryDirectory()
+        media_override = override_settings(MEDIA_ROOT=self.media_root.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(self.media_root.cleanup)
+        self.pdf = build_pdf(["Deduplicated page"])
+    
+    def _upload(self, content, name="report.pdf"):
+        return self.client.post(
+            reverse('document-list'), {'file': SimpleUploadedFile(name, content, content_type="application/pdf")},
+            format='multipart',
+        )
+    
+    def _stored_files(self):
+        return os.listdir(os.path.join(self.media_root.name, 'documents'))
+    
+    def test_duplicate_upload_returns_the_existing_document(self):
+        first = self._upload(self.pdf)
+        
+        second = self._upload(self.pdf, name="copy-of-report.pdf")
+        
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertTrue(second.data['duplicate'])
+        self.assertEqual(second.data['document']['id'], first.data['document']['id'])
+        self.assertEqual(second.data['job_id'], first.data['job_id'])
+        self.assertEqual(Document.objects.get().content_hash, hashlib.sha256(self.pdf).hexdigest())
+        self.assertEqual(IngestionJob.objects.count(), 1)
+        self.assertEqual(len(self._stored_files()), 1)
+    
+    def test_concurrent_duplicate_upload(self):
+        first = self._upload(self.pdf).data['document']['id']
+        
+        # Another request stored the same bytes between the check and the insert
+        with patch('documents.views.find_duplicate', side_effect=[(None, None), (first, None)]):
+            duplicate = self._upload(self.pdf)
+        # ...and that document was deleted again before it could be returned
+        with patch('documents.views.find_duplicate', return_value=(None, None)):
+            conflict = self._upload(self.pdf)
+        
+        self.assertEqual(duplicate.status_code, status.HTTP_200_OK)
+        self.assertEqual(duplicate.data['document']['id'], first)
+        self.assertEqual(conflict.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Document.objects.count(), 1)
+        self.assertEqual(len(self._stored_files()), 1)
+    
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=16)
+    def test_large_upload_is_spooled_to_disk_and_hashed_while_streaming(self):
+        with patch('documents.views.file_hash', wraps=file_hash) as hashed:
+            response = self._upload(self.pdf)
+        
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        upload = hashed.call_args[0][0]
+        self.assertIsInstance(upload, TemporaryUploadedFile)
+        self.assertEqual(upload.content_hash, hashlib.sha256(self.pdf).hexdigest())
+    
+    def test_update_refuses_the_file_of_another_document(self):
+        self._upload(self.pdf)
+        other = self._upload(build_pdf(["Other page"]))
+        
+        response = self.client.put(
+            reverse('document-detail', args=[other.data['document']['id']]),
+            {'file': SimpleUploadedFile("report.pdf", self.pdf)}, format='multipart',
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(len(self._stored_files()), 2)
+    
+    def test_bulk_upload_keeps_one_document_per_file_content(self):
+        existing = self._upload(self.pdf).data['document']['id']
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zipped:
+            zipped.writestr("again.pdf", self.pdf)
+            zipped.writestr("new.pdf", build_pdf(["New page"]))
+            zipped.writestr("new-copy.pdf", build_pdf(["New page"]))
+        
+        results, jobs = create_documents([("pdfs.zip", io.BytesIO(archive.getvalue()))])
+        
+        self.assertEqual([result.status for result in results], ["duplicate", "queued", "duplicate"])
+        self.assertEqual(results[0].document_id, existing)
+        self.assertEqual(results[2].document_id, results[1].document_id)
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(len(self._stored_files()), 2)
+    
+    def test_backfill_hashes_existing_documents_and_reports_duplicates(self):
+        for name in ("old.pdf", "old-copy.pdf"):
+            Document.objects.create(file=default_storage.save(f"documents/{name}", ContentFile(self.pdf)))
+        out = io.StringIO()
+        
+        call_command('backfill_content_hashes', stdout=out)
+        
+        hashes = list(Document.objects.order_by('id').values_list('content_hash', flat=True))
+        self.assertEqual(hashes, [hashlib.sha256(self.pdf).hexdigest(), None])
+        self.assertIn("Hashed 1 documents, 1 duplicates", out.getvalue())
+
+
+@override_settings(LLM_BACKEND='fake', FAKE_LLM_TOKEN_DELAY=0.05)
+class AnswerStreamTests(SimpleTestCase):
+    source_chunks = [
+        {"chunk_id": 1, "text": "Test document content.", "chunk_index": 0, "document_id": 1, "similarity": 0.9},
+        {"chunk_id": 2, "text": "More content.", "chunk_index": 1, "document_id": 1, "similarity": 0.8},
+    ]
+    context = [
+        {"chunk_id": 1, "text": "Test document content. More content.", "chunk_index": 0,
+         "last_chunk_index": 1, "document_id": 1, "similarity": 0.9}
+    ]
+    
+    def setUp(self):
+        reset_text_processor()
+    
+    def tearDown(self):
+        reset_text_processor()
+    
+    @patch('documents.text_processing.TextProcessor.abuild_context')
+    async def test_sources_arrive_before_the_answer_is_generated(self, mock_build_context):
+        mock_build_context.return_value = (self.context, self.source_chunks)
+        
+        started = time.perf_counter()
+        response = await AsyncClient().post(
+            reverse('document-answer-stream'), {'query': 'test query'}, content_type='application/json'
+        )
+        events = []
+        async for part in response.streaming_content:
+            events.append(part.decode() if isinstance(part, bytes) else part)
+            if len(events) == 1:
+                time_to_first_event = time.perf_counter() - started
+        total_time = time.perf_counter() - started
+        
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(events[0].startswith("event: sources\n"))
+        self.assertTrue(events[-1].startswith("event: done\n"))
+        tokens = [json.loads(event.split("data: ", 1)[1])["text"] for event in events if event.startswith("event: token")]
+        self.assertEqual("".join(tokens), FakeStreamingChatModel().answer)
+        # The sources are sent before the first token is generated
+        self.assertLess(time_to_first_event, 0.05)
+        self.assertGreater(total_time, 0.05 * len(tokens))
+    
+    @override_settings(FAKE_LLM_TOKEN_DELAY=0)
+    @patch('documents.text_processing.TextProcessor.build_answer_prompt', return_value="prompt")
+    @patch('documents.text_processing.TextProcessor.abuild_context')
+    async def test_streams_from_the_assembled_context(self, mock_build_context, mock_prompt):
+        mock_build_context.return_value = (self.context, self.source_chunks)
+        
+        response = await AsyncClient().post(
+            reverse('document-answer-stream'), {'query': 'test query', 'document_ids': [1]},
+            content_type='application/json'
+        )
+        events = [part.decode() if isinstance(part, bytes) else part async for part in response.streaming_content]
+        
+        mock_build_context.assert_called_once_with('test query', [1], None)
+        mock_prompt.assert_called_once_with('test query', self.context)
+        self.assertEqual(json.loads(events[0].split("data: ", 1)[1]), self.source_chunks)
+    
+    async def test_query_is_required(self):
+        response = await AsyncClient().post(reverse('document-answer-stream'), {}, content_type='application/json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(LLM_BACKEND='fake', FAKE_LLM_TOKEN_DELAY=0)
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        reset_text_processor()
+        document = Document.objects.create(file="test.pdf", extracted_text="Test")
+        self.near = TextChunk.objects.create(
+            document=document, chunk_index=0, text="Nearest chunk.", embedding=[1.0] + [0.0] * 1535
+        )
+        self.far = TextChunk.objects.create(
+            document=document, chunk_index=1, text="Farther chunk.", embedding=[0.0, 1.0] + [0.0] * 1534
+        )
+    
+    def tearDown(self):
+        reset_text_processor()
+    
+    @patch('documents.text_processing.TextProcessor.agenerate_embeddings')
+    async def test_async_search_uses_the_async_orm(self, mock_embed):
+        mock_embed.return_value = [0.9, 0.1] + [0.0] * 1534
+        
+        response = await AsyncClient().post(
+            reverse('document-search-async'), {'query': 'test query', 'limit': 2}, content_type='application/json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([hit['chunk_id'] for hit in response.json()], [self.near.id, self.far.id])
+    
+    async def test_async_search_rejects_invalid_parameters(self):
+        for params in ({'limit': -1}, {'limit': [5]}, {'ef_search': 5000}):
+            response = await AsyncClient().post(
+                reverse('document-search-async'), {'query': 'test query', **params}, content_type='application/json'
+            )
+            
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+    
+    @patch('documents.text_processing.TextProcessor.agenerate_embeddings')
+    async def test_async_search_applies_filters(self, mock_embed):
+        mock_embed.return_value = [1.0] + [0.0] * 1535
+        other = await Document.objects.acreate(file="other.pdf", extracted_text="Other", metadata={'team': 'ops'})
+        other_chunk = await TextChunk.objects.acreate(
+            document=other, chunk_index=0, text="Other chunk.", embedding=[0.5, 0.5] + [0.0] * 1534
+        )
+        
+        for filters in ({'document_ids': [other.id]}, {'metadata': {'team': 'ops'}}):
+            response = await AsyncClient().post(
+                reverse('document-search-async'), {'query': 'test query', **filters}, content_type='application/json'
+            )
+            
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([hit['chunk_id'] for hit in response.json()], [other_chunk.id])
+    
+    async def test_async_endpoints_reject_invalid_filters(self):
+        for name in ('document-search-async', 'document-answer-async', 'document-answer-stream'):
+            for params in ({'document_ids': 'all'}, {'metadata': ['team']}):
+                response = await AsyncClient().post(
+                    reverse(name), {'query': 'test query', **params}, content_type='application/json'
+                )
+                
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, (name, params))
+    
+    @patch('documents.text_processing.TextProcessor.agenerate_embeddings')
+    async def test_async_answer(self, mock_embed):
+        mock_embed.return_value = [1.0] + [0.0] * 1535
+        
+        response = await AsyncClient().post(
+            reverse('document-answer-async'), {'query': 'test query'}, content_type='application/json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['answer'], FakeStreamingChatModel().answer)
+        self.assertEqual(response.json()['source_chunks'][0]['chunk_id'], self.near.id)
+    
+    @override_settings(ASYNC_LLM_CONCURRENCY=2)
+    async def test_semaphore_bounds_concurrent_calls(self):
+        active, peak = 0, 0
+        
+        async def call():
+            nonlocal active, peak
+            async with async_semaphore('llm'):
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+        
+        await asyncio.gather(*(call() for _ in range(6)))
+        
+        self.assertEqual(peak, 2)
+
+
+class StubOpenAITests(SimpleTestCase):
+    def test_stub_serves_openai_client_requests(self):
+        server = start_stub_server(dimensions=8, embedding_latency=0, chat_latency=0)
+        try:
+            client = OpenAI(api_key="test", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1")
+            
+            embeddings = client.embeddings.create(input=["alpha", "beta"], model="stub")
+            completion = client.chat.completions.create(
+                model="stub", messages=[{"role": "user", "content": "hi"}]
+            )
+        finally:
+            server.shutdown()
+        
+        self.assertEqual([len(item.embedding) for item in embeddings.data], [8, 8])
+        self.assertTrue(completion.choices[0].message.content)
@@ -0,0 +1,111 @@
+"""
+Upload handlers that compute the SHA-256 of every uploaded file while it
+streams in, so a duplicate of an ingested file is recognized without reading
+it again. Files up to FILE_UPLOAD_MAX_MEMORY_SIZE bytes are kept in memory,
+larger ones are spooled to a temporary file chunk by chunk and moved, not
+copied, into storage.
+"""
+from django.core.files import File
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+import hashlib
+from typing import BinaryIO, Optional, Tuple
+from .models import Document, IngestionJob
+
+# Read size when hashing a file that was not uploaded through these handlers
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class HashingMixin:
+    """Hash the chunks this handler stores and set content_hash on the file it returns"""
+
+    def new_file(self, *args, **kwargs):
+        # Set before super(): the memory handler raises StopFutureHandlers when it takes the file
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        if remaining is None:  # stored by this handler, not passed on to the next one
+            self.hasher.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingMixin, TemporaryFileUploadHandler):
+    pass
+
+
+class HashingReader:
+    """Read-only file wrapper hashing what is read, e.g. an archive member being saved"""
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.hasher = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self.hasher.update(data)
+        return data
+
+    @property
+    def content_hash(self) -> str:
+        return self.hasher.hexdigest()
+
+
+def file_hash(file) -> str:
+    """
+    SHA-256 hex digest of an uploaded file: the one computed by the upload
+    handlers, or one computed by reading it in chunks.
+    """
+    content_hash: Optional[str] = getattr(file, 'content_hash', None)
+    if content_hash:
+        return content_hash
+    hasher = hashlib.sha256()
+    for chunk in file.chunks(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    file.seek(0)
+    file.content_hash = hasher.hexdigest()
+    return file.content_hash
+
+
+def save_upload(content: BinaryIO, name: str) -> Tuple[str, str]:
+    """
+    Store an uploaded file or archive member like Document.file would and
+    return (stored name, content hash). Files without a content_hash from the
+    upload handlers are hashed as they are copied.
+    """
+    file_field = Document._meta.get_field('file')
+    path = file_field.generate_filename(None, name)
+    content_hash = getattr(content, 'content_hash', None)
+    if content_hash:
+        # Spooled uploads are moved into place
+        return file_field.storage.save(path, content), content_hash
+    reader = HashingReader(content)
+    stored = file_field.storage.save(path, File(reader, name=name))
+    return stored, reader.content_hash
+
+
+def find_duplicate(content_hash: str, exclude: Optional[int] = None) -> Tuple[Optional[int], Optional[int]]:
+    """(document id, latest ingestion job id) of a document with these bytes, or (None, None)"""
+    documents = Document.objects.filter(content_hash=content_hash)
+    if exclude is not None:
+        documents = documents.exclude(pk=exclude)
+    document_id = documents.values_list('id', flat=True).first()
+    if document_id is None:
+        return None, None
+    job_id = (
+        IngestionJob.objects.filter(document_id=document_id)
+        .order_by('-created_at', '-id')
+        .values_list('id', flat=True)
+        .first()
+    )
+    return document_id, job_id
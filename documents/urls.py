@@ -1,10 +1,17 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DocumentViewSet
+from .views import (
+    DocumentViewSet, IngestionJobViewSet, PurgeJobViewSet, answer_async, answer_stream, search_async,
+)
 
 router = DefaultRouter()
 router.register(r'documents', DocumentViewSet)
+router.register(r'jobs', IngestionJobViewSet)
+router.register(r'purges', PurgeJobViewSet)
 
 urlpatterns = [
+    path('documents/search/async/', search_async, name='document-search-async'),
+    path('documents/answer/async/', answer_async, name='document-answer-async'),
+    path('documents/answer/stream/', answer_stream, name='document-answer-stream'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
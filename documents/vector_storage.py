@@ -0,0 +1,127 @@
+"""
+Storage modes of TextChunk.embedding.
+
+- vector:  float4 column (6 KB per 1536-dim row) with an HNSW index on it.
+- halfvec: float2 column, half the size of table and index, cosine search as usual.
+- binary:  float4 column without a full-precision index. An HNSW index on the
+           binary quantized embedding (1 bit per dimension) finds candidates,
+           which are rescored with the full vectors.
+
+halfvec and binary quantization need pgvector 0.7 or later. The mode in
+EMBEDDING_STORAGE must match the database; convert_embedding_storage switches
+existing rows and indexes between modes.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+import logging
+from typing import Dict, List, Tuple
+from .models import TextChunk
+
+logger = logging.getLogger(__name__)
+
+STORAGE_MODES = ('vector', 'halfvec', 'binary')
+
+HNSW_INDEX = "textchunk_embedding_hnsw"
+BIT_INDEX = "textchunk_embedding_bit_hnsw"
+
+
+def storage_mode() -> str:
+    mode = settings.EMBEDDING_STORAGE
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"EMBEDDING_STORAGE must be one of {', '.join(STORAGE_MODES)}, got {mode!r}")
+    return mode
+
+
+def dimensions() -> int:
+    return TextChunk._meta.get_field('embedding').dimensions
+
+
+def column_type(mode: str = None) -> str:
+    """SQL type of the embedding column in a storage mode, for casts in raw SQL"""
+    mode = mode or storage_mode()
+    return f"halfvec({dimensions()})" if mode == 'halfvec' else f"vector({dimensions()})"
+
+
+def bit_expression(value_sql: str) -> str:
+    """Binary quantization of a vector expression; matches the BIT_INDEX expression"""
+    return f"binary_quantize({value_sql})::bit({dimensions()})"
+
+
+def pgvector_version() -> Tuple[int, ...]:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cursor.fetchone()
+    return tuple(int(part) for part in row[0].split('.')) if row else ()
+
+
+def supports_quantization() -> bool:
+    """halfvec and binary_quantize() were added in pgvector 0.7"""
+    return pgvector_version() >= (0, 7)
+
+
+def relation_sizes() -> Dict[str, int]:
+    """On-disk bytes of the chunk table (with TOAST) and of each of its indexes"""
+    table = TextChunk._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_table_size(%s::regclass)", [table])
+        sizes = {"table": cursor.fetchone()[0]}
+        cursor.execute(
+            "SELECT indexrelid::regclass::text, pg_relation_size(indexrelid) "
+            "FROM pg_index WHERE indrelid = %s::regclass",
+            [table],
+        )
+        sizes.update({f"index:{name}": size for name, size in cursor.fetchall()})
+    return sizes
+
+
+def current_column_type() -> str:
+    """SQL type the embedding column has in the database, e.g. "vector(1536)" """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+            "WHERE attrelid = %s::regclass AND attname = 'embedding'",
+            [TextChunk._meta.db_table],
+        )
+        return cursor.fetchone()[0]
+
+
+def conversion_statements(mode: str, current_type: str) -> List[str]:
+    """DDL that turns the embedding column of current_type and its indexes into a storage mode"""
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown storage mode {mode!r}")
+    table = TextChunk._meta.db_table
+    column_sql = column_type(mode)
+    opclass = "halfvec_cosine_ops" if mode == 'halfvec' else "vector_cosine_ops"
+    # Indexes depend on the column type, so they are rebuilt after any rewrite
+    statements = [
+        f"DROP INDEX IF EXISTS {HNSW_INDEX}",
+        f"DROP INDEX IF EXISTS {BIT_INDEX}",
+    ]
+    if current_type != column_sql:
+        statements.append(
+            f"ALTER TABLE {table} ALTER COLUMN embedding TYPE {column_sql} USING embedding::{column_sql}"
+        )
+    if mode == 'binary':
+        statements.append(
+            f"CREATE INDEX {BIT_INDEX} ON {table} "
+            f"USING hnsw (({bit_expression('embedding')}) bit_hamming_ops) WITH (m = 16, ef_construction = 64)"
+        )
+    else:
+        statements.append(
+            f"CREATE INDEX {HNSW_INDEX} ON {table} "
+            f"USING hnsw (embedding {opclass}) WITH (m = 16, ef_construction = 64)"
+        )
+    return statements
+
+
+def convert_storage(mode: str):
+    """
+    Rewrite the embedding column and its index for a storage mode. The table is
+    locked for the duration, and the HNSW index is rebuilt from scratch.
+    """
+    if mode != 'vector' and not supports_quantization():
+        raise RuntimeError(f"Storage mode {mode!r} needs pgvector 0.7 or later")
+    with transaction.atomic(), connection.cursor() as cursor:
+        for statement in conversion_statements(mode, current_column_type()):
+            logger.info(f"Embedding storage conversion: {statement}")
+            cursor.execute(statement)
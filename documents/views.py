@@ -1,64 +1,109 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .models import Document, TextChunk
-from .serializers import DocumentSerializer
-import pdfplumber
-import os
-import re
+from rest_framework.reverse import reverse
+from .models import Document, TextChunk, IngestionJob, PurgeJob
+from .serializers import (
+    DocumentSerializer, DocumentSummarySerializer, IngestionJobSerializer, PurgeJobSerializer,
+    TextChunkSerializer,
+)
+from .pagination import ChunkCursorPagination
+from .ingestion import enqueue_document
+from .bulk_ingestion import STATUS_DUPLICATE, create_documents
+from .uploads import file_hash, find_duplicate, save_upload
+from .purge import delete_documents, delete_file, enqueue_purge, truncate_documents
+from .embedding_cache import cache_stats
+from .embedding_batching import batching_stats
+from .answer_cache import answer_cache_stats
+from . import extraction, metrics
+from dataclasses import asdict
+from rest_framework import serializers
+import json
 import logging
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Largest hnsw.ef_search pgvector accepts
+MAX_EF_SEARCH = 1000
+
 class DocumentViewSet(viewsets.ModelViewSet):
     queryset = Document.objects.all()
     serializer_class = DocumentSerializer
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Initialize these components only when needed
-        self.text_processor = None
-        
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # Counts are computed in SQL and the text length is stored; the text itself is never loaded
+            return (
+                queryset.defer('extracted_text')
+                .annotate(chunk_count=Count('chunks'))
+                .order_by('-uploaded_at', '-id')
+            )
+        if self.action == 'retrieve':
+            return queryset.annotate(chunk_count=Count('chunks'))
+        return queryset
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return DocumentSummarySerializer
+        return super().get_serializer_class()
+    
     def _get_text_processor(self):
-        if not self.text_processor:
-            from .text_processing import TextProcessor
-            self.text_processor = TextProcessor()
-        return self.text_processor
+        # DRF builds a viewset per request, so the processor is shared process-wide
+        from .text_processing import get_text_processor
+        return get_text_processor()
 
     def create(self, request, *args, **kwargs):
         """
-        Handles document upload and text extraction.
+        Handles document upload. PDFs are queued for background text extraction,
+        chunking and embedding; the response carries the ingestion job to poll.
+        A file with the bytes of an existing document is not stored or ingested
+        again: the response is that document (and its latest job) with
+        "duplicate": true, and the metadata sent along is ignored.
         """
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            document = serializer.save()
+            upload = serializer.validated_data['file']
+            content_hash = file_hash(upload)
+            document_id, job_id = find_duplicate(content_hash)
+            if document_id is not None:
+                return self._duplicate_response(request, document_id, job_id)
             
-            # Extract text if the document is a PDF
-            if document.file.name.endswith('.pdf'):
+            with metrics.span('upload.save'):
+                name, _ = save_upload(upload, upload.name)
                 try:
-                    logger.info(f"Extracting text from PDF: {document.file.name}")
-                    
-                    # Use the new extraction method
-                    extracted_text = self.extract_text_from_pdf(document.file.path)
-                    document.extracted_text = extracted_text
-                    document.save()
-                    
-                    # Process the document to create chunks and embeddings
-                    success = self.process_document(document)
-                    
-                    if not success:
+                    with transaction.atomic():
+                        document = serializer.save(file=name, content_hash=content_hash)
+                except IntegrityError:
+                    # The same bytes were uploaded concurrently and stored first
+                    delete_file(name)
+                    document_id, job_id = find_duplicate(content_hash)
+                    if document_id is None:
+                        # ...and deleted again before it could be returned
                         return Response(
-                            {'warning': 'Document was saved but there was an error processing it for search.'},
-                            status=status.HTTP_201_CREATED
+                            {"error": "A document with this file was uploaded and deleted concurrently, retry the upload"},
+                            status=status.HTTP_409_CONFLICT
                         )
-                    
-                except Exception as e:
-                    logger.error(f"Error extracting text from PDF: {str(e)}")
-                    return Response(
-                        {'error': f'Error extracting text: {str(e)}'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
+                    return self._duplicate_response(request, document_id, job_id)
+            
+            if document.file.name.endswith('.pdf'):
+                with metrics.span('upload.enqueue'):
+                    job = enqueue_document(document)
+                return Response(
+                    {
+                        'document': DocumentSerializer(document).data,
+                        'job_id': job.id,
+                        'status_url': reverse('ingestionjob-detail', args=[job.id], request=request),
+                    },
+                    status=status.HTTP_202_ACCEPTED
+                )
             
             return Response(
                 DocumentSerializer(document).data,
@@ -66,79 +111,216 @@ class DocumentViewSet(viewsets.ModelViewSet):
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    def extract_text_from_pdf(self, pdf_path):
+    @staticmethod
+    def _duplicate_response(request, document_id, job_id):
+        metrics.increment('upload_duplicates_total', help="Uploads answered with an existing document")
+        document = Document.objects.annotate(chunk_count=Count('chunks')).get(pk=document_id)
+        data = {'document': DocumentSerializer(document).data, 'duplicate': True}
+        if job_id is not None:
+            data['job_id'] = job_id
+            data['status_url'] = reverse('ingestionjob-detail', args=[job_id], request=request)
+        return Response(data, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_upload(self, request):
         """
-        Extract text from PDF with improved handling of layout and spacing.
+        Upload many PDFs, as several 'files' parts and/or zip and tar archives of
+        PDFs. Documents and jobs are created with bulk inserts and queued for the
+        ingestion workers; the response lists the job of every file, the
+        existing document of files that were uploaded before, and the files
+        that were skipped or could not be read.
         """
-        full_text = []
-        
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    full_text.append(page_text)
+        uploads = request.FILES.getlist('files')
+        if not uploads:
+            return Response(
+                {"error": "No files provided, send them as 'files' parts"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Join pages with clear page separators
-        joined_text = "\n\n".join(full_text)
+        try:
+            metadata = DocumentSerializer().validate_metadata(request.data.get('metadata', {}))
+            results, _ = create_documents(
+                [(upload.name, upload) for upload in uploads], metadata,
+                max_files=settings.BULK_UPLOAD_MAX_FILES,
+            )
+        except serializers.ValidationError as e:
+            return Response({"metadata": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Clean up text
-        joined_text = self.clean_text(joined_text)
+        files = []
+        for result in results:
+            entry = asdict(result)
+            if result.job_id is not None:
+                entry['status_url'] = reverse('ingestionjob-detail', args=[result.job_id], request=request)
+            files.append(entry)
+        queued = sum(result.job_id is not None for result in results)
+        duplicates = sum(result.status == STATUS_DUPLICATE for result in results)
+        return Response(
+            {"queued": queued, "duplicates": duplicates, "failed": len(results) - queued - duplicates,
+             "files": files},
+            status=status.HTTP_202_ACCEPTED if queued or duplicates else status.HTTP_400_BAD_REQUEST
+        )
+    
+    def update(self, request, *args, **kwargs):
+        """
+        Replaces the file of a document. PDFs are queued for incremental
+        re-ingestion: the new chunks are diffed against the stored ones by
+        content hash, so only changed chunks are embedded. The job reports how
+        many chunks were reused, added and removed. A file that another
+        document already has is refused with 409, and so is a PDF update while
+        the document's previous ingestion job is still queued or running.
+        """
+        document = self.get_object()
+        old_file = document.file.name
+        serializer = self.get_serializer(document, data=request.data, partial=kwargs.pop('partial', False))
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        return joined_text
+        upload = serializer.validated_data.get('file')
+        ingest = (upload.name if upload is not None else old_file).endswith('.pdf')
+        if ingest:
+            active_job = self._active_job(document)
+            if active_job is not None:
+                return self._ingesting_response(active_job, request)
+
+        name = content_hash = None
+        if upload is not None:
+            content_hash = file_hash(upload)
+            duplicate_id, _ = find_duplicate(content_hash, exclude=document.pk)
+            if duplicate_id is not None:
+                return self._conflict_response(duplicate_id)
+            name, _ = save_upload(upload, upload.name)
+        try:
+            # The job is created with the update so a concurrent re-upload that
+            # loses the race on the one-active-job constraint changes nothing
+            with transaction.atomic():
+                if upload is None:
+                    document = serializer.save()
+                else:
+                    document = serializer.save(file=name, content_hash=content_hash)
+                job = enqueue_document(document) if document.file.name.endswith('.pdf') else None
+        except IntegrityError:
+            if name is not None:
+                delete_file(name)
+            active_job = self._active_job(document)
+            if active_job is not None:
+                return self._ingesting_response(active_job, request)
+            return self._conflict_response(find_duplicate(content_hash, exclude=document.pk)[0])
+
+        if document.file.name != old_file:
+            delete_file(old_file)
+
+        if job is not None:
+            return Response(
+                {
+                    'document': DocumentSerializer(document).data,
+                    'job_id': job.id,
+                    'status_url': reverse('ingestionjob-detail', args=[job.id], request=request),
+                },
+                status=status.HTTP_202_ACCEPTED
+            )
+
+        return Response(DocumentSerializer(document).data)
+    
+    @staticmethod
+    def _conflict_response(document_id):
+        return Response(
+            {"error": f"Document {document_id} already has this file", "document_id": document_id},
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    @staticmethod
+    def _active_job(document):
+        return IngestionJob.objects.filter(
+            document=document, status__in=IngestionJob.ACTIVE_STATUSES
+        ).first()
+    
+    @staticmethod
+    def _ingesting_response(job, request):
+        return Response(
+            {
+                "error": f"Document {job.document_id} is still being ingested by job {job.id}, retry once it finishes",
+                "job_id": job.id,
+                "status_url": reverse('ingestionjob-detail', args=[job.id], request=request),
+            },
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    def perform_destroy(self, instance):
+        # Chunks are deleted in batches up front instead of by Django's cascade
+        delete_documents(Document.objects.filter(pk=instance.pk))
+    
+    @action(detail=True, methods=['get'])
+    def chunks(self, request, pk=None):
+        """
+        Lists the chunks of a document, cursor-paginated by chunk index.
+        Embeddings are not part of the response and are never loaded.
+        """
+        document = self.get_object()
+        queryset = TextChunk.objects.filter(document=document).only('id', 'document_id', 'chunk_index', 'text')
+        paginator = ChunkCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(TextChunkSerializer(page, many=True).data)
+    
+    def extract_text_from_pdf(self, pdf_path):
+        """
+        Extract text from PDF with improved handling of layout and spacing.
+        """
+        return extraction.extract_text_from_pdf(pdf_path)
     
     def clean_text(self, text):
         """Clean up extracted text to fix common PDF extraction issues"""
-        if not text:
-            return ""
-            
-        # Fix excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Fix hyphenation issues common in PDFs
-        text = text.replace(' - ', '-')
-        
-        # Fix paragraph boundaries
-        text = re.sub(r'(?<!\n)\n(?!\n)', ' ', text)  # Single newlines become spaces
-        text = re.sub(r'\n{3,}', '\n\n', text)  # Multiple newlines reduced to double
-        
-        # Clean up other common issues
-        text = re.sub(r'^\s+', '', text, flags=re.MULTILINE)  # Remove leading spaces
-        
-        return text.strip()
+        return extraction.clean_text(text)
     
-    def process_document(self, document):
+    @staticmethod
+    def _optional_positive_int(value, maximum=None):
+        """Parse an optional positive integer request parameter, at most maximum."""
+        if value is None or value == '':
+            return None
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise ValueError(f"expected a positive integer, got {value!r}")
+        value = int(value)
+        if value <= 0:
+            raise ValueError(f"expected a positive integer, got {value}")
+        if maximum is not None and value > maximum:
+            raise ValueError(f"expected at most {maximum}, got {value}")
+        return value
+    
+    @classmethod
+    def _search_params(cls, data):
         """
-        Processes the document text: splits it into chunks and generates embeddings.
+        Parse limit (default 5), ef_search and probes of a search request.
+        limit is capped like ef_search: the HNSW search is widened to return it.
         """
-        try:
-            logger.info(f"Processing document: {document.id}")
-            
-            text_processor = self._get_text_processor()
-            
-            # Split text into chunks
-            chunks = text_processor.create_text_chunks(document.extracted_text)
-            logger.info(f"Created {len(chunks)} chunks for document {document.id}")
-            
-            if not chunks:
-                logger.warning(f"No chunks created for document {document.id}")
-                return False
-            
-            # Store chunks and embeddings using the text processor
-            chunk_ids = text_processor.store_document_chunks(document, chunks)
-            logger.info(f"Stored {len(chunk_ids)} chunks and embeddings for document {document.id}")
-            
-            return len(chunk_ids) > 0
-        except Exception as e:
-            logger.error(f"Error processing document {document.id}: {str(e)}")
-            return False
+        return (
+            cls._optional_positive_int(data.get('limit'), maximum=MAX_EF_SEARCH) or 5,
+            cls._optional_positive_int(data.get('ef_search'), maximum=MAX_EF_SEARCH),
+            cls._optional_positive_int(data.get('probes')),
+        )
+    
+    @staticmethod
+    def _search_filters(data):
+        """Parse the optional document_ids (list of ids) and metadata (object) filters."""
+        document_ids = data.get('document_ids')
+        metadata = data.get('metadata')
+        if document_ids is not None:
+            if not isinstance(document_ids, list):
+                raise ValueError("document_ids must be a list of ids")
+            document_ids = [int(document_id) for document_id in document_ids]
+        if metadata is not None and not isinstance(metadata, dict):
+            raise ValueError("metadata must be an object")
+        return document_ids, metadata or None
     
     @action(detail=False, methods=['post'])
     def search(self, request):
         """
         Searches for similar chunks based on a query.
+        mode="hybrid" fuses vector and full-text results and reports stage timings.
+        document_ids and metadata (matched by containment) scope a vector search.
         """
         query = request.data.get('query')
-        limit = request.data.get('limit', 5)
+        mode = request.data.get('mode', 'vector')
         
         if not query:
             return Response(
@@ -146,13 +328,45 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        if mode not in ('vector', 'hybrid'):
+            return Response(
+                {"error": "mode must be 'vector' or 'hybrid'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Optional ANN tuning knobs: higher values trade latency for recall
+        try:
+            limit, ef_search, probes = self._search_params(request.data)
+            document_ids, metadata = self._search_filters(request.data)
+        except (TypeError, ValueError) as e:
+            return Response(
+                {"error": f"Invalid search parameter: {str(e)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if mode == 'hybrid' and (document_ids is not None or metadata):
+            return Response(
+                {"error": "document_ids and metadata filters are only supported in vector mode"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         try:
             logger.info(f"Searching for similar chunks for query: {query}")
             
             text_processor = self._get_text_processor()
             
+            if mode == 'hybrid':
+                result = text_processor.hybrid_search(
+                    query, limit, ef_search=ef_search, probes=probes
+                )
+                logger.info(f"Found {len(result['results'])} chunks with hybrid search")
+                return Response({"mode": mode, **result})
+            
             # Find similar chunks using the text processor
-            results = text_processor.find_similar_chunks(query, limit)
+            results = text_processor.find_similar_chunks(
+                query, limit, ef_search=ef_search, probes=probes,
+                document_ids=document_ids, metadata=metadata,
+            )
             logger.info(f"Found {len(results)} similar chunks")
             
             return Response(results)
@@ -164,10 +378,58 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=False, methods=['post'], url_path='search/batch')
+    def search_batch(self, request):
+        """
+        Vector search for a list of queries, embedded in one request and looked
+        up in one SQL statement. Streams one JSON line per query,
+        {"index", "query", "results"}, in the order of the queries.
+        """
+        queries = request.data.get('queries')
+        
+        if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q for q in queries):
+            return Response(
+                {"error": "queries must be a non-empty list of strings"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if len(queries) > settings.BATCH_SEARCH_MAX_QUERIES:
+            return Response(
+                {"error": f"At most {settings.BATCH_SEARCH_MAX_QUERIES} queries per batch"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            limit, ef_search, probes = self._search_params(request.data)
+        except (TypeError, ValueError) as e:
+            return Response(
+                {"error": f"Invalid search parameter: {str(e)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            logger.info(f"Batch searching {len(queries)} queries")
+            results = self._get_text_processor().batch_find_similar_chunks(
+                queries, limit, ef_search=ef_search, probes=probes
+            )
+        except Exception as e:
+            logger.error(f"Batch search error: {str(e)}")
+            return Response(
+                {"error": f"Search error: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        
+        lines = (
+            json.dumps({"index": index, "query": query, "results": hits}) + "\n"
+            for index, (query, hits) in enumerate(zip(queries, results))
+        )
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    
     @action(detail=False, methods=['post'])
     def answer(self, request):
         """
-        Answers a query based on the content of uploaded documents.
+        Answers a query based on the content of uploaded documents,
+        optionally restricted by document_ids and metadata.
         """
         query = request.data.get('query')
         
@@ -177,13 +439,21 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        try:
+            document_ids, metadata = self._search_filters(request.data)
+        except (TypeError, ValueError) as e:
+            return Response(
+                {"error": f"Invalid search parameter: {str(e)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         try:
             logger.info(f"Answering query: {query}")
             
             text_processor = self._get_text_processor()
             
             # Get the answer from the text processor
-            result = text_processor.answer_query(query)
+            result = text_processor.answer_query(query, document_ids=document_ids, metadata=metadata)
             logger.info(f"Answer found with {len(result.get('source_chunks', []))} source chunks")
             
             return Response(result)
@@ -195,17 +465,59 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
         
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        Reports how many processors and API clients this worker has built,
+        plus embedding cache, request and answer cache counters, to verify
+        reuse under load.
+        """
+        from .text_processing import processor_stats, query_embedding_cache
+        return Response({
+            "constructions": processor_stats(),
+            "embedding_cache": cache_stats(),
+            "embedding_requests": batching_stats(),
+            "answer_cache": answer_cache_stats(),
+            "query_embedding_cache": query_embedding_cache.local.stats(),
+        })
+    
     @action(detail=False, methods=['delete'])
     def clear_all(self, request):
         """
-        Clear all documents from the database.
+        Clear all documents from the database, together with their chunks and
+        uploaded files. ?mode= selects how:
+        - batched (default): batched SQL deletes within this request
+        - background: queue a purge job and return its status URL
+        - truncate: TRUNCATE the document tables, fastest but locks them briefly
         """
+        mode = request.query_params.get('mode', 'batched')
+        if mode not in ('batched', 'background', 'truncate'):
+            return Response(
+                {"error": "mode must be 'batched', 'background' or 'truncate'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         try:
-            count = Document.objects.count()
-            Document.objects.all().delete()
-            logger.info(f"Deleted all {count} documents from the database")
+            if mode == 'background':
+                job = enqueue_purge()
+                return Response(
+                    {
+                        'job_id': job.id,
+                        'status_url': reverse('purgejob-detail', args=[job.id], request=request),
+                    },
+                    status=status.HTTP_202_ACCEPTED
+                )
+            
+            counts = truncate_documents() if mode == 'truncate' else delete_documents(Document.objects.all())
+            logger.info(
+                f"Deleted all {counts['documents']} documents from the database ({mode}), "
+                f"{counts['files']} uploaded files removed"
+            )
             return Response(
-                {"message": f"Successfully deleted all {count} documents"},
+                {
+                    "message": f"Successfully deleted all {counts['documents']} documents",
+                    "deleted": counts,
+                },
                 status=status.HTTP_200_OK
             )
         except Exception as e:
@@ -213,4 +525,159 @@ class DocumentViewSet(viewsets.ModelViewSet):
             return Response(
                 {"error": f"Error clearing documents: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+
+class PurgeJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Reports the progress of background document purges.
+    """
+    queryset = PurgeJob.objects.all().order_by('-created_at')
+    serializer_class = PurgeJobSerializer
+
+
+class IngestionJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Reports the status and per-stage progress of background ingestion jobs.
+    """
+    queryset = IngestionJob.objects.all().order_by('-created_at')
+    serializer_class = IngestionJobSerializer
+
+
+def _json_body(request) -> dict:
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+@csrf_exempt
+@require_POST
+async def search_async(request):
+    """
+    Async counterpart of the search action (vector mode), served natively under
+    ASGI, with the same document_ids and metadata filters. Embedding and
+    database calls are awaited under per-dependency concurrency limits.
+    """
+    data = _json_body(request)
+    query = data.get('query')
+    
+    if not query:
+        return JsonResponse({"error": "Query is required"}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        limit, ef_search, probes = DocumentViewSet._search_params(data)
+        document_ids, metadata = DocumentViewSet._search_filters(data)
+    except (TypeError, ValueError) as e:
+        return JsonResponse(
+            {"error": f"Invalid search parameter: {str(e)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    from .text_processing import get_text_processor
+    try:
+        results = await get_text_processor().afind_similar_chunks(
+            query, limit, ef_search=ef_search, probes=probes, document_ids=document_ids, metadata=metadata,
+        )
+        return JsonResponse(results, safe=False)
+    except Exception as e:
+        logger.error(f"Search error: {str(e)}")
+        return JsonResponse(
+            {"error": f"Search error: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@csrf_exempt
+@require_POST
+async def answer_async(request):
+    """
+    Async counterpart of the answer action: retrieval and generation are
+    awaited, so an in-flight answer does not hold a worker thread.
+    Accepts the same document_ids and metadata filters.
+    """
+    data = _json_body(request)
+    query = data.get('query')
+    
+    if not query:
+        return JsonResponse({"error": "Query is required"}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        document_ids, metadata = DocumentViewSet._search_filters(data)
+    except (TypeError, ValueError) as e:
+        return JsonResponse(
+            {"error": f"Invalid search parameter: {str(e)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    from .text_processing import get_text_processor
+    result = await get_text_processor().aanswer_query(query, document_ids=document_ids, metadata=metadata)
+    logger.info(f"Answer found with {len(result.get('source_chunks', []))} source chunks")
+    return JsonResponse(result)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint with the metrics of this worker process"""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@csrf_exempt
+@require_POST
+async def answer_stream(request):
+    """
+    Streams an answer as Server-Sent Events: a "sources" event with the
+    chunks the context was assembled from, one "token" event per LLM token,
+    then "done".
+    Served natively under ASGI so a slow stream does not pin a worker thread.
+    Accepts the same document_ids and metadata filters as the answer action.
+    """
+    data = _json_body(request)
+    query = data.get('query')
+    
+    if not query:
+        return JsonResponse({"error": "Query is required"}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        document_ids, metadata = DocumentViewSet._search_filters(data)
+    except (TypeError, ValueError) as e:
+        return JsonResponse(
+            {"error": f"Invalid search parameter: {str(e)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    from .text_processing import get_text_processor
+    text_processor = get_text_processor()
+    
+    logger.info(f"Streaming answer for query: {query}")
+    try:
+        context, relevant_chunks = await text_processor.abuild_context(query, document_ids, metadata)
+    except Exception as e:
+        logger.error(f"Error answering query: {str(e)}")
+        return JsonResponse(
+            {"error": f"Error answering query: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    
+    async def events():
+        yield sse_event("sources", relevant_chunks)
+        if not relevant_chunks:
+            yield sse_event("token", {"text": "I couldn't find any relevant information to answer your query."})
+        else:
+            try:
+                async for token in text_processor.astream_answer(query, context):
+                    yield sse_event("token", {"text": token})
+            except Exception as e:
+                logger.error(f"Error streaming answer with LLM: {str(e)}")
+                yield sse_event("error", {"error": str(e)})
+        yield sse_event("done", {})
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let a reverse proxy buffer the stream
+    return response
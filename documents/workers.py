@@ -0,0 +1,56 @@
+"""
+Entry points for process pool workers.
+
+Workers are started with the "spawn" method so they never share the parent's
+database connections. A spawned process imports this module before Django is
+configured, so everything that touches models is imported lazily. Jobs return
+the metrics they recorded, which the parent merges and serves: a pool process
+has no /metrics of its own.
+"""
+import os
+from collections import Counter
+from typing import List, Tuple
+
+
+def init_django():
+    """Process pool initializer: configure Django in a freshly spawned worker"""
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+
+def run_ingestion_job(job_id: int) -> Tuple[str, tuple]:
+    """Run one ingestion job and return its final status and the metrics it recorded"""
+    from . import metrics
+    from .ingestion import run_ingestion_job as run_job
+    status = run_job(job_id).status
+    return status, metrics.drain()
+
+
+def run_bulk_ingestion(job_ids: List[int]) -> Tuple[str, tuple]:
+    """
+    Run claimed bulk upload jobs together, pooling their embedding requests,
+    and return a summary of their final statuses and the metrics recorded
+    """
+    from . import metrics
+    from .bulk_ingestion import run_bulk_ingestion as run_jobs
+    from .models import IngestionJob
+    jobs = list(IngestionJob.objects.select_related('document').filter(id__in=job_ids).order_by('created_at'))
+    # Already in a pool process: extract here instead of starting another pool
+    results = run_jobs(jobs, processes=1)
+    statuses = Counter(result.status for result in results)
+    return ", ".join(f"{count} {status}" for status, count in sorted(statuses.items())), metrics.drain()
+
+
+def run_purge_job(job_id: int) -> Tuple[str, tuple]:
+    """Run one purge job and return its final status and the metrics it recorded"""
+    from . import metrics
+    from .purge import run_purge_job as run_job
+    status = run_job(job_id).status
+    return status, metrics.drain()
+
+
+def extract_document(path: str):
+    """Extract, clean and chunk one PDF of a bulk ingestion"""
+    from .bulk_ingestion import extract_document as extract
+    return extract(path)
@@ -75,10 +75,27 @@ const DocumentUpload = () => {
         throw new Error('Upload failed');
       }
 
-      const data = await response.json();
+      let data = await response.json();
+
+      // PDFs are processed in the background: poll the ingestion job until it finishes.
+      // A file that was uploaded before comes back (200, duplicate) as the existing
+      // document and its latest job, which may still be running.
+      if (response.status === 202 || data.duplicate) {
+        if (data.status_url) {
+          const job = await waitForJob(data.status_url);
+          if (job.status === 'failed') {
+            throw new Error(job.error || 'Processing failed');
+          }
+        }
+        const documentResponse = await fetch(`http://localhost:8000/api/documents/${data.document.id}/`);
+        data = await documentResponse.json();
+      }
+
       setExtractedText(data.extracted_text);
       setDocumentId(data.id);
-      setUploadedFiles([...uploadedFiles, { id: data.id, name: file.name }]);
+      if (!uploadedFiles.some((uploaded) => uploaded.id === data.id)) {
+        setUploadedFiles([...uploadedFiles, { id: data.id, name: file.name }]);
+      }
       setFile(null);
     } catch (err) {
       setError('Failed to upload document: ' + err.message);
@@ -87,6 +104,20 @@ const DocumentUpload = () => {
     }
   };
 
+  const waitForJob = async (statusUrl) => {
+    while (true) {
+      const response = await fetch(statusUrl);
+      if (!response.ok) {
+        throw new Error('Failed to get processing status');
+      }
+      const job = await response.json();
+      if (job.status === 'completed' || job.status === 'failed') {
+        return job;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  };
+
   const handleQueryChange = (event) => {
     setQuery(event.target.value);
   };